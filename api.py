@@ -1,12 +1,78 @@
 # api.py
-from flask import Blueprint, jsonify
+import asyncio
+import queue
+from flask import Blueprint, jsonify, abort, current_app, send_file, Response, stream_with_context
 from flask import Flask, render_template, url_for, request, redirect
-from Moviweb_app.models.data_models import db
-from data_manager.sqlite_data_manager import SQLiteDataManager
+from library_import import parse_titles, parse_csv, import_titles_async
+from library_export import EXPORT_KINDS, EXPORT_FORMATS, export_rows, encode_rows, gzip_chunks, export_filename
+from http_utils import conditional_json, conditional_json_async
+from page_cache import page_cache
+from poster_cache import poster_cache
+from services import data_manager, async_data_manager, movie_jobs
 
 api = Blueprint('api', __name__)
 
-data_manager = SQLiteDataManager(db)
+
+PAGE_SIZE = 48
+MAX_PAGE_SIZE = 500
+RECOMMENDATION_LIMIT = 12
+MAX_RECOMMENDATION_LIMIT = 100
+MAX_BATCH_OPERATIONS = 5000
+# Poster files are content-addressed and never change, browsers may keep them for a year.
+POSTER_MAX_AGE = 365 * 24 * 3600
+
+
+def _row_id(row, key):
+    """
+    Read an id from either a JSON dictionary or a SQLAlchemy model.
+    """
+    return row[key] if isinstance(row, dict) else getattr(row, key)
+
+
+def _page_args():
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    return request.args.get('after', type=int), request.args.get('before', type=int), limit
+
+
+def _page(rows, key, after, before, limit):
+    """
+    Cut the extra row off a page and build the next/prev cursors.
+    """
+    rows = rows or []
+    has_more = len(rows) > limit
+    if before is not None:
+        rows = rows[-limit:]
+        has_prev, has_next = has_more, True
+    else:
+        rows = rows[:limit]
+        has_prev, has_next = after is not None, has_more
+
+    page = {
+        "limit": limit,
+        "next_after": _row_id(rows[-1], key) if rows and has_next else None,
+        "prev_before": _row_id(rows[0], key) if rows and has_prev else None,
+    }
+    return rows, page
+
+
+def paginate(fetch, key):
+    """
+    Fetch one keyset page using the '?after=<id>&limit=N' (or '?before=<id>') query arguments.
+    One extra row is requested to know whether another page exists.
+    :param fetch: callable taking after, before and limit keyword arguments.
+    :param key: name of the id the pages are keyed on.
+    :return: the rows of the page and a dictionary with the next/prev cursors.
+    """
+    after, before, limit = _page_args()
+    return _page(fetch(after=after, before=before, limit=limit + 1), key, after, before, limit)
+
+
+async def paginate_async(fetch, key):
+    """
+    paginate for async views, fetch being a coroutine function.
+    """
+    after, before, limit = _page_args()
+    return _page(await fetch(after=after, before=before, limit=limit + 1), key, after, before, limit)
 
 
 @api.route('/users', methods=['GET'])
@@ -14,8 +80,10 @@ def list_users():
     """
     Handle requests to the '/users' route and render the 'users.html' template
     """
-    users = data_manager.get_all_users()
-    return render_template("users.html", users=users)
+    def render():
+        users, page = paginate(data_manager.get_all_users, 'id')
+        return render_template("users.html", users=users, page=page)
+    return page_cache.get_or_render("users", data_manager.get_data_version(), request.full_path, render)
 
 
 @api.route('/users/<int:user_id>')
@@ -23,9 +91,40 @@ def get_user_movies(user_id):
     """
     Retrieve and display a list of movies for a specific user.
     """
-    user_movie = data_manager.get_user_movie(user_id)
-    user_name = data_manager.get_user_name(user_id)
-    return render_template('user_movies.html', user_movie=user_movie, user_name=user_name, user_id=user_id)
+    def render():
+        library = {}
+
+        def fetch(**cursor):
+            library['user_name'], movies = data_manager.get_user_library(user_id, **cursor)
+            return movies
+
+        user_movie, page = paginate(fetch, 'movie_id')
+        user_name = library['user_name']
+        return render_template('user_movies.html', user_movie=user_movie, user_name=user_name, user_id=user_id,
+                               page=page, job=job)
+
+    if 'job' in request.args:
+        # The pending placeholder card is specific to this request, never cache it.
+        job = movie_jobs.get(request.args.get('job', type=int))
+        return render()
+    job = None
+    return page_cache.get_or_render(f"user:{user_id}", data_manager.get_data_version(user_id),
+                                    request.full_path, render)
+
+
+@api.route('/users/<int:user_id>/stats')
+def user_stats(user_id):
+    """
+    Show a user's statistics, read from the incrementally maintained aggregates.
+    """
+    def render():
+        user_name = data_manager.get_user_name(user_id)
+        stats = data_manager.get_user_stats(user_id)
+        if user_name is None or stats is None:
+            abort(404)
+        return render_template('user_stats.html', user_id=user_id, user_name=user_name, stats=stats)
+    return page_cache.get_or_render(f"user:{user_id}", data_manager.get_data_version(user_id),
+                                    request.full_path, render)
 
 
 @api.route('/users/add_movie/<int:user_id>', methods=['GET', 'POST'])
@@ -35,10 +134,275 @@ def add_movie(user_id):
     """
     if request.method == 'POST':
         movie = request.form.get('movie')
-        movie_data = data_manager.movies_api(movie)
-        if movie_data is None:
-            return redirect('404.html')
-        else:
-            data_manager.add_movie_for_user(user_id, movie_data)
-            return redirect(url_for('api.get_user_movies', user_id=user_id, movie_data=movie_data))
+        try:
+            job = movie_jobs.submit(user_id, movie, app=current_app._get_current_object())
+        except queue.Full:
+            abort(503, "Too many movies are being added right now, please try again in a moment.")
+        return redirect(url_for('api.get_user_movies', user_id=user_id, job=job['id']))
     return render_template('add_movie.html', user_id=user_id)
+
+
+@api.route('/users/import_movies/<int:user_id>', methods=['GET', 'POST'])
+async def import_movies(user_id):
+    """
+    Import many movies at once, from a list of titles or an uploaded CSV export.
+    """
+    if request.method == 'POST':
+        titles = parse_titles(request.form.get('titles', ''))
+        upload = request.files.get('csv_file')
+        if upload and upload.filename:
+            titles += parse_csv(upload.read().decode('utf-8-sig', errors='replace'))
+        report = await import_titles_async(async_data_manager, user_id, titles)
+        return render_template('import_movies.html', user_id=user_id, report=report)
+    return render_template('import_movies.html', user_id=user_id, report=None)
+
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def _search_args():
+    """
+    Read the '?q=...&user_id=N&limit=N' search arguments.
+    """
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    return request.args.get('q', '').strip(), request.args.get('user_id', type=int), limit
+
+
+@api.route('/search')
+def search():
+    """
+    Search movie titles, directors and reviews, site-wide or within one user's library.
+    """
+    query, user_id, limit = _search_args()
+    results = data_manager.search(query, user_id=user_id, limit=limit) if query else []
+    return render_template('search.html', query=query, user_id=user_id, results=results)
+
+
+@api.app_template_global()
+def poster_url(movie, size='medium'):
+    """
+    Return the URL of a movie's poster at a thumbnail size: our own copy once it is cached,
+    the remote URL until the backfill ran, None without a poster.
+    """
+    if movie.get('poster_hash'):
+        return url_for('api.poster', digest=movie['poster_hash'], size=size)
+    poster = movie.get('poster')
+    return poster if poster and str(poster).startswith(('http://', 'https://')) else None
+
+
+@api.route('/posters/<digest>/<size>')
+def poster(digest, size):
+    """
+    Serve a cached poster or one of its thumbnails, with a strong ETag and immutable caching.
+    """
+    found = poster_cache.file_for(digest, size)
+    if found is None:
+        abort(404)
+    path, mimetype = found
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=f"{digest}-{size}",
+                         max_age=POSTER_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@api.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """
+    Return the status of a queued movie addition as JSON, polled by the user's movie page.
+    """
+    job = movie_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
+def _to_dict(row):
+    """
+    Serialize a JSON dictionary or a SQLAlchemy model; users are listed without their movies.
+    """
+    if isinstance(row, dict):
+        return {key: value for key, value in row.items() if key != 'movies'}
+    return row.to_dict()
+
+
+@api.route('/v1/users')
+def users_json():
+    """
+    Return one page of users as JSON.
+    """
+    def build():
+        users, page = paginate(data_manager.get_all_users, 'id')
+        return {"users": [_to_dict(user) for user in users], **page}
+    return conditional_json(data_manager.get_data_version(), build)
+
+
+@api.route('/v1/search')
+def search_json():
+    """
+    Return ranked search results as JSON, the snippets contain <mark> tags around the matches.
+    """
+    query, user_id, limit = _search_args()
+    results = data_manager.search(query, user_id=user_id, limit=limit) if query else []
+    return jsonify({"query": query, "user_id": user_id,
+                    "results": [{**result, "snippet": str(result["snippet"])} for result in results]})
+
+
+@api.route('/v1/users/<int:user_id>/movies')
+async def user_movies_json(user_id):
+    """
+    Return one page of a user's movies as JSON.
+    """
+    async def build():
+        user_name, (movies, page) = await asyncio.gather(
+            async_data_manager.get_user_name(user_id),
+            paginate_async(lambda **cursor: async_data_manager.get_user_movie(user_id, **cursor), 'movie_id'))
+        if user_name is None:
+            abort(404)
+        return {"user": {"id": user_id, "name": user_name}, "movies": [_to_dict(movie) for movie in movies], **page}
+    return await conditional_json_async(await async_data_manager.get_data_version(user_id), build)
+
+
+@api.route('/v1/users/<int:user_id>/stats')
+async def user_stats_json(user_id):
+    """
+    Return a user's statistics as JSON.
+    """
+    async def build():
+        stats, user_name = await asyncio.gather(async_data_manager.get_user_stats(user_id),
+                                                async_data_manager.get_user_name(user_id))
+        if stats is None or user_name is None:
+            abort(404)
+        return stats
+    return await conditional_json_async(await async_data_manager.get_data_version(user_id), build)
+
+
+@api.route('/v1/users/<int:user_id>/movies/<int:movie_id>')
+def movie_json(user_id, movie_id):
+    """
+    Return a single movie of a user as JSON.
+    """
+    def build():
+        movie = data_manager.get_movie_by_id(user_id, movie_id)
+        if movie is None:
+            abort(404)
+        return _to_dict(movie)
+    return conditional_json(data_manager.get_data_version(user_id), build)
+
+
+@api.route('/v1/users/<int:user_id>/movies/<int:movie_id>/reviews')
+def reviews_json(user_id, movie_id):
+    """
+    Return the reviews of a user's movie as JSON.
+    """
+    def build():
+        reviews = data_manager.get_reviews(user_id, movie_id) or []
+        return {"reviews": [_to_dict(review) for review in reviews]}
+    return conditional_json(data_manager.get_data_version(user_id), build)
+
+
+@api.route('/v1/users/<int:user_id>/batch', methods=['POST'])
+def batch_json(user_id):
+    """
+    Apply a list of changes to a user's library atomically, e.g.
+    {"operations": [{"op": "delete_movie", "movie_id": 3}, {"op": "update_rating", "movie_id": 4, "rating": 8}]}.
+    See data_manager.batch for every operation. Nothing is changed when any operation is invalid.
+    """
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({"error": "Expected a JSON object with an 'operations' list."}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch."}), 400
+    if data_manager.get_user_name(user_id) is None:
+        abort(404)
+    try:
+        counts = data_manager.apply_batch(user_id, operations)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    if counts is None:
+        abort(500)
+    return jsonify({"user_id": user_id, "applied": counts,
+                    "version": data_manager.get_data_version(user_id)})
+
+
+async def _recommendations_version(user_id):
+    """
+    Recommendations change with the user's library and with everyone else's, through the neighbour lists.
+    """
+    user_version, lists_version = await asyncio.gather(
+        async_data_manager.get_data_version(user_id),
+        async_data_manager.get_data_version(scope="recommendations"))
+    if user_version is None or lists_version is None:
+        return None
+    return f"{user_version}.{lists_version}"
+
+
+def _recommendation_limit():
+    return max(1, min(request.args.get('limit', RECOMMENDATION_LIMIT, type=int), MAX_RECOMMENDATION_LIMIT))
+
+
+@api.route('/v1/users/<int:user_id>/recommendations')
+async def recommendations_json(user_id):
+    """
+    Return the movies saved by users who saved the same movies as this user, best first, as JSON.
+    """
+    limit = _recommendation_limit()
+
+    async def build():
+        user_name, recommended = await asyncio.gather(async_data_manager.get_user_name(user_id),
+                                                      async_data_manager.get_recommendations(user_id, limit=limit))
+        if user_name is None:
+            abort(404)
+        return {"user_id": user_id, "recommendations": recommended}
+    return await conditional_json_async(await _recommendations_version(user_id), build)
+
+
+@api.route('/v1/users/<int:user_id>/movies/<int:movie_id>/similar')
+async def similar_movies_json(user_id, movie_id):
+    """
+    Return the movies most often saved together with one of the user's movies, as JSON.
+    """
+    limit = _recommendation_limit()
+
+    async def build():
+        similar = await async_data_manager.get_similar_movies(user_id, movie_id, limit=limit)
+        if similar is None:
+            abort(404)
+        return {"user_id": user_id, "movie_id": movie_id, "similar": similar}
+    return await conditional_json_async(await _recommendations_version(user_id), build)
+
+
+def _export_response(kind, fmt, user_id=None):
+    """
+    Stream an export with chunked transfer encoding, gzip-compressed on the fly when the client accepts it.
+    """
+    chunks = encode_rows(export_rows(data_manager, kind, user_id), EXPORT_KINDS[kind], fmt)
+    compress = bool(request.accept_encodings['gzip'])
+    if compress:
+        chunks = gzip_chunks(chunks)
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt, user_id)}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@api.route('/v1/export/<any(movies, reviews):kind>.<any(ndjson, csv):fmt>')
+def export_all(kind, fmt):
+    """
+    Stream the movies or reviews of every user as NDJSON or CSV.
+    """
+    return _export_response(kind, fmt)
+
+
+@api.route('/v1/users/<int:user_id>/export/<any(movies, reviews):kind>.<any(ndjson, csv):fmt>')
+def export_user(user_id, kind, fmt):
+    """
+    Stream a user's movies or reviews as NDJSON or CSV.
+    """
+    if data_manager.get_user_name(user_id) is None:
+        abort(404)
+    return _export_response(kind, fmt, user_id)
@@ -0,0 +1,136 @@
+"""
+Compare blocking handlers on one thread per in-flight request with coroutines on one event loop, for a
+request that needs a user's name, a page of their movies, their stats and three OMDb lookups (against the
+local stub, with a simulated upstream latency).
+
+The blocking handler makes the calls one after the other, like the sync views; the async one awaits them
+all at once through AsyncDataManager and OMDbClient.lookup_many. Each mode runs in its own process so its
+peak memory can be told apart, and is reported as requests/s, mean latency and peak RSS growth per
+in-flight request.
+
+Usage: python -m benchmarks.async_benchmark [concurrency ...] [--requests N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+
+from Moviweb_app.models.data_models import db
+from data_manager.async_data_manager import AsyncDataManager
+from data_manager.omdb_client import OMDbClient
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from benchmarks.dataset import iter_users, make_sqlite_app, load_sqlite
+from omdb_stub import start_stub
+
+MOVIES = 100_000
+LOOKUPS = 3
+PAGE = 48
+
+
+def peak_rss_kib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_sync(app, data_manager, client, users, concurrency, requests):
+    tickets = iter(range(requests))
+    lock = threading.Lock()
+    latencies = []
+
+    def handle():
+        while True:
+            with lock:
+                number = next(tickets, None)
+            if number is None:
+                return
+            user_id = users[number % len(users)]
+            started = time.perf_counter()
+            with app.app_context():
+                data_manager.get_user_name(user_id)
+                data_manager.get_user_movie(user_id, limit=PAGE)
+                data_manager.get_user_stats(user_id)
+            for offset in range(LOOKUPS):
+                client.lookup(f"sync title {number * LOOKUPS + offset}")
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=handle) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run_async(app, data_manager, client, users, concurrency, requests):
+    async_manager = AsyncDataManager(data_manager, app=app)
+    latencies = []
+
+    async def handle(number):
+        user_id = users[number % len(users)]
+        started = time.perf_counter()
+        await asyncio.gather(
+            async_manager.get_user_name(user_id),
+            async_manager.get_user_movie(user_id, limit=PAGE),
+            async_manager.get_user_stats(user_id),
+            client.lookup_many([f"async title {number * LOOKUPS + offset}" for offset in range(LOOKUPS)]))
+        latencies.append(time.perf_counter() - started)
+
+    async def main():
+        # At most `concurrency` requests in flight, like the threads of the sync mode.
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(number):
+            async with slots:
+                await handle(number)
+        await asyncio.gather(*(limited(number) for number in range(requests)))
+
+    asyncio.run(main())
+    return latencies
+
+
+def measure(mode, db_path, base_url, concurrency, requests, results):
+    app = make_sqlite_app(db_path)
+    data_manager = SQLiteDataManager(db)
+    client = OMDbClient(base_url=base_url, cache_path=None, pool_size=min(concurrency * LOOKUPS, 64))
+    with app.app_context():
+        users = [user.id for user in data_manager.get_all_users(limit=1000)]
+    baseline = peak_rss_kib()
+    started = time.perf_counter()
+    latencies = (run_sync if mode == "sync" else run_async)(app, data_manager, client, users, concurrency, requests)
+    elapsed = time.perf_counter() - started
+    results.put({"rps": len(latencies) / elapsed, "latency_ms": sum(latencies) / len(latencies) * 1000,
+                 "kib_per_request": (peak_rss_kib() - baseline) / concurrency})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("concurrency", nargs="*", type=int, default=[1, 10, 100, 500])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated OMDb latency in seconds.")
+    args = parser.parse_args()
+
+    server, base_url = start_stub(delay=args.latency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.sqlite3")
+        load_sqlite(make_sqlite_app(db_path), iter_users(MOVIES))
+        print(f"{MOVIES} movies, {args.requests} requests, {LOOKUPS} OMDb lookups of {args.latency * 1000:.0f} ms each")
+        print(f"{'in flight':>10} {'mode':>6} {'req/s':>9} {'mean ms':>9} {'KiB/request':>12}")
+        for concurrency in args.concurrency:
+            for mode in ("sync", "async"):
+                results = multiprocessing.Queue()
+                process = multiprocessing.Process(target=measure, args=(mode, db_path, base_url, concurrency,
+                                                                        args.requests, results))
+                process.start()
+                result = results.get()
+                process.join()
+                print(f"{concurrency:>10} {mode:>6} {result['rps']:>9.1f} {result['latency_ms']:>9.1f} "
+                      f"{result['kib_per_request']:>12.1f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare cleaning up a library one call at a time with one batch: deleting movies and changing ratings,
+on SQLite (one transaction and one set-based statement per run instead of one commit per movie) and on
+the JSON file (one write instead of one rewrite per movie).
+
+Each measurement uses its own user with the same library, among other users so the files have a
+realistic size.
+
+Usage: python -m benchmarks.batch_benchmark [changes] [library size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from Moviweb_app.models.data_models import db, User
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from benchmarks.dataset import iter_users, write_json, make_sqlite_app
+
+BACKGROUND_MOVIES = 10_000
+
+
+def library(size):
+    return [{"title": f"Batch Movie {number}", "director": f"Director {number % 40}",
+             "year": str(1950 + number % 70), "rating": "6.0", "poster": "N/A", "imdb_id": f"tb{number:07d}"}
+            for number in range(size)]
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(data_manager, user_ids, changes):
+    """
+    Time one-by-one calls on the first user and batches on the second.
+    :return: dictionary of operation -> (one-by-one ms, batch ms).
+    """
+    one_by_one, batched = ([movie if isinstance(movie, dict) else movie.to_dict()
+                            for movie in data_manager.get_user_movie(user_id)] for user_id in user_ids)
+    rated, rated_batch = one_by_one[changes:2 * changes], batched[changes:2 * changes]
+    return {"update_rating": (
+        timed(lambda: [data_manager.update_movie(user_ids[0], movie["movie_id"], movie["title"], movie["director"],
+                                                 movie["year"], "8.0") for movie in rated]),
+        timed(lambda: data_manager.update_ratings(user_ids[1], {movie["movie_id"]: "8.0" for movie in rated_batch}))
+    ), "delete_movie": (
+        timed(lambda: [data_manager.delete_movie(user_ids[0], movie["movie_id"]) for movie in one_by_one[:changes]]),
+        timed(lambda: data_manager.delete_movies(user_ids[1], [movie["movie_id"] for movie in batched[:changes]]))
+    )}
+
+
+def run_sqlite(tmp_dir, changes, size):
+    app = make_sqlite_app(os.path.join(tmp_dir, "batch.sqlite3"))
+    data_manager = SQLiteDataManager(db)
+    with app.app_context():
+        data_manager.import_users([{**user, "reviews": []} for user in iter_users(BACKGROUND_MOVIES)])
+        user_ids = []
+        for name in ("one by one", "batch"):
+            user = User(name=name)
+            data_manager.add_user(user)
+            user_ids.append(user.id)
+            data_manager.add_movies_for_user(user.id, library(size))
+        return measure(data_manager, user_ids, changes)
+
+
+def run_json(tmp_dir, changes, size):
+    path = os.path.join(tmp_dir, "batch.json")
+    write_json(path, iter_users(BACKGROUND_MOVIES))
+    data_manager = JSONDataManager(path)
+    user_ids = []
+    for name in ("one by one", "batch"):
+        user = data_manager.create_user_details(data_manager.generate_user_id(data_manager.get_all_users()), name)
+        data_manager.add_user(user)
+        user_ids.append(user["id"])
+        data_manager.add_movies_for_user(user["id"], library(size))
+    return measure(data_manager, user_ids, changes)
+
+
+def main():
+    changes = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"{changes} changes in a library of {size} movies, {BACKGROUND_MOVIES} movies in other libraries")
+    print(f"{'backend':>8} {'operation':>14} {'one by one ms':>14} {'batch ms':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend, run in (("sqlite", run_sqlite), ("json", run_json)):
+            for operation, (single, batch) in run(tmp_dir, changes, size).items():
+                print(f"{backend:>8} {operation:>14} {single:>14.1f} {batch:>10.1f} {single / batch:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure the storage saved by moving the movie metadata to the shared catalog (schema version 5).
+
+Builds a database in the original schema from the synthetic dataset, migrates it to version 4,
+measures it, runs the catalog migration and measures it again. Sizes come from the dbstat
+virtual table after a VACUUM, indexes and FTS shadow tables are counted with their table.
+
+Usage:
+    python -m benchmarks.catalog_storage_report --movies 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from Moviweb_app.models.migrations import upgrade
+from benchmarks.dataset import iter_users
+
+ORIGINAL_SCHEMA = """
+    CREATE TABLE "User" (id INTEGER NOT NULL, name VARCHAR, PRIMARY KEY (id));
+    CREATE TABLE "Movie" (
+        movie_id INTEGER NOT NULL, title VARCHAR, year VARCHAR, rating FLOAT, director VARCHAR,
+        poster VARCHAR, user_id INTEGER NOT NULL,
+        PRIMARY KEY (movie_id), FOREIGN KEY(user_id) REFERENCES "User" (id)
+    );
+    CREATE TABLE "Review" (
+        review_id INTEGER NOT NULL, movie_id INTEGER NOT NULL, user_id INTEGER NOT NULL, review VARCHAR,
+        PRIMARY KEY (review_id),
+        FOREIGN KEY(movie_id) REFERENCES "Movie" (movie_id), FOREIGN KEY(user_id) REFERENCES "User" (id)
+    );
+"""
+
+
+def load_original(connection, users):
+    connection.executescript(ORIGINAL_SCHEMA)
+    for user in users:
+        connection.execute('INSERT INTO "User" (id, name) VALUES (?, ?)', (user["id"], user["name"]))
+        connection.executemany(
+            'INSERT INTO "Movie" (movie_id, title, year, rating, director, poster, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(movie["movie_id"], movie["title"], movie["year"], float(movie["rating"]), movie["director"],
+              movie["poster"], user["id"]) for movie in user["movies"]]
+        )
+        connection.executemany(
+            'INSERT INTO "Review" (review_id, movie_id, user_id, review) VALUES (?, ?, ?, ?)',
+            [(review["review_id"], review["movie_id"], review["user_id"], review["review"])
+             for review in user["reviews"]]
+        )
+    connection.commit()
+
+
+def measure(connection):
+    """
+    Return the total size in bytes and the size per table, indexes and FTS shadow tables included.
+    """
+    connection.execute("VACUUM")
+    owners = dict(connection.execute("SELECT name, tbl_name FROM sqlite_master"))
+    sizes = {}
+    for name, size in connection.execute("SELECT name, sum(pgsize) FROM dbstat GROUP BY name"):
+        owner = owners.get(name, name)
+        for fts in ("movie_fts", "review_fts"):
+            if owner.startswith(fts + "_"):
+                owner = fts
+        sizes[owner] = sizes.get(owner, 0) + size
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count, sizes
+
+
+def count(connection, table):
+    return connection.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--movies", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection = sqlite3.connect(os.path.join(tmp_dir, "catalog.sqlite3"))
+        load_original(connection, iter_users(args.movies, seed=args.seed))
+        upgrade(connection, target=4)
+        before_total, before = measure(connection)
+        movies = count(connection, "Movie")
+
+        started = time.perf_counter()
+        upgrade(connection)
+        migration_seconds = time.perf_counter() - started
+        after_total, after = measure(connection)
+        catalog = count(connection, "CatalogMovie")
+        connection.close()
+
+    print(f"{movies} movies, {catalog} distinct catalog entries "
+          f"({movies / max(catalog, 1):.1f} copies per movie on average), migrated in {migration_seconds:.1f} s")
+    print(f"{'table':<14} {'before':>12} {'after':>12}")
+    for table in sorted(before.keys() | after.keys()):
+        print(f"{table:<14} {before.get(table, 0) / 2 ** 20:>10.1f}MB {after.get(table, 0) / 2 ** 20:>10.1f}MB")
+    saved = before_total - after_total
+    print(f"{'total':<14} {before_total / 2 ** 20:>10.1f}MB {after_total / 2 ** 20:>10.1f}MB  "
+          f"saved {saved / 2 ** 20:.1f}MB ({100 * saved / before_total:.0f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Time every data-manager operation on JSONDataManager and SQLiteDataManager at several dataset sizes.
+
+Reports p50/p99 latency and peak traced memory per operation, saves the results as JSON and can
+compare them against a stored baseline, exiting with status 1 on a regression.
+
+Usage:
+    python -m benchmarks.data_manager_benchmark --sizes 1000 100000 1000000 --output results.json
+    python -m benchmarks.data_manager_benchmark --sizes 1000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from Moviweb_app.models.data_models import db
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from benchmarks.dataset import iter_users, write_json, make_sqlite_app, load_sqlite
+
+NEW_MOVIE = {"title": "Benchmark Movie", "director": "Someone", "year": "2001", "rating": "7.5", "poster": "N/A"}
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def build_operations(data_manager, samples, first_new_user_id):
+    """
+    Return (name, callable) pairs. Each callable runs the operation once on the next sample,
+    so write operations touch a different row every time.
+    """
+    read_samples = samples[:len(samples) // 2]
+    delete_samples = samples[len(samples) // 2:]
+    cycle = {"read": 0, "delete": 0, "user": first_new_user_id, "deleted_user": first_new_user_id}
+
+    def next_read():
+        cycle["read"] += 1
+        return read_samples[cycle["read"] % len(read_samples)]
+
+    def add_user():
+        data_manager.add_user(data_manager.create_user_details(cycle["user"], "Benchmark User"))
+        cycle["user"] += 1
+
+    def delete_user():
+        if cycle["deleted_user"] < cycle["user"]:
+            data_manager.delete_user(cycle["deleted_user"])
+            cycle["deleted_user"] += 1
+
+    def delete_movie():
+        if cycle["delete"] < len(delete_samples):
+            data_manager.delete_movie(*delete_samples[cycle["delete"]])
+            cycle["delete"] += 1
+
+    operations = [
+        ("get_all_users", lambda: data_manager.get_all_users()),
+        ("get_all_users_page", lambda: data_manager.get_all_users(after=next_read()[0], limit=50)),
+        ("get_user_movie", lambda: data_manager.get_user_movie(next_read()[0])),
+        ("get_user_movie_page", lambda: data_manager.get_user_movie(next_read()[0], limit=48)),
+        ("get_user_name", lambda: data_manager.get_user_name(next_read()[0])),
+        ("get_movie_by_id", lambda: data_manager.get_movie_by_id(*next_read())),
+        ("get_data_version", lambda: data_manager.get_data_version(next_read()[0])),
+        ("get_user_stats", lambda: data_manager.get_user_stats(next_read()[0])),
+        ("search", lambda: data_manager.search(str(next_read()[1] % 1000))),
+        ("search_user", lambda: data_manager.search(str(next_read()[1] % 1000), user_id=next_read()[0])),
+        ("get_recommendations", lambda: data_manager.get_recommendations(next_read()[0])),
+        ("get_similar_movies", lambda: data_manager.get_similar_movies(*next_read())),
+        ("add_user", add_user),
+        ("update_user", lambda: data_manager.update_user(next_read()[0], "Renamed User")),
+        ("delete_user", delete_user),
+        ("add_movie_for_user", lambda: data_manager.add_movie_for_user(next_read()[0], NEW_MOVIE)),
+        ("update_movie", lambda: data_manager.update_movie(*next_read(), "Renamed", "Someone", "2002", "8.0")),
+        ("delete_movie", delete_movie),
+    ]
+    if hasattr(data_manager, "refresh_recommendations"):
+        # One queued movie per run, the writes above queued the movies they touched.
+        operations.append(("refresh_recommendations", lambda: data_manager.refresh_recommendations(limit=1)))
+    if hasattr(data_manager, "add_review"):
+        operations += [
+            ("add_review", lambda: data_manager.add_review(*next_read(), "Benchmark review")),
+            ("get_reviews", lambda: data_manager.get_reviews(*next_read())),
+        ]
+    return operations
+
+
+def measure(operation, iterations, budget, after_each):
+    """
+    Run an operation up to `iterations` times or until `budget` seconds are spent (at least 3 runs).
+    :return: p50 and p99 in milliseconds, peak traced memory in KiB and the number of runs.
+    """
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < iterations and (len(timings) < 3 or time.perf_counter() - started < budget):
+        begin = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - begin)
+        after_each()
+
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    after_each()
+    return {
+        "p50_ms": statistics.median(timings) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+        "iterations": len(timings),
+    }
+
+
+def run_backend(backend, size, tmp_dir, iterations, budget, seed):
+    samples = []
+    users = iter_users(size, seed=seed, samples=samples)
+    if backend == "json":
+        path = os.path.join(tmp_dir, f"data_{size}.json")
+        write_json(path, users)
+        data_manager = JSONDataManager(path, journal=True)
+        context = None
+        after_each = lambda: None
+    else:
+        path = os.path.join(tmp_dir, f"data_{size}.sqlite3")
+        app = make_sqlite_app(path)
+        load_sqlite(app, users)
+        data_manager = SQLiteDataManager(db)
+        context = app.app_context()
+        context.push()
+        started = time.perf_counter()
+        written = data_manager.rebuild_recommendations()
+        print(f"{backend:>6} {size:>9} rebuild_recommendations {time.perf_counter() - started:.2f} s "
+              f"({written} neighbours)")
+        # Start every run from an empty identity map, like a fresh request would.
+        after_each = db.session.remove
+
+    random.Random(seed).shuffle(samples)
+    first_new_user_id = max(user_id for user_id, _ in samples) + 1_000_000
+    results = []
+    try:
+        data_manager.get_all_users()
+        for name, operation in build_operations(data_manager, samples, first_new_user_id):
+            result = measure(operation, iterations, budget, after_each)
+            results.append({"backend": backend, "size": size, "operation": name, **result})
+            print(f"{backend:>6} {size:>9} {name:<22} p50 {result['p50_ms']:>10.3f} ms  "
+                  f"p99 {result['p99_ms']:>10.3f} ms  peak {result['peak_kib']:>10.1f} KiB  "
+                  f"({result['iterations']} runs)")
+    finally:
+        if context is not None:
+            context.pop()
+    return results
+
+
+def compare(results, baseline, tolerance, noise_ms=0.25):
+    """
+    Return the operations whose p50 got slower than the baseline by more than `tolerance`.
+    """
+    previous = {(row["backend"], row["size"], row["operation"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get((row["backend"], row["size"], row["operation"]))
+        if old and row["p50_ms"] > old["p50_ms"] * (1 + tolerance) and row["p50_ms"] - old["p50_ms"] > noise_ms:
+            regressions.append({**row, "baseline_p50_ms": old["p50_ms"]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["json", "sqlite"], choices=["json", "sqlite"])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds spent at most per operation")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown, 0.25 = 25%%")
+    parser.add_argument("--noise-ms", type=float, default=0.25, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            for backend in args.backends:
+                results += run_backend(backend, size, tmp_dir, args.iterations, args.budget, args.seed)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": args.seed},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fileobj:
+            json.dump(report, fileobj, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fileobj:
+            regressions = compare(results, json.load(fileobj), args.tolerance, args.noise_ms)
+        for row in regressions:
+            print(f"REGRESSION {row['backend']} {row['size']} {row['operation']}: "
+                  f"{row['baseline_p50_ms']:.3f} ms -> {row['p50_ms']:.3f} ms")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
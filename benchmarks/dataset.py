@@ -0,0 +1,133 @@
+"""
+Synthetic dataset generator for the benchmarks.
+
+Movies per user follow a heavy-tailed (Pareto) distribution and titles are drawn from a pool
+with Zipf popularity, so a few users own huge libraries and a few titles are saved by everyone,
+like real data. A title always has the same director, year and poster, the rating is per user.
+Users are generated one at a time so millions of movies never sit in memory.
+"""
+import itertools
+import json
+import random
+
+from flask import Flask
+from sqlalchemy import insert
+
+from config import Config
+from Moviweb_app.models.data_models import db, User, Movie, Review, CatalogMovie
+from Moviweb_app.models.migrations import upgrade_engine
+from Moviweb_app.models.storage import init_storage_profile
+
+TITLE_POOL = 20_000
+DIRECTORS = [f"Director {n}" for n in range(500)]
+MAX_MOVIES_PER_USER = 5_000
+REVIEW_RATE = 0.1
+BATCH_SIZE = 10_000
+
+
+def iter_users(movie_count, seed=42, samples=None, sample_size=2_000):
+    """
+    Yield users with their movies and reviews until movie_count movies were generated.
+    Movie ids are unique across users so the same data loads into both backends.
+    :param samples: Optional list filled with up to sample_size random (user_id, movie_id) pairs
+                    of movies without reviews.
+    """
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, TITLE_POOL + 1)))
+    titles = [{"title": f"Movie {n}", "director": rng.choice(DIRECTORS), "year": str(rng.randint(1920, 2024)),
+               "poster": f"https://posters.example.com/{n}.jpg", "imdb_id": f"tt{n:07d}"}
+              for n in range(TITLE_POOL)]
+    samples = samples if samples is not None else []
+    seen = 0
+    movie_id = 0
+    review_id = 0
+
+    for user_id in itertools.count(1):
+        if movie_id >= movie_count:
+            return
+        count = min(movie_count - movie_id, MAX_MOVIES_PER_USER, max(1, int(rng.paretovariate(1.16) * 5)))
+        movies, reviews = [], []
+        for title in rng.choices(titles, cum_weights=cum_weights, k=count):
+            movie_id += 1
+            movies.append({"movie_id": movie_id, **title, "rating": f"{rng.uniform(1, 10):.1f}"})
+            if rng.random() < REVIEW_RATE:
+                review_id += 1
+                reviews.append({"review_id": review_id, "movie_id": movie_id, "user_id": user_id,
+                                "review": f"Review {review_id} of {title['title']}"})
+                # Sampled movies get deleted by the benchmarks, keep reviewed ones out of the sample.
+                continue
+            seen += 1
+            if len(samples) < sample_size:
+                samples.append((user_id, movie_id))
+            elif rng.random() < sample_size / seen:
+                samples[rng.randrange(sample_size)] = (user_id, movie_id)
+        yield {"id": user_id, "name": f"User {user_id}", "movies": movies, "reviews": reviews}
+
+
+def write_json(path, users):
+    """
+    Write the users in JSONDataManager's format, streaming one user at a time.
+    Reviews are left out, the JSON format has no place for them.
+    """
+    with open(path, "w") as fileobj:
+        fileobj.write("[")
+        for number, user in enumerate(users):
+            if number:
+                fileobj.write(",")
+            movies = [{key: value for key, value in movie.items() if key != "imdb_id"} for movie in user["movies"]]
+            fileobj.write(json.dumps({"id": user["id"], "name": user["name"], "movies": movies}))
+        fileobj.write("]")
+
+
+def make_sqlite_app(path, tuned=True):
+    """
+    Create a minimal Flask app bound to a SQLite file with the migrated schema (typed columns, indexes,
+    search tables), and the production storage profile if tuned.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    if tuned:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = Config.SQLALCHEMY_ENGINE_OPTIONS
+        app.config['SQLITE_PRAGMAS'] = Config.SQLITE_PRAGMAS
+    db.init_app(app)
+    init_storage_profile(app, db)
+    with app.app_context():
+        db.create_all()
+        upgrade_engine(db.engine)
+    return app
+
+
+def load_sqlite(app, users):
+    """
+    Bulk insert the users, catalog entries, movies and reviews in batches.
+    """
+    batches = {User: [], CatalogMovie: [], Movie: [], Review: []}
+    catalog_ids = {}
+
+    def flush(force=False):
+        # All tables at once, parents first, so the foreign keys of every row find their parent.
+        if not force and all(len(rows) < BATCH_SIZE for rows in batches.values()):
+            return
+        for model, rows in batches.items():
+            if rows:
+                db.session.execute(insert(model), rows)
+                rows.clear()
+
+    with app.app_context():
+        for user in users:
+            batches[User].append({"id": user["id"], "name": user["name"]})
+            for movie in user["movies"]:
+                key = CatalogMovie.make_key(None, None, None, movie["imdb_id"])
+                if key not in catalog_ids:
+                    catalog_ids[key] = len(catalog_ids) + 1
+                    batches[CatalogMovie].append({
+                        "catalog_id": catalog_ids[key], "catalog_key": key, "imdb_id": movie["imdb_id"],
+                        "title": movie["title"], "year": int(movie["year"]), "director": movie["director"],
+                        "poster": movie["poster"]
+                    })
+                batches[Movie].append({"movie_id": movie["movie_id"], "user_id": user["id"],
+                                       "catalog_id": catalog_ids[key], "rating": float(movie["rating"])})
+            batches[Review].extend(user["reviews"])
+            flush()
+        flush(force=True)
+        db.session.commit()
@@ -0,0 +1,73 @@
+"""
+Time deleting a user with a large library (their movies, reviews and stats go with them), then deleting
+single reviewed movies, and an orphan cleanup pass over the rest of the database.
+
+Usage: python -m benchmarks.delete_benchmark [library size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from Moviweb_app.models.data_models import db
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from benchmarks.dataset import iter_users, make_sqlite_app
+
+BACKGROUND_MOVIES = 100_000
+REVIEW_EVERY = 10
+SINGLE_DELETES = 100
+
+
+def big_user(user_id, size):
+    movies = [{"movie_id": None, "title": f"Big Movie {number}", "director": f"Director {number % 300}",
+               "year": str(1920 + number % 100), "rating": f"{number % 10}.5", "poster": "N/A",
+               "imdb_id": f"tb{number:07d}"} for number in range(size)]
+    for number, movie in enumerate(movies):
+        movie["movie_id"] = 10_000_000 + number
+    reviews = [{"movie_id": movie["movie_id"], "review": f"Review of {movie['title']}"}
+               for movie in movies[::REVIEW_EVERY]]
+    return {"id": user_id, "name": "Big library", "movies": movies, "reviews": reviews}
+
+
+def count(table, user_id):
+    return db.session.execute(text(f'SELECT count(*) FROM "{table}" WHERE user_id = :user_id'),
+                              {"user_id": user_id}).scalar()
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = make_sqlite_app(os.path.join(tmp_dir, "delete.sqlite3"))
+        data_manager = SQLiteDataManager(db)
+        with app.app_context():
+            users = list(iter_users(BACKGROUND_MOVIES))
+            data_manager.import_users(users)
+            user_id = users[-1]["id"] + 1
+            data_manager.import_users([big_user(user_id, size)])
+            print(f"User {user_id}: {count('Movie', user_id)} movies, {count('Review', user_id)} reviews, "
+                  f"{count('UserStat', user_id)} stat rows, among {BACKGROUND_MOVIES} other movies")
+
+            started = time.perf_counter()
+            data_manager.delete_user(user_id)
+            elapsed = (time.perf_counter() - started) * 1000
+            left = sum(count(table, user_id) for table in ("Movie", "Review", "UserStat"))
+            print(f"delete_user: {elapsed:.1f} ms, {left} rows left behind")
+
+            reviewed = db.session.execute(text(
+                "SELECT DISTINCT user_id, movie_id FROM Review LIMIT :limit"), {"limit": SINGLE_DELETES}).all()
+            started = time.perf_counter()
+            for reviewed_user_id, movie_id in reviewed:
+                data_manager.delete_movie(reviewed_user_id, movie_id)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"delete_movie with reviews: {elapsed / len(reviewed):.2f} ms per movie")
+
+            started = time.perf_counter()
+            counts = data_manager.clean_orphans()
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"clean_orphans: {elapsed:.1f} ms, {counts}")
+
+
+if __name__ == '__main__':
+    main()
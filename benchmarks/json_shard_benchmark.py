@@ -0,0 +1,103 @@
+"""
+Measure how JSON write throughput scales with the number of processes editing different users at once,
+for the single data file (every write serialized by one file lock and rewriting everything) and for
+ShardedJSONDataManager (one lock and one file per user). Then check that processes adding movies to the
+same user concurrently lose nothing.
+
+Usage: python -m benchmarks.json_shard_benchmark [users] [seconds]
+"""
+import fcntl
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.sharded_json_data_manager import ShardedJSONDataManager, shard_json_file
+from benchmarks.json_write_benchmark import make_dataset, MOVIES_PER_USER
+
+WRITERS = (1, 2, 4, 8)
+SAME_USER_WRITES = 50
+NEW_MOVIE = {"title": "Benchmark Movie", "director": "Someone", "year": "2001", "rating": "7.5", "poster": "N/A"}
+
+
+def write_loop(kind, path, user_id, seconds, counter):
+    if kind == "single":
+        manager = JSONDataManager(path)
+        lock_file = open(path + ".lock", "a")
+    else:
+        manager = ShardedJSONDataManager(path)
+        lock_file = None
+    writes = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if lock_file is not None:
+            # The single file has no lock of its own, without this concurrent writers would lose updates.
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            manager.update_movie(user_id, 1 + writes % MOVIES_PER_USER, f"Title {writes}", "Someone", "2000", "7.0")
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        writes += 1
+    with counter.get_lock():
+        counter.value += writes
+
+
+def throughput(kind, path, writers, seconds):
+    counter = multiprocessing.Value("i", 0)
+    processes = [multiprocessing.Process(target=write_loop, args=(kind, path, user_id, seconds, counter))
+                 for user_id in range(1, writers + 1)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return counter.value / seconds
+
+
+def add_movies(directory, count):
+    manager = ShardedJSONDataManager(directory)
+    for _ in range(count):
+        manager.add_movie_for_user(1, NEW_MOVIE)
+
+
+def check_same_user(directory, writers):
+    processes = [multiprocessing.Process(target=add_movies, args=(directory, SAME_USER_WRITES))
+                 for _ in range(writers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    movies = ShardedJSONDataManager(directory).get_user_movie(1)
+    added = sum(movie['title'] == NEW_MOVIE['title'] for movie in movies)
+    unique_ids = len({movie['movie_id'] for movie in movies}) == len(movies)
+    return added, unique_ids
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "data.json")
+        directory = os.path.join(tmp_dir, "users")
+        make_dataset(path, users * MOVIES_PER_USER)
+        shard_json_file(path, directory, progress=lambda line: None)
+        print(f"{users} users, {seconds:.0f} s per run")
+        print(f"{'writers':>8} {'single file w/s':>16} {'sharded w/s':>12}")
+        for writers in WRITERS:
+            single = throughput("single", path, writers, seconds)
+            sharded = throughput("sharded", directory, writers, seconds)
+            print(f"{writers:>8} {single:>16.1f} {sharded:>12.1f}")
+
+        writers = max(WRITERS)
+        added, unique_ids = check_same_user(directory, writers)
+        expected = writers * SAME_USER_WRITES
+        print(f"Same user, {writers} processes: {added}/{expected} movies added, "
+              f"{'unique' if unique_ids else 'DUPLICATE'} movie ids")
+        if added != expected or not unique_ids:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
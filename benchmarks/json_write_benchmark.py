@@ -0,0 +1,58 @@
+"""
+Compare the per-write cost of JSONDataManager's full-rewrite mode against journal mode
+as the dataset grows.
+
+Usage: python -m benchmarks.json_write_benchmark
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from data_manager.json_data_manager import JSONDataManager
+
+SIZES = (1_000, 10_000, 100_000)
+WRITES = 50
+MOVIES_PER_USER = 20
+
+
+def make_dataset(path, movie_count):
+    users = []
+    for user_id in range(1, movie_count // MOVIES_PER_USER + 1):
+        users.append({
+            "id": user_id,
+            "name": f"user {user_id}",
+            "movies": [
+                {"movie_id": movie_id, "title": f"Movie {movie_id}", "director": "Someone",
+                 "year": "2000", "rating": "7.0", "poster": "N/A"}
+                for movie_id in range(1, MOVIES_PER_USER + 1)
+            ]
+        })
+    with open(path, "w") as fileobj:
+        json.dump(users, fileobj)
+
+
+def time_writes(manager):
+    manager.get_all_users()
+    timings = []
+    for i in range(WRITES):
+        started = time.perf_counter()
+        manager.update_movie(1, 1, f"Title {i}", "Someone", "2000", "7.0")
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'movies':>10} {'rewrite ms':>12} {'journal ms':>12}")
+        for size in SIZES:
+            path = os.path.join(tmp_dir, f"data_{size}.json")
+            make_dataset(path, size)
+            rewrite = time_writes(JSONDataManager(path))
+            journal = time_writes(JSONDataManager(path, journal=True, compact_threshold=1 << 30))
+            print(f"{size:>10} {rewrite:>12.3f} {journal:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Run N reader and M writer threads against SQLiteDataManager, once with SQLite's default settings
+and once with the storage profile from config.py, and print the throughput of each.
+
+Usage: python -m benchmarks.sqlite_concurrency_benchmark [readers] [writers] [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask
+
+from config import Config
+from Moviweb_app.models.data_models import db, User, Movie, CatalogMovie
+from Moviweb_app.models.storage import init_storage_profile
+from data_manager.sqlite_data_manager import SQLiteDataManager
+
+USERS = 100
+MOVIES_PER_USER = 50
+
+
+def make_app(path, tuned):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    if tuned:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = Config.SQLALCHEMY_ENGINE_OPTIONS
+        app.config['SQLITE_PRAGMAS'] = Config.SQLITE_PRAGMAS
+    db.init_app(app)
+    init_storage_profile(app, db)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(User(id=user_id, name=f"user {user_id}") for user_id in range(1, USERS + 1))
+        catalog = [CatalogMovie(catalog_key=f"imdb:tt{n:07d}", imdb_id=f"tt{n:07d}", title=f"Movie {n}",
+                                year=2000, director="Someone", poster="N/A") for n in range(MOVIES_PER_USER)]
+        db.session.add_all(
+            Movie(user_id=user_id, catalog=entry, rating=7.0)
+            for user_id in range(1, USERS + 1) for entry in catalog
+        )
+        db.session.commit()
+    return app
+
+
+def run(app, readers, writers, seconds):
+    data_manager = SQLiteDataManager(db)
+    counts = {"reads": 0, "writes": 0, "failed_writes": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def reader(worker):
+        done = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                data_manager.get_user_movie(done % USERS + 1)
+                db.session.remove()
+                done += 1
+        with lock:
+            counts["reads"] += done
+
+    def writer(worker):
+        done = failed = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                new_user = data_manager.create_user_details(None, f"writer {worker}")
+                if data_manager.add_user(new_user):
+                    done += 1
+                else:
+                    failed += 1
+                    db.session.rollback()
+                db.session.remove()
+        with lock:
+            counts["writes"] += done
+            counts["failed_writes"] += failed
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {name: count / seconds if name != "failed_writes" else count for name, count in counts.items()}
+
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, tuned in (("default", False), ("tuned", True)):
+            app = make_app(os.path.join(tmp_dir, f"{label}.sqlite3"), tuned)
+            result = run(app, readers, writers, seconds)
+            print(f"{label:>8}: {result['reads']:.0f} reads/s, {result['writes']:.0f} writes/s, "
+                  f"{result['failed_writes']} failed writes ({readers} readers, {writers} writers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Measure cold start: how long `import main` takes (from `python -X importtime`, with the slowest packages)
+and the time from starting a fresh interpreter to the answer of its first request, split into import,
+create_app and the request itself.
+
+Every measurement runs in a new process against a migrated temporary database, the median of several
+runs is reported. Results can be saved as JSON and compared against a stored baseline, exiting with
+status 1 on a regression, like benchmarks.data_manager_benchmark.
+
+Usage:
+    python -m benchmarks.startup_benchmark --output startup.json
+    python -m benchmarks.startup_benchmark --baseline startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 7
+TOP_PACKAGES = 10
+
+FIRST_REQUEST = """
+import time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/v1/users')
+answered = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(f"{imported - started} {created - imported} {answered - created}")
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_profile(env):
+    """
+    Return the total import time of main and the cumulative import time of each top-level package, in ms.
+    """
+    stderr = run_python(["-X", "importtime", "-c", "import main"], env).stderr
+    packages, children, total = {}, {}, 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two more spaces and listed before the module importing them.
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 1:
+            package = name.split(".")[0]
+            children[package] = children.get(package, 0.0) + int(cumulative) / 1000
+        elif depth == 0:
+            if name == "main":
+                packages, total = children, int(cumulative) / 1000
+            children = {}
+    return total, packages
+
+
+def first_request(env):
+    """
+    Return the wall time from spawning an interpreter to its exit after one request, and the
+    import, create_app and request durations measured inside it, in ms.
+    """
+    started = time.perf_counter()
+    stdout = run_python(["-c", FIRST_REQUEST], env).stdout
+    wall = (time.perf_counter() - started) * 1000
+    imported, created, answered = (float(value) * 1000 for value in stdout.split())
+    return {"wall_ms": wall, "import_ms": imported, "create_app_ms": created, "first_request_ms": answered}
+
+
+def measure(runs):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(path for path in sys.path if path),
+               "MOVIWEB_DATABASE_PATH": os.path.join(tmp_dir, "startup.sqlite3"),
+               "OMDB_CACHE_PATH": os.path.join(tmp_dir, "omdb_cache.sqlite3")}
+        # Creates the schema, which later starts find up to date.
+        first_request(env)
+        profiles = [import_profile(env) for _ in range(runs)]
+        timings = [first_request(env) for _ in range(runs)]
+    packages = {}
+    for _, by_package in profiles:
+        for name, ms in by_package.items():
+            packages.setdefault(name, []).append(ms)
+    slowest = sorted(((name, statistics.median(values)) for name, values in packages.items()),
+                     key=lambda entry: -entry[1])[:TOP_PACKAGES]
+    metrics = {"importtime_ms": statistics.median(total for total, _ in profiles)}
+    metrics.update({key: statistics.median(timing[key] for timing in timings) for key in timings[0]})
+    return {"python": sys.version.split()[0], "runs": runs, "metrics": metrics,
+            "slowest_imports": [{"package": name, "ms": ms} for name, ms in slowest]}
+
+
+def compare(results, baseline, tolerance, noise_ms=20.0):
+    """
+    Return the metrics that got slower than the baseline by more than `tolerance` and `noise_ms`.
+    """
+    regressions = []
+    for name, value in results["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old is not None and value > old * (1 + tolerance) and value - old > noise_ms:
+            regressions.append({"metric": name, "ms": value, "baseline_ms": old})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    for name, value in results["metrics"].items():
+        print(f"{name:>18} {value:>9.1f} ms")
+    print("Slowest imports of main:")
+    for entry in results["slowest_imports"]:
+        print(f"{entry['package']:>18} {entry['ms']:>9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as fileobj:
+            json.dump(results, fileobj, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fileobj:
+            regressions = compare(results, json.load(fileobj), args.tolerance)
+        for row in regressions:
+            print(f"REGRESSION {row['metric']}: {row['baseline_ms']:.1f} ms -> {row['ms']:.1f} ms")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+The flask CLI commands, e.g. `flask --app main upgrade-db`.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import Blueprint, current_app
+
+from Moviweb_app.models.data_models import db
+from Moviweb_app.models.migrations import upgrade_engine, ensure_schema
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.sharded_json_data_manager import shard_json_file
+from library_import import parse_titles, parse_csv, import_titles
+from library_export import EXPORT_KINDS, EXPORT_FORMATS, export_rows, encode_rows, gzip_chunks
+from json_migration import migrate_json, MigrationError, BATCH_SIZE
+from poster_cache import poster_cache
+from services import data_manager, recommendations
+
+# cli_group=None keeps the commands at the top level instead of under "flask commands".
+commands = Blueprint('commands', __name__, cli_group=None)
+
+
+@commands.cli.command('upgrade-db')
+def upgrade_db():
+    """
+    Create missing tables, then upgrade the database schema in place to the latest version.
+    """
+    db.create_all()
+    applied = upgrade_engine(db.engine)
+    print(f"Applied migrations: {applied}" if applied else "The database schema is up to date.")
+
+
+@commands.cli.command('rebuild-search')
+def rebuild_search():
+    """
+    Rebuild the full-text search indexes from the Movie and Review tables.
+    """
+    if data_manager.rebuild_search_index():
+        print("The search index was rebuilt.")
+    else:
+        print("Rebuilding the search index failed, run upgrade-db first.")
+
+
+@commands.cli.command('rebuild-recommendations')
+@click.option('--incremental', is_flag=True, help='Only refresh the queued movies instead of rebuilding everything.')
+def rebuild_recommendations(incremental):
+    """
+    Recompute the "users who saved this also saved" neighbour lists of every movie.
+    """
+    started = time.perf_counter()
+    if incremental:
+        refreshed = recommendations.run_once(current_app._get_current_object())
+        result = None if refreshed is None else f"Refreshed the recommendations ({refreshed} updates)"
+    else:
+        written = data_manager.rebuild_recommendations()
+        result = None if written is None else f"Rebuilt the recommendations, {written} neighbours"
+    if result is None:
+        raise click.ClickException("Refreshing the recommendations failed, NumPy and SciPy are required "
+                                   "and the database must be upgraded (upgrade-db).")
+    print(f"{result} in {time.perf_counter() - started:.1f} s.")
+
+
+@commands.cli.command('backfill-posters')
+@click.option('--workers', default=8, show_default=True, help='Concurrent poster downloads.')
+@click.option('--batch-size', default=200, show_default=True, help='Posters saved per transaction.')
+def backfill_posters(workers, batch_size):
+    """
+    Download the posters of existing movies into the local poster cache.
+    """
+    urls = data_manager.get_posters_to_cache()
+    print(f"{len(urls)} posters to cache.")
+    cached = updated = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(urls), batch_size):
+            batch = urls[start:start + batch_size]
+            hashes = {url: digest for url, digest in zip(batch, pool.map(poster_cache.fetch, batch)) if digest}
+            updated += data_manager.set_poster_hashes(hashes)
+            cached += len(hashes)
+            print(f"{start + len(batch)}/{len(urls)} posters processed.")
+    print(f"Cached {cached} posters, {len(urls) - cached} failed, updated {updated} movie records.")
+
+
+@commands.cli.command('check-stats')
+@click.option('--user-id', type=int, help='Only check this user.')
+@click.option('--repair', is_flag=True, help='Recompute the aggregates of the users that drifted.')
+def check_stats(user_id, repair):
+    """
+    Compare the per-user stats aggregates with the movies they summarize.
+    """
+    drifted = data_manager.check_user_stats(user_id=user_id, repair=repair)
+    if not drifted:
+        print("The user stats are consistent.")
+        return
+    print(f"{'Repaired' if repair else 'Found'} drifted stats for {len(drifted)} users: {drifted}")
+
+
+@commands.cli.command('clean-orphans')
+@click.option('--dry-run', is_flag=True, help='Only count the orphaned rows.')
+def clean_orphans(dry_run):
+    """
+    Delete the rows left without their user, movie or library, e.g. by deletes older versions did not cascade.
+    """
+    started = time.perf_counter()
+    counts = data_manager.clean_orphans(dry_run=dry_run)
+    if counts is None:
+        raise click.ClickException("Deleting the orphaned rows failed, see the log.")
+    for name, count in counts.items():
+        print(f"{name:>16} {count}")
+    print(f"{'Found' if dry_run else 'Deleted'} {sum(counts.values())} orphaned rows "
+          f"in {time.perf_counter() - started:.2f} s.")
+
+
+@commands.cli.command('import-movies')
+@click.argument('user_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_movies(user_id, path):
+    """
+    Import a list of titles (one per line) or a CSV export into a user's library.
+    """
+    with open(path, encoding='utf-8-sig') as fileobj:
+        text = fileobj.read()
+    titles = parse_csv(text) if path.lower().endswith('.csv') else parse_titles(text)
+    report = import_titles(data_manager, user_id, titles)
+    print(f"Added {len(report['added'])}, skipped {len(report['duplicates'])} duplicates, "
+          f"{len(report['not_found'])} not found, {len(report['failed'])} failed.")
+    for title in report['not_found']:
+        print(f"Not found: {title}")
+    for failure in report['failed']:
+        print(f"Failed: {failure['title']}: {failure['error']}")
+
+
+@commands.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_KINDS)))
+@click.option('--user-id', type=int, help='Only export this user.')
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--output', '-o', default='-', type=click.Path(dir_okay=False, allow_dash=True),
+              help='File to write, standard output by default.')
+@click.option('--from-json', type=click.Path(exists=True, dir_okay=False),
+              help='Export a JSON data file, parsed incrementally, instead of the database.')
+def export(kind, user_id, fmt, compress, output, from_json):
+    """
+    Stream the movies or reviews of one user, or of everyone, as NDJSON or CSV.
+    """
+    source = JSONDataManager(from_json) if from_json else data_manager
+    chunks = encode_rows(export_rows(source, kind, user_id), EXPORT_KINDS[kind], fmt)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    written = 0
+    with click.open_file(output, 'wb') as fileobj:
+        for chunk in chunks:
+            fileobj.write(chunk)
+            written += len(chunk)
+    if output != '-':
+        print(f"Exported {kind} to {output} ({written} bytes).")
+
+
+@commands.cli.command('migrate-json')
+@click.argument('path', default='data/data.json', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+              help='Movies and reviews inserted per transaction.')
+def migrate_json_command(path, batch_size):
+    """
+    Copy the users and movies of a JSON data file into the SQLite database, resuming an interrupted run.
+    """
+    ensure_schema(db)
+    try:
+        totals = migrate_json(path, data_manager, batch_size=batch_size)
+    except MigrationError as error:
+        raise click.ClickException(str(error))
+    print(f"Migrated {totals['users']} users, {totals['movies']} movies and {totals['reviews']} reviews, "
+          f"{totals['renumbered']} movies got a new id.")
+
+
+@commands.cli.command('shard-json')
+@click.argument('source', default='data/data.json', type=click.Path(exists=True, dir_okay=False))
+@click.argument('target', default='data/users', type=click.Path(file_okay=False))
+def shard_json(source, target):
+    """
+    Split a JSON data file into a users index and one file per user, for ShardedJSONDataManager.
+    """
+    try:
+        users = shard_json_file(source, target)
+    except (ValueError, FileExistsError) as error:
+        raise click.ClickException(str(error))
+    print(f"Wrote {users} user files and the users index to {target}.")
@@ -0,0 +1,41 @@
+"""
+Storage configuration, read from the environment so every worker can be tuned without code changes.
+"""
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class Config:
+    DATABASE_PATH = os.environ.get('MOVIWEB_DATABASE_PATH', os.path.join(BASE_DIR, 'data', 'data.sqlite3'))
+    SQLALCHEMY_DATABASE_URI = os.environ.get('MOVIWEB_DATABASE_URI', f'sqlite:///{DATABASE_PATH}')
+
+    # How long a connection waits on a locked database before raising "database is locked".
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('MOVIWEB_SQLITE_BUSY_TIMEOUT_MS', 5000)
+
+    # Applied on every new connection, see models/storage.py.
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.environ.get('MOVIWEB_SQLITE_JOURNAL_MODE', 'WAL'),
+        "synchronous": os.environ.get('MOVIWEB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": _env_int('MOVIWEB_SQLITE_CACHE_SIZE', -64000),  # negative means KiB, so 64 MB
+        "mmap_size": _env_int('MOVIWEB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        "temp_store": "MEMORY",
+        # Off by default in SQLite, needed for the ON DELETE CASCADE foreign keys.
+        "foreign_keys": "ON",
+    }
+
+    # Requests issuing more SQL queries than this are logged as a likely N+1 pattern, see metrics.py.
+    QUERY_BUDGET = _env_int('MOVIWEB_QUERY_BUDGET', 20)
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": _env_int('MOVIWEB_DB_POOL_SIZE', 10),
+        "max_overflow": _env_int('MOVIWEB_DB_MAX_OVERFLOW', 20),
+        "pool_timeout": _env_int('MOVIWEB_DB_POOL_TIMEOUT', 30),
+        "pool_recycle": _env_int('MOVIWEB_DB_POOL_RECYCLE', 3600),
+        "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    }
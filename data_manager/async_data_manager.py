@@ -0,0 +1,82 @@
+"""
+Await any data manager from async views.
+
+Every call runs on a bounded pool of threads inside its own app context (SQLiteDataManager needs one for
+its session), so a coroutine awaiting a query leaves the event loop free and independent queries, e.g. a
+user's name and their movies, can be awaited together with asyncio.gather. SQLite releases the GIL while
+it reads, and WAL lets those reads run in parallel; this is also how async SQLite drivers work, with one
+thread per connection, while keeping a single implementation of every query.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+from .data_manager_interface import AsyncDataManagerInterface
+
+
+class AsyncDataManager(AsyncDataManagerInterface):
+    def __init__(self, data_manager, app=None, workers=16):
+        """
+        Initialize a new instance of AsyncDataManager class.
+        :param data_manager: JSONDataManager or SQLiteDataManager the calls are made on.
+        :param app: Flask app the calls run in, defaults to the current app of the awaiting coroutine.
+        :param workers: Maximum number of calls running at once.
+        """
+        self.data_manager = data_manager
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="data-manager")
+
+    def _call_in_context(self, app, method, args, kwargs):
+        if app is None:
+            return method(*args, **kwargs)
+        with app.app_context():
+            return method(*args, **kwargs)
+
+    async def call(self, name, *args, **kwargs):
+        """
+        Run a method of the data manager without blocking the event loop.
+        :param name: Method name, e.g. "get_user_name".
+        :return: what the method returns.
+        """
+        app = self.app or (current_app._get_current_object() if has_app_context() else None)
+        method = getattr(self.data_manager, name)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._call_in_context, app, method, args, kwargs)
+
+    def __getattr__(self, name):
+        """
+        Any other public method of the data manager, as a coroutine function. The views only await the
+        methods declared by AsyncDataManagerInterface, this is for scripts and benchmarks.
+        """
+        if name.startswith('_') or not callable(getattr(self.data_manager, name, None)):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    async def get_all_users(self, after=None, before=None, limit=None):
+        return await self.call("get_all_users", after=after, before=before, limit=limit)
+
+    async def get_user_movie(self, user_id, after=None, before=None, limit=None):
+        return await self.call("get_user_movie", user_id, after=after, before=before, limit=limit)
+
+    async def get_user_name(self, user_id):
+        return await self.call("get_user_name", user_id)
+
+    async def get_user_stats(self, user_id):
+        return await self.call("get_user_stats", user_id)
+
+    async def get_data_version(self, user_id=None, scope=None):
+        return await self.call("get_data_version", user_id=user_id, scope=scope)
+
+    async def add_movies_for_user(self, user_id, new_movies):
+        return await self.call("add_movies_for_user", user_id, new_movies)
+
+    async def search(self, query, user_id=None, limit=20):
+        return await self.call("search", query, user_id=user_id, limit=limit)
+
+    async def get_recommendations(self, user_id, limit=12):
+        return await self.call("get_recommendations", user_id, limit=limit)
+
+    async def get_similar_movies(self, user_id, movie_id, limit=20):
+        return await self.call("get_similar_movies", user_id, movie_id, limit=limit)
@@ -0,0 +1,94 @@
+"""
+Batches of library changes, shared by both data managers.
+
+A batch is a list of operations, each a dictionary with an "op" and its arguments:
+    {"op": "delete_movie", "movie_id": 3}
+    {"op": "update_rating", "movie_id": 3, "rating": 8.5}
+    {"op": "add_review", "movie_id": 3, "review": "Better the second time."}
+    {"op": "delete_review", "review_id": 7}
+The whole batch is applied atomically, in order. Consecutive operations of the same kind form a run,
+which SQLiteDataManager executes as one set-based statement and JSONDataManager as one record.
+"""
+import itertools
+import math
+
+BATCH_OPERATIONS = {
+    "delete_movie": ("movie_id",),
+    "update_rating": ("movie_id", "rating"),
+    "add_review": ("movie_id", "review"),
+    "delete_review": ("review_id",),
+}
+ID_FIELDS = ("movie_id", "review_id")
+MIN_RATING, MAX_RATING = 0.0, 10.0
+
+
+def _check_rating(value):
+    """
+    :return: the rating as a float, whether it was sent as a number or a numeric string.
+    :raises ValueError: if it is not a number between MIN_RATING and MAX_RATING.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("rating must be a number")
+    try:
+        rating = float(value)
+    except ValueError:
+        raise ValueError("rating must be a number") from None
+    if math.isnan(rating) or not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f"rating must be between {MIN_RATING:g} and {MAX_RATING:g}")
+    return rating
+
+
+def _check_review(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("review must be a non-empty string")
+    return value
+
+
+FIELD_CHECKS = {"rating": _check_rating, "review": _check_review}
+
+
+def check_operations(operations, supported=BATCH_OPERATIONS):
+    """
+    Validate a batch before anything is applied, so a bad operation never leaves half a batch behind.
+    :param operations: list of operation dictionaries.
+    :param supported: the operations the data manager can apply, with their required fields.
+    :return: the operations, reduced to their known fields, ratings as floats.
+    :raises ValueError: describing the first invalid operation.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("The operations must be a list.")
+    checked = []
+    for position, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op not in supported:
+            raise ValueError(f"Operation {position}: unsupported op {op!r}.")
+        missing = [field for field in supported[op] if field not in operation]
+        if missing:
+            raise ValueError(f"Operation {position}: missing {', '.join(missing)}.")
+        for field in ID_FIELDS:
+            value = operation.get(field)
+            if field in supported[op] and (not isinstance(value, int) or isinstance(value, bool)):
+                raise ValueError(f"Operation {position}: {field} must be an integer.")
+        checked_operation = {"op": op}
+        for field in supported[op]:
+            try:
+                checked_operation[field] = FIELD_CHECKS.get(field, lambda value: value)(operation[field])
+            except ValueError as error:
+                raise ValueError(f"Operation {position}: {error}.") from None
+        checked.append(checked_operation)
+    return checked
+
+
+def operation_runs(operations):
+    """
+    Split a batch into runs of consecutive operations of the same kind.
+    :return: list of (op, operations) tuples, in batch order.
+    """
+    return [(op, list(run)) for op, run in itertools.groupby(operations, key=lambda operation: operation["op"])]
+
+
+def latest_ratings(run):
+    """
+    Return the rating each movie of an update_rating run ends up with, the last one winning.
+    """
+    return {operation["movie_id"]: operation["rating"] for operation in run}
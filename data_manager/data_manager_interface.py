@@ -4,11 +4,95 @@ from abc import ABC, abstractmethod
 class DataManagerInterface(ABC):
 
     @abstractmethod
-    def get_all_users(self):
+    def get_all_users(self, after=None, before=None, limit=None):
         pass
 
     @abstractmethod
-    def get_user_movie(self, user_id):
+    def get_user_movie(self, user_id, after=None, before=None, limit=None):
         pass
 
+    @abstractmethod
+    def get_user_library(self, user_id, after=None, before=None, limit=None):
+        pass
+
+    @abstractmethod
+    def get_user_stats(self, user_id):
+        pass
+
+    @abstractmethod
+    def get_data_version(self, user_id=None, scope=None):
+        pass
+
+    @abstractmethod
+    def add_listener(self, callback):
+        pass
+
+    @abstractmethod
+    def search(self, query, user_id=None, limit=20):
+        pass
+
+    @abstractmethod
+    def iter_movies(self, user_id=None, batch_size=1000):
+        pass
+
+    @abstractmethod
+    def iter_reviews(self, user_id=None, batch_size=1000):
+        pass
+
+    @abstractmethod
+    def get_recommendations(self, user_id, limit=12):
+        pass
+
+    @abstractmethod
+    def get_similar_movies(self, user_id, movie_id, limit=20):
+        pass
+
+    @abstractmethod
+    def refresh_recommendations(self, limit=100):
+        pass
+
+    @abstractmethod
+    def apply_batch(self, user_id, operations):
+        pass
+
+
+class AsyncDataManagerInterface(ABC):
+    """
+    The same queries as DataManagerInterface, as coroutines, for async views.
+    """
+
+    @abstractmethod
+    async def get_all_users(self, after=None, before=None, limit=None):
+        pass
+
+    @abstractmethod
+    async def get_user_movie(self, user_id, after=None, before=None, limit=None):
+        pass
+
+    @abstractmethod
+    async def get_user_name(self, user_id):
+        pass
+
+    @abstractmethod
+    async def get_user_stats(self, user_id):
+        pass
+
+    @abstractmethod
+    async def get_data_version(self, user_id=None, scope=None):
+        pass
 
+    @abstractmethod
+    async def add_movies_for_user(self, user_id, new_movies):
+        pass
+
+    @abstractmethod
+    async def search(self, query, user_id=None, limit=20):
+        pass
+
+    @abstractmethod
+    async def get_recommendations(self, user_id, limit=12):
+        pass
+
+    @abstractmethod
+    async def get_similar_movies(self, user_id, movie_id, limit=20):
+        pass
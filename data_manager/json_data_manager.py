@@ -1,46 +1,741 @@
+import bisect
 import json
-import requests
+import logging
+import os
+import threading
+import time
 from .data_manager_interface import DataManagerInterface
+from .omdb_client import omdb_client
+from .search_index import InvertedIndex, highlight_words, tokenize
+from .user_stats import stat_deltas, apply_deltas, summarize, same_aggregate
+from .batch import BATCH_OPERATIONS, check_operations, operation_runs, latest_ratings
+from . import recommender
+from Moviweb_app.models.data_models import Movie, CatalogMovie
 
-API_KEY = 79153533
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+# Title of the placeholder movie every new user starts with.
+PLACEHOLDER_TITLE = "Add movies here: "
+
+# The JSON format has no reviews.
+JSON_BATCH_OPERATIONS = {op: BATCH_OPERATIONS[op] for op in ("delete_movie", "update_rating")}
+
+JSON_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(fileobj, chunk_size=64 * 1024):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the file in chunks,
+    so only the element being parsed is ever held in memory.
+    :param fileobj: file opened in text mode.
+    :param chunk_size: Characters read at a time, more are read while an element does not fit.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def peek():
+        # Skip whitespace, reading on as needed, and return the next character, '' at the end of the file.
+        nonlocal buffer, position, eof
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            buffer, position = fileobj.read(chunk_size), 0
+            eof = not buffer
+
+    if peek() != "[":
+        raise ValueError("The JSON data file does not contain an array")
+    position += 1
+    if peek() == "]":
+        return
+    while True:
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A value ending with the buffer may go on in the next chunk, e.g. a number.
+                if end < len(buffer) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise
+            # Read at least as much again as is buffered, so a large element is parsed O(log n) times.
+            more = fileobj.read(max(chunk_size, len(buffer) - position))
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+        yield value
+        position = end
+        separator = peek()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in the JSON array, found {separator!r}")
+        position += 1
 
 
 class JSONDataManager(DataManagerInterface):
-    def __init__(self, filename):
+    def __init__(self, filename, journal=False, fsync=FSYNC_ALWAYS, fsync_interval=1.0,
+                 compact_threshold=1024 * 1024):
         """
         Initialize a new instance of the JSONDataManager class
+        The file is parsed once into indexes and only re-read when its mtime or size changes.
+        :param filename: Path of the JSON snapshot.
+        :param journal: Append mutations to '<filename>.journal' instead of rewriting the snapshot.
+        :param fsync: Journal fsync policy: "always", "interval" (at most every fsync_interval
+                      seconds) or "never" (leave it to the OS).
+        :param compact_threshold: Journal size in bytes that triggers a background compaction.
         """
 
         self.filename = filename
+        self.journal = journal
+        self.journal_filename = filename + ".journal"
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._signature = None
+        self._users_by_id = {}
+        self._movies_by_key = {}
+        self._sorted_user_ids = None
+        self._search_index = None
+        self._stats_by_user = None
+        self._neighbors = None
+        self._generation = 0
+        self._versions = {}
+        self._listeners = []
+        self._last_fsync = 0.0
+        self._compactor = None
+        # Counts update_json calls, so a compaction never renames an older snapshot over their file.
+        self._rewrites = 0
 
-    def get_all_users(self):
-        # Return all the users.
-        with open(self.filename) as fileobj:
-            data = json.loads(fileobj.read())
-            return data
-
-    def get_user_movie(self, user_id):
-        # Return all the movies for a given user
+    @staticmethod
+    def _stat(path):
         try:
-            all_users = self.get_all_users()
-            for user in all_users:
-                if user['id'] == user_id:
-                    return user['movies']
+            stat = os.stat(path)
+        except FileNotFoundError:
             return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_signature(self):
+        """
+        Return the (mtime, size) of the snapshot and journal, used to detect changes made
+        to the files by someone else.
+        """
+        if not self.journal:
+            return self._stat(self.filename)
+        return (self._stat(self.filename), self._stat(self.journal_filename + ".compacting"),
+                self._stat(self.journal_filename))
+
+    def _build_index(self, users):
+        """
+        Index the users by id and their movies by (user_id, movie_id).
+        """
+        self._users_by_id = {user['id']: user for user in users}
+        self._sorted_user_ids = None
+        self._search_index = None
+        self._stats_by_user = None
+        self._neighbors = None
+        self._movies_by_key = {
+            (user['id'], movie['movie_id']): movie
+            for user in users
+            for movie in user.get('movies', [])
+        }
+
+    def _replay(self, path):
+        """
+        Apply every complete record of a journal file. A torn last line left by a crash is cut off.
+        """
+        try:
+            fileobj = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with fileobj:
+            good_offset = 0
+            for line in fileobj:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(record)
+                good_offset += len(line)
+            torn = fileobj.tell() != good_offset
+        if torn:
+            logger.warning(f"Discarding an incomplete record at the end of {path}")
+            with open(path, "r+b") as fileobj:
+                fileobj.truncate(good_offset)
+
+    def _load(self):
+        """
+        Make sure the in-memory store matches the files on disk, re-parsing them only if they changed.
+        """
+        with self._lock:
+            signature = self._file_signature()
+            if signature != self._signature:
+                with open(self.filename) as fileobj:
+                    self._build_index(json.loads(fileobj.read()))
+                self._generation = time.time_ns()
+                self._versions = {}
+                if self.journal:
+                    self._replay(self.journal_filename + ".compacting")
+                    self._replay(self.journal_filename)
+                    signature = self._file_signature()
+                self._signature = signature
+
+    def _load_user(self, user_id):
+        """
+        Make sure one user's movies are loaded and current. The single file holds everyone, see
+        ShardedJSONDataManager for a layout that loads users one at a time.
+        """
+        self._load()
+
+    def _load_all(self):
+        """
+        Make sure every user's movies are loaded and current.
+        """
+        self._load()
+
+    def add_listener(self, callback):
+        """
+        Register a callable notified with the changed scopes ("users", "user:<id>") after every write.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, *scopes):
+        for callback in self._listeners:
+            callback(*scopes)
+
+    def _bump(self, *scopes):
+        """
+        Increment the version counters of the given scopes and notify the listeners.
+        """
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+        self._notify(*scopes)
+
+    @staticmethod
+    def _record_scopes(record):
+        """
+        Return the scopes a mutation record changes.
+        """
+        op = record['op']
+        scopes = ["users"] if op in ('add_user', 'delete_user', 'update_user') else []
+        scopes.append(f"user:{record['user']['id'] if op == 'add_user' else record['user_id']}")
+        if op != 'update_user':
+            # Any library change can change everyone's recommendations.
+            scopes.append("recommendations")
+        return scopes
+
+    def _apply(self, record):
+        """
+        Apply a single mutation record to the in-memory store, without bumping versions: replaying the
+        journal in _load starts a new generation anyway, and _commit bumps once per record.
+        Records are idempotent so a journal can safely be replayed over a newer snapshot.
+        Movie lists and movies are never changed in place, new ones replace them, so compact can
+        serialize a shallow copy of the users outside the lock.
+        """
+        op = record['op']
+        user_id = record.get('user_id')
+        user = self._users_by_id.get(user_id)
+
+        if op in ('add_user', 'delete_user'):
+            self._sorted_user_ids = None
+
+        if op == 'add_user':
+            new_user = record['user']
+            self._apply({"op": "delete_user", "user_id": new_user['id']})
+            self._users_by_id[new_user['id']] = new_user
+            for movie in new_user.get('movies', []):
+                self._put_movie((new_user['id'], movie['movie_id']), movie)
+        elif user is None:
+            return
+        elif op == 'delete_user':
+            del self._users_by_id[user_id]
+            for movie in user.get('movies', []):
+                self._pop_movie((user_id, movie['movie_id']))
+        elif op == 'update_user':
+            user['name'] = record['name']
+        elif op == 'set_movies':
+            for movie in user.get('movies', []):
+                self._pop_movie((user_id, movie['movie_id']))
+            user['movies'] = record['movies']
+            for movie in user['movies']:
+                self._put_movie((user_id, movie['movie_id']), movie)
+        elif op in ('add_movie', 'add_movies'):
+            movies = [record['movie']] if op == 'add_movie' else record['movies']
+            movie_ids = {movie['movie_id'] for movie in movies}
+            for movie_id in movie_ids:
+                self._pop_movie((user_id, movie_id))
+            user['movies'] = [item for item in user.get('movies', []) if item['movie_id'] not in movie_ids] + movies
+            for movie in movies:
+                self._put_movie((user_id, movie['movie_id']), movie)
+        elif op in ('update_movie', 'update_movies'):
+            updated = {}
+            for change in [record] if op == 'update_movie' else record['movies']:
+                movie = self._pop_movie((user_id, change['movie_id']))
+                if movie is not None:
+                    movie = updated[change['movie_id']] = {**movie, **change['fields']}
+                    self._put_movie((user_id, change['movie_id']), movie)
+            if updated:
+                user['movies'] = [updated.get(item['movie_id'], item) for item in user['movies']]
+        elif op == 'delete_movie':
+            movie = self._pop_movie((user_id, record['movie_id']))
+            if movie is not None:
+                user['movies'] = [item for item in user['movies'] if item is not movie]
+        elif op == 'delete_movies':
+            movie_ids = set(record['movie_ids'])
+            for movie_id in movie_ids:
+                self._pop_movie((user_id, movie_id))
+            user['movies'] = [item for item in user.get('movies', []) if item['movie_id'] not in movie_ids]
+        elif op == 'batch':
+            for change in record['records']:
+                self._apply({**change, "user_id": user_id})
+
+    @staticmethod
+    def _search_fields(movie):
+        return [(movie.get('title'), 10.0), (movie.get('director'), 5.0)]
+
+    def _put_movie(self, key, movie):
+        """
+        Index a movie by (user_id, movie_id), and in the search index and stats once those were built.
+        """
+        self._movies_by_key[key] = movie
+        self._neighbors = None
+        if self._search_index is not None:
+            self._search_index.add(key, self._search_fields(movie))
+        if self._stats_by_user is not None:
+            apply_deltas(self._stats_by_user.setdefault(key[0], {}), stat_deltas([movie]))
+
+    def _pop_movie(self, key):
+        movie = self._movies_by_key.pop(key, None)
+        self._neighbors = None
+        if movie is not None and self._search_index is not None:
+            self._search_index.remove(key, self._search_fields(movie))
+        if movie is not None and self._stats_by_user is not None:
+            apply_deltas(self._stats_by_user.setdefault(key[0], {}), stat_deltas([movie], sign=-1))
+        return movie
+
+    def _compute_stats(self):
+        stats_by_user = {}
+        for (user_id, _), movie in self._movies_by_key.items():
+            apply_deltas(stats_by_user.setdefault(user_id, {}), stat_deltas([movie]))
+        return stats_by_user
+
+    def _number_movies(self, record):
+        """
+        Give the movies of an add_movie(s) record the next free ids of their user. Called under the write
+        lock, so two writers never hand out the same id.
+        """
+        if record['op'] == 'add_movie':
+            record['movie'] = {"movie_id": self.generate_movie_id(record['user_id']), **record['movie']}
+        elif record['op'] == 'add_movies':
+            first_id = self.generate_movie_id(record['user_id'])
+            record['movies'] = [{"movie_id": first_id + offset, **movie}
+                                for offset, movie in enumerate(record['movies'])]
+
+    def _commit(self, record):
+        """
+        Apply a mutation and persist it, either as a journal append or as a full rewrite.
+        """
+        with self._lock:
+            self._load()
+            self._number_movies(record)
+            self._apply(record)
+            if self.journal:
+                self._append(record)
+            else:
+                self.update_json(list(self._users_by_id.values()), rebuild_index=False)
+            self._bump(*self._record_scopes(record))
+
+    def _append(self, record):
+        """
+        Append a record to the journal according to the fsync policy.
+        """
+        try:
+            with open(self.journal_filename, "ab") as fileobj:
+                fileobj.write(json.dumps(record, separators=(',', ':')).encode() + b"\n")
+                fileobj.flush()
+                now = time.monotonic()
+                if self.fsync == FSYNC_ALWAYS or (
+                        self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval):
+                    os.fsync(fileobj.fileno())
+                    self._last_fsync = now
+                journal_size = fileobj.tell()
+            self._signature = self._file_signature()
+        except IOError as error:
+            self._signature = None
+            logger.error(f"Error appending to the JSON journal: {error}")
+            return
+        if journal_size >= self.compact_threshold:
+            self.compact(background=True)
+
+    def compact(self, background=False):
+        """
+        Fold the journal into a fresh snapshot.
+        The journal is rotated and the users are copied under the lock, a shallow copy whatever the
+        number of movies (see _apply); writers keep appending to a new journal while the copy is
+        serialized to a temporary file, which is then atomically renamed over the old snapshot.
+        :param background: Serialize and write in a daemon thread and return immediately.
+        """
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._load()
+            compacting = self.journal_filename + ".compacting"
+            if os.path.exists(self.journal_filename) and not os.path.exists(compacting):
+                os.replace(self.journal_filename, self.journal_filename + ".compacting")
+            users = [dict(user) for user in self._users_by_id.values()]
+            self._signature = self._file_signature()
+            rewrites = self._rewrites
+
+        if background:
+            self._compactor = threading.Thread(target=self._write_snapshot, args=(users, rewrites), daemon=True)
+            self._compactor.start()
+        else:
+            self._write_snapshot(users, rewrites)
+
+    def _write_snapshot(self, users, rewrites):
+        """
+        Serialize a copy of the users and rename it over the snapshot, unless update_json replaced
+        the data file since the copy was taken.
+        """
+        tmp_filename = None
+        try:
+            tmp_filename = self._write_temporary(json.dumps(users, indent=4), self.filename)
+            with self._lock:
+                if self._rewrites != rewrites:
+                    os.remove(tmp_filename)
+                    return
+                os.replace(tmp_filename, self.filename)
+                try:
+                    os.remove(self.journal_filename + ".compacting")
+                except FileNotFoundError:
+                    pass
+                self._signature = self._file_signature()
+        except IOError as error:
+            logger.error(f"Error compacting the JSON journal: {error}")
+            if tmp_filename is not None and os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    @staticmethod
+    def _write_temporary(content, path):
+        """
+        Write content next to path and flush it to disk.
+        :return: the name of the temporary file, to be renamed over path.
+        """
+        tmp_filename = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filename, "w") as fileobj:
+            fileobj.write(content)
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        return tmp_filename
+
+    def _write_atomic(self, content, path=None):
+        """
+        Write the snapshot to a temporary file and rename it into place, so a crash
+        never leaves a truncated data file behind.
+        :param path: File to write instead of the snapshot.
+        """
+        path = path or self.filename
+        os.replace(self._write_temporary(content, path), path)
+
+    @staticmethod
+    def _keyset_slice(items, keys, after=None, before=None, limit=None):
+        """
+        Slice a list sorted by `keys` the same way SQLiteDataManager pages with keyset queries.
+        """
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        end = bisect.bisect_left(keys, before) if before is not None else len(keys)
+        if limit is not None:
+            if before is not None:
+                start = max(start, end - limit)
+            else:
+                end = min(end, start + limit)
+        return items[start:end]
+
+    def get_data_version(self, user_id=None, scope=None):
+        """
+        Return the version of the users list, or of everything belonging to one user.
+        It changes on every write and whenever the file is re-read, so it can be used for ETags and cache keys.
+        :param scope: Another scope instead, e.g. "recommendations".
+        """
+        with self._lock:
+            if scope == "recommendations":
+                self._load_all()
+            elif user_id is not None:
+                self._load_user(user_id)
+            else:
+                self._load()
+            scope = scope or ("users" if user_id is None else f"user:{user_id}")
+            return f"{self._generation}.{self._versions.get(scope, 0)}"
+
+    def get_all_users(self, after=None, before=None, limit=None):
+        # Return all the users, or one page of them ordered by id.
+        with self._lock:
+            self._load()
+            if after is None and before is None and limit is None:
+                return list(self._users_by_id.values())
+            if self._sorted_user_ids is None:
+                self._sorted_user_ids = sorted(self._users_by_id)
+            user_ids = self._keyset_slice(self._sorted_user_ids, self._sorted_user_ids, after, before, limit)
+            return [self._users_by_id[user_id] for user_id in user_ids]
+
+    def get_user_movie(self, user_id, after=None, before=None, limit=None):
+        # Return all the movies for a given user, or one page of them ordered by movie_id
+        try:
+            self._load_user(user_id)
+            user = self._users_by_id.get(user_id)
+            if user is None:
+                return None
+            movies = user['movies']
+            if after is None and before is None and limit is None:
+                return movies
+            # New movies get max(movie_id) + 1, so the list is normally already in order.
+            movie_ids = [movie['movie_id'] for movie in movies]
+            if any(earlier > later for earlier, later in zip(movie_ids, movie_ids[1:])):
+                movies = sorted(movies, key=lambda movie: movie['movie_id'])
+                movie_ids = sorted(movie_ids)
+            return self._keyset_slice(movies, movie_ids, after, before, limit)
         except Exception as error:
             return error
 
-    def update_json(self, new_file):
+    def get_user_library(self, user_id, after=None, before=None, limit=None):
+        """
+        Return the user's name and a page of their movies, in the same shape as SQLiteDataManager.
+        The JSON format has no reviews, so every review_count is 0.
+        """
+        with self._lock:
+            user_name = self.get_user_name(user_id)
+            movies = self.get_user_movie(user_id, after=after, before=before, limit=limit) or []
+            return user_name, [{**movie, "review_count": 0} for movie in movies]
+
+    def search(self, query, user_id=None, limit=20):
+        """
+        Ranked search over movie titles and directors, in the same shape as SQLiteDataManager.search.
+        The inverted index is built on the first search and then kept up to date by _apply.
+        The JSON format has no reviews.
+        :param query:
+        :param user_id: Only search this user's movies, or everyone's if None.
+        :param limit:
+        :return:
+        """
+        with self._lock:
+            if user_id is None:
+                self._load_all()
+            else:
+                self._load_user(user_id)
+            if self._search_index is None:
+                self._search_index = InvertedIndex()
+                for key, movie in self._movies_by_key.items():
+                    self._search_index.add(key, self._search_fields(movie))
+            accept = None if user_id is None else (lambda key: key[0] == user_id)
+            words = tokenize(query)
+            results = []
+            for key, score in self._search_index.search(query, limit, accept):
+                movie = self._movies_by_key[key]
+                snippet = highlight_words(movie.get('title'), words)
+                if movie.get('director'):
+                    snippet += highlight_words(f" - {movie['director']}", words)
+                results.append({"kind": "movie", "user_id": key[0], "movie_id": key[1], "review_id": None,
+                                "title": movie.get('title'), "director": movie.get('director'),
+                                "snippet": snippet, "score": -score})
+            return results
+
+    @staticmethod
+    def _movie_rows(user):
+        for movie in user.get('movies', []):
+            yield {"user_id": user['id'], "user_name": user.get('name'), "movie_id": movie.get('movie_id'),
+                   "title": movie.get('title'), "director": movie.get('director'),
+                   "year": Movie.parse_year(movie.get('year')), "rating": Movie.parse_rating(movie.get('rating')),
+                   "imdb_id": movie.get('imdb_id'), "poster": movie.get('poster')}
+
+    def iter_movies(self, user_id=None, batch_size=1000):
+        """
+        Stream the movies of one user, or of everyone, in the same shape and with the same types as
+        SQLiteDataManager.iter_movies, in file order. Until something else loaded the store, the snapshot
+        is parsed incrementally one user at a time, so exporting a large file never materializes it.
+        A journal has to be replayed over the whole snapshot, so with one the store is loaded first.
+        :param user_id: Only export this user's movies, or everyone's if None.
+        :param batch_size: Unused, for compatibility with SQLiteDataManager.
+        :return: generator of dictionaries.
+        """
+        if self._signature is None and not self.journal:
+            with open(self.filename) as fileobj:
+                for user in iter_json_array(fileobj):
+                    if user_id is None or user.get('id') == user_id:
+                        yield from self._movie_rows(user)
+            return
+        with self._lock:
+            if user_id is None:
+                self._load_all()
+            else:
+                self._load_user(user_id)
+            user_ids = list(self._users_by_id) if user_id is None else [user_id]
+        for exported_id in user_ids:
+            with self._lock:
+                user = self._users_by_id.get(exported_id)
+                rows = list(self._movie_rows(user)) if user is not None else []
+            yield from rows
+
+    def iter_reviews(self, user_id=None, batch_size=1000):
+        """
+        The JSON format has no reviews, the export is always empty.
+        """
+        return iter(())
+
+    def get_user_stats(self, user_id):
+        """
+        Return the user's statistics in the same shape as SQLiteDataManager.get_user_stats.
+        The aggregates are computed on the first call and then kept up to date by _apply.
+        :param user_id:
+        :return:
+        """
+        with self._lock:
+            self._load_user(user_id)
+            if user_id not in self._users_by_id:
+                return None
+            if self._stats_by_user is None:
+                self._stats_by_user = self._compute_stats()
+            return summarize(self._stats_by_user.get(user_id, {}))
+
+    @staticmethod
+    def _catalog_key(movie):
+        return CatalogMovie.make_key(movie.get('title'), Movie.parse_year(movie.get('year')), movie.get('director'),
+                                     movie.get('imdb_id'))
+
+    def _compute_neighbors(self):
+        """
+        Build the neighbour list of every distinct movie, keyed like CatalogMovie, from the libraries in memory.
+        :return: (dictionary of catalog key -> list of (key, co_count, score), dictionary of key -> a movie)
+        """
+        catalog, codes, user_ids, item_ids = {}, {}, [], []
+        for (user_id, _), movie in self._movies_by_key.items():
+            if movie.get('title') == PLACEHOLDER_TITLE:
+                continue
+            key = self._catalog_key(movie)
+            catalog.setdefault(key, movie)
+            user_ids.append(user_id)
+            item_ids.append(codes.setdefault(key, len(codes)))
+        keys = list(codes)
+        neighbors = {}
+        if item_ids:
+            matrix, items = recommender.library_matrix(recommender.np.array(user_ids),
+                                                       recommender.np.array(item_ids))
+            for rows, columns, co_counts, scores in recommender.item_neighbors(matrix):
+                for row, column, co_count, score in zip(items[rows].tolist(), items[columns].tolist(),
+                                                        co_counts.tolist(), scores.tolist()):
+                    neighbors.setdefault(keys[row], []).append((keys[column], co_count, score))
+        return neighbors, catalog
+
+    @staticmethod
+    def _catalog_row(movie, **extra):
+        return {"catalog_id": None, "title": movie.get('title'), "director": movie.get('director'),
+                "year": Movie.parse_year(movie.get('year')), "imdb_id": movie.get('imdb_id'),
+                "poster": movie.get('poster'), "poster_hash": movie.get('poster_hash'), **extra}
+
+    def _neighbor_lists(self):
+        """
+        Return the neighbour lists, computed on first use after any library changed.
+        """
+        if self._neighbors is None:
+            self._neighbors = self._compute_neighbors()
+        return self._neighbors
+
+    def get_recommendations(self, user_id, limit=12):
+        """
+        Recommend movies in the same shape as SQLiteDataManager.get_recommendations. The neighbour lists
+        are computed in memory on the first call after a change, the JSON format has no catalog ids.
+        :param user_id:
+        :param limit:
+        :return:
+        """
+        with self._lock:
+            self._load_all()
+            user = self._users_by_id.get(user_id)
+            if user is None or not recommender.available():
+                return []
+            neighbors, catalog = self._neighbor_lists()
+            owned = [self._catalog_key(movie) for movie in reversed(user.get('movies', []))
+                     if movie.get('title') != PLACEHOLDER_TITLE]
+            return [self._catalog_row(catalog[key], score=score)
+                    for key, score in recommender.recommend(owned, neighbors, limit)]
+
+    def refresh_recommendations(self, limit=100):
+        """
+        Nothing is queued: the neighbour lists are recomputed on the first read after a change.
+        :return: 0, the number of movies refreshed.
+        """
+        return 0
+
+    def get_similar_movies(self, user_id, movie_id, limit=recommender.TOP_K):
+        """
+        Return the movies most often saved together with one of the user's movies, in the same shape as
+        SQLiteDataManager.get_similar_movies.
+        :param user_id:
+        :param movie_id:
+        :param limit:
+        :return: None if the user has no such movie.
+        """
+        with self._lock:
+            self._load_all()
+            movie = self._movies_by_key.get((user_id, movie_id))
+            if movie is None:
+                return None
+            if not recommender.available():
+                return []
+            neighbors, catalog = self._neighbor_lists()
+            return [self._catalog_row(catalog[key], co_count=co_count, score=score)
+                    for key, co_count, score in neighbors.get(self._catalog_key(movie), [])[:limit]]
+
+    def check_user_stats(self, user_id=None, repair=False):
+        """
+        Recompute the aggregates from the movies and compare them with the maintained ones.
+        :param user_id: Only check this user, or everyone if None.
+        :param repair: Replace the aggregates of the users that drifted.
+        :return: the ids of the users whose aggregates did not match.
+        """
+        with self._lock:
+            self._load_all()
+            if self._stats_by_user is None:
+                return []
+            expected = self._compute_stats()
+            user_ids = expected.keys() | self._stats_by_user.keys() if user_id is None else {user_id}
+            drifted = sorted(
+                drifted_id for drifted_id in user_ids
+                if not same_aggregate(self._stats_by_user.get(drifted_id, {}), expected.get(drifted_id, {}))
+            )
+            if repair:
+                for drifted_id in drifted:
+                    self._stats_by_user[drifted_id] = expected.get(drifted_id, {})
+            return drifted
+
+    def update_json(self, new_file, rebuild_index=True):
         """
         Update the JSON data file with new content.
         :param new_file: A dictionary containing the updated data.
+        :param rebuild_index: False when the in-memory indexes already match new_file.
         :return:
         """
         try:
-            with open(self.filename, "w") as fileobj:
-                fileobj.write(json.dumps(new_file, indent=4))
+            with self._lock:
+                self._rewrites += 1
+                self._write_atomic(json.dumps(new_file, indent=4))
+                if self.journal:
+                    for path in (self.journal_filename, self.journal_filename + ".compacting"):
+                        if os.path.exists(path):
+                            os.remove(path)
+                if rebuild_index:
+                    self._build_index(new_file)
+                self._signature = self._file_signature()
         except IOError as error:
-            print("An IOError occurred: ", str(error))
+            # Whatever ended up on disk is the truth now, re-read it on the next access.
+            self._signature = None
+            logger.error(f"Error writing the JSON data file: {error}")
 
     def create_user_details(self, user_id, user_name):
         """
@@ -55,7 +750,7 @@ class JSONDataManager(DataManagerInterface):
             "movies": [
                 {
                     "movie_id": self.generate_movie_id(user_id),
-                    "title": "Add movies here: "
+                    "title": PLACEHOLDER_TITLE
                 }
             ]
         }
@@ -67,47 +762,39 @@ class JSONDataManager(DataManagerInterface):
         :param new_user: A dictionary representing the details of a new user.
         :return: The updated list of all users.
         """
-        all_users = self.get_all_users()
-        all_users.append(new_user)
-        self.update_json(all_users)
-        return all_users
+        self._commit({"op": "add_user", "user": new_user})
+        return self.get_all_users()
 
     def delete_user(self, user_id):
         """
         Delete a user with the given user_id from the list of all users.
         """
-        all_users = self.get_all_users()
-        updated_list = []
-        user_to_remove = None
-        for user in all_users:
-            if user['id'] != user_id:
-                updated_list.append(user)
-            else:
-                user_to_remove = user
-        self.update_json(updated_list)
+        self._load()
+        user_to_remove = self._users_by_id.get(user_id)
+        if user_to_remove is not None:
+            self._commit({"op": "delete_user", "user_id": user_id})
         return user_to_remove
 
     def update_user(self, user_id, new_name):
         """
         Update the name of the user with the given user_id
         """
-        all_users = self.get_all_users()
-        for user in all_users:
-            if user['id'] == user_id:
-                user['name'] = new_name
-                self.update_json(all_users)
-                return user
-        return None
+        self._load()
+        user = self._users_by_id.get(user_id)
+        if user is None:
+            return None
+        self._commit({"op": "update_user", "user_id": user_id, "name": new_name})
+        return user
 
     def get_user_name(self, user_id):
         """
         Get the name of the user with the given user_id
         """
-        all_users = self.get_all_users()
-        for user in all_users:
-            if user['id'] == user_id:
-                return user['name']
-        return None
+        self._load()
+        user = self._users_by_id.get(user_id)
+        if user is None:
+            return None
+        return user['name']
 
     @staticmethod
     def generate_user_id(users):
@@ -131,95 +818,166 @@ class JSONDataManager(DataManagerInterface):
         """
         Retrieve a specific movie from a user's movie list using its movie_id
         """
-        movies = self.get_user_movie(user_id)
-        for movie in movies:
-            if movie['movie_id'] == movie_id:
-                return movie
-        return None
+        self._load_user(user_id)
+        return self._movies_by_key.get((user_id, movie_id))
+
+    def get_posters_to_cache(self):
+        """
+        Return the distinct remote poster URLs of the movies whose poster was never cached locally.
+        """
+        self._load_all()
+        return list(dict.fromkeys(
+            movie['poster'] for movie in self._movies_by_key.values()
+            if not movie.get('poster_hash') and str(movie.get('poster', '')).startswith('http')
+        ))
+
+    def set_poster_hashes(self, hashes):
+        """
+        Record the digests of cached posters on every movie using them, with one write per user.
+        :param hashes: dictionary of poster URL -> sha256 digest.
+        :return: the number of movies updated.
+        """
+        with self._lock:
+            self._load_all()
+            changes = {}
+            for (user_id, movie_id), movie in self._movies_by_key.items():
+                if not movie.get('poster_hash') and movie.get('poster') in hashes:
+                    changes.setdefault(user_id, []).append(
+                        {"movie_id": movie_id, "fields": {"poster_hash": hashes[movie['poster']]}})
+        for user_id, movies in changes.items():
+            self._commit({"op": "update_movies", "user_id": user_id, "movies": movies})
+        return sum(len(movies) for movies in changes.values())
 
     @staticmethod
     def movies_api(new_movie):
         """
         Fetch movie information from the OMDB API using the movie title.
         """
-        api_url = f'http://www.omdbapi.com/?apikey={API_KEY}&t={new_movie}'
-        try:
-            response = requests.get(api_url)
-            api_data = response.json()
-            if api_data['Response'] == "False":
-                return None
-
-            else:
-                movie_info = {
-                    "title": api_data["Title"],
-                    "year": api_data["Year"],
-                    "director": api_data["Director"],
-                    "rating": api_data["imdbRating"],
-                    "poster": api_data["Poster"]
-                }
-                return movie_info
-        except Exception as error:
-            print(f"{error}\n Check connections!")
-            return None
+        return omdb_client.lookup(new_movie)
 
     def add_movie_for_user(self, user_id, new_movie):
         """
         Add a new movie to the user's movie list.
+        :return: True if the user exists and the movie was added.
         """
 
-        all_users = self.get_all_users()
-        movie_id = self.generate_movie_id()
-        for user in all_users:
-            if user['id'] == user_id:
-                user['movies'].append({
-                    "movie_id": movie_id,
-                    "title": new_movie['title'],
-                    "director": new_movie['director'],
-                    "year": new_movie['year'],
-                    "rating": new_movie['rating'],
-                    "poster": new_movie['poster']
-                })
-                self.update_json(all_users)
-                return
+        self._load_user(user_id)
+        if user_id not in self._users_by_id:
+            return False
+        self._commit({"op": "add_movie", "user_id": user_id, "movie": {
+            "title": new_movie['title'],
+            "director": new_movie['director'],
+            "year": new_movie['year'],
+            "rating": new_movie['rating'],
+            "poster": new_movie['poster'],
+            "poster_hash": new_movie.get('poster_hash')
+        }})
+        return True
+
+    def add_movies_for_user(self, user_id, new_movies):
+        """
+        Add many movies to the user's movie list with a single write.
+        :return: True if the user exists and the movies were added.
+        """
+        self._load_user(user_id)
+        if user_id not in self._users_by_id:
+            return False
+        if not new_movies:
+            return True
+        self._commit({"op": "add_movies", "user_id": user_id, "movies": [
+            {
+                "title": new_movie['title'],
+                "director": new_movie['director'],
+                "year": new_movie['year'],
+                "rating": new_movie['rating'],
+                "poster": new_movie['poster'],
+                "poster_hash": new_movie.get('poster_hash')
+            }
+            for new_movie in new_movies
+        ]})
+        return True
 
     def update_movies_data(self, user_id, movie_list):
         """
         Update the movie list for a specific user in the list of all the users.
         """
-        all_users = self.get_all_users()
-        for user in all_users:
-            if user['id'] == user_id:
-                user['movies'] = movie_list
-        self.update_json(all_users)
+        self._commit({"op": "set_movies", "user_id": user_id, "movies": movie_list})
         return movie_list
 
     def delete_movie(self, user_id, movie_id):
         """
         Delete a specific movie from a user's movie list.
         """
-        user_movies = self.get_user_movie(user_id)
-        updated_list = []
-        movie_to_delete = None
-        for movie in user_movies:
-            if movie['movie_id'] != movie_id:
-                updated_list.append(movie)
-            else:
-                movie_to_delete = movie
-        self.update_movies_data(user_id, updated_list)
+        self._load_user(user_id)
+        movie_to_delete = self._movies_by_key.get((user_id, movie_id))
+        if movie_to_delete is not None:
+            self._commit({"op": "delete_movie", "user_id": user_id, "movie_id": movie_id})
         return movie_to_delete
 
     def update_movie(self, user_id, movie_id, new_title, new_director, new_year, new_rating):
         """
         Update details of a specific movie for a user in the list of all users.
         """
-        all_users = self.get_all_users()
-        for user in all_users:
-            if user['id'] == user_id:
-                for movie in user['movies']:
-                    if movie['movie_id'] == movie_id:
-                        movie['title'] = new_title
-                        movie['director'] = new_director
-                        movie['year'] = new_year
-                        movie['rating'] = new_rating
-        self.update_json(all_users)
+        self._load_user(user_id)
+        if (user_id, movie_id) not in self._movies_by_key:
+            return
+        self._commit({"op": "update_movie", "user_id": user_id, "movie_id": movie_id, "fields": {
+            "title": new_title,
+            "director": new_director,
+            "year": new_year,
+            "rating": new_rating
+        }})
         return
+
+    def apply_batch(self, user_id, operations):
+        """
+        Apply a batch of changes to a user's library (see data_manager.batch) with a single write,
+        or a single journal record. The JSON format has no reviews, so only movie operations are supported.
+        Operations on movies the user does not have are skipped.
+        :param user_id:
+        :param operations: list of operation dictionaries.
+        :return: dictionary of op -> number of movies changed.
+        :raises ValueError: if an operation is invalid, before anything is changed.
+        """
+        runs = operation_runs(check_operations(operations, JSON_BATCH_OPERATIONS))
+        counts = dict.fromkeys(JSON_BATCH_OPERATIONS, 0)
+        self._load_user(user_id)
+        user = self._users_by_id.get(user_id)
+        if user is None:
+            return counts
+        present = {movie['movie_id'] for movie in user.get('movies', [])}
+        records = []
+        for op, run in runs:
+            if op == "delete_movie":
+                movie_ids = sorted({operation['movie_id'] for operation in run} & present)
+                if movie_ids:
+                    present.difference_update(movie_ids)
+                    records.append({"op": "delete_movies", "movie_ids": movie_ids})
+                    counts[op] += len(movie_ids)
+            else:
+                ratings = {movie_id: rating for movie_id, rating in latest_ratings(run).items() if movie_id in present}
+                if ratings:
+                    records.append({"op": "update_movies", "movies": [
+                        {"movie_id": movie_id, "fields": {"rating": rating}} for movie_id, rating in ratings.items()
+                    ]})
+                    counts[op] += len(ratings)
+        if records:
+            self._commit({"op": "batch", "user_id": user_id, "records": records})
+        return counts
+
+    def delete_movies(self, user_id, movie_ids):
+        """
+        Delete many movies from a user's movie list with a single write.
+        :return: the number of movies deleted.
+        """
+        return self.apply_batch(user_id, [{"op": "delete_movie", "movie_id": movie_id}
+                                          for movie_id in movie_ids])["delete_movie"]
+
+    def update_ratings(self, user_id, ratings):
+        """
+        Change the rating of many movies of a user with a single write.
+        :param ratings: dictionary of movie_id -> new rating.
+        :return: the number of movies updated.
+        """
+        return self.apply_batch(user_id, [{"op": "update_rating", "movie_id": movie_id, "rating": rating}
+                                          for movie_id, rating in ratings.items()])["update_rating"]
@@ -0,0 +1,341 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+API_KEY = 79153533
+OMDB_BASE_URL = os.environ.get('OMDB_BASE_URL', 'http://www.omdbapi.com/')
+CACHE_PATH = os.environ.get('OMDB_CACHE_PATH',
+                            os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'omdb_cache.sqlite3'))
+
+
+def normalize_title(title):
+    """
+    Normalize a movie title so that "  The Matrix", "the matrix" and "THE   MATRIX"
+    share the same cache entry.
+    :param title:
+    :return:
+    """
+    return " ".join(str(title).split()).casefold()
+
+
+class OMDbClient:
+    def __init__(self, base_url=OMDB_BASE_URL, api_key=API_KEY, cache_path=CACHE_PATH,
+                 max_entries=1024, ttl=7 * 24 * 3600, negative_ttl=15 * 60, timeout=5, pool_size=10,
+                 max_disk_entries=50000, prune_every=100):
+        """
+        Initialize a new instance of OMDbClient class.
+        Lookups go through an in-process LRU, then the on-disk table, then OMDb itself
+        over a pooled keep-alive session. lookup_async and lookup_many do the same from a coroutine,
+        running the OMDb requests on pool_size threads that share the session's connections.
+        The disk cache, the session and the threads are only created on first use, so the shared
+        client built at import time opens no file and starts no thread.
+        :param base_url: OMDb endpoint, point it to a local stub for offline testing.
+        :param cache_path: SQLite file for the persistent cache, None disables it.
+        :param max_entries: Maximum number of entries kept in memory.
+        :param max_disk_entries: Maximum number of rows kept on disk, the ones expiring first are dropped.
+        :param prune_every: Drop expired and surplus rows every prune_every writes to the disk cache.
+        :param ttl: Seconds a found movie stays cached.
+        :param negative_ttl: Seconds a "Response": "False" answer stays cached.
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache_path = cache_path
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+
+        self._session = None
+        self._executor = None
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "errors": 0,
+            "fetch_count": 0,
+            "fetch_seconds": 0.0,
+        }
+
+        # The disk cache has its own lock, so a slow SQLite read or commit never holds up memory hits.
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        self._disk_opened = False
+        self._disk_writes = 0
+
+    @property
+    def session(self):
+        """
+        The pooled keep-alive session, created on first use so importing the client does not import requests.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        """
+        The threads lookup_async runs OMDb requests on, started on first use.
+        Flask runs every async view on a new event loop, which an asyncio HTTP client's connections
+        cannot outlive; these threads let coroutines share the session's pool across requests instead.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="omdb")
+        return self._executor
+
+    def _get_disk(self):
+        """
+        Open the persistent cache on first use, so importing the client touches no file, and prune what
+        earlier runs left behind. Called under self._disk_lock.
+        :return: the sqlite3 connection, None if the cache is disabled or could not be opened.
+        """
+        if not self._disk_opened:
+            self._disk_opened = True
+            if self.cache_path:
+                try:
+                    self._disk = sqlite3.connect(self.cache_path, check_same_thread=False)
+                    self._disk.execute(
+                        "CREATE TABLE IF NOT EXISTS omdb_cache ("
+                        "key TEXT PRIMARY KEY, payload TEXT, expires_at REAL NOT NULL)"
+                    )
+                    self._disk.execute("CREATE INDEX IF NOT EXISTS ix_omdb_cache_expires_at ON omdb_cache (expires_at)")
+                    self._prune(self._disk, time.time())
+                except sqlite3.Error as e:
+                    logger.error(f"Error opening the OMDb cache, continuing without it: {e}")
+                    self._disk = None
+        return self._disk
+
+    def _memory_get(self, key, now):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key, movie_info, expires_at):
+        self._memory[key] = (movie_info, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, disk, now):
+        """
+        Delete the expired rows, then the ones expiring first beyond max_disk_entries, and commit.
+        """
+        disk.execute("DELETE FROM omdb_cache WHERE expires_at <= ?", (now,))
+        disk.execute(
+            "DELETE FROM omdb_cache WHERE key IN ("
+            "SELECT key FROM omdb_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        disk.commit()
+
+    def _disk_get(self, key, now):
+        """
+        Read an entry from the disk cache, deleting it if it has expired.
+        :return: (movie_info or None, expires_at), None on a miss or if the cache is unavailable.
+        """
+        with self._disk_lock:
+            disk = self._get_disk()
+            if disk is None:
+                return None
+            try:
+                row = disk.execute(
+                    "SELECT payload, expires_at FROM omdb_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] <= now:
+                    disk.execute("DELETE FROM omdb_cache WHERE key = ? AND expires_at <= ?", (key, now))
+                    disk.commit()
+                    return None
+            except sqlite3.Error as e:
+                logger.error(f"Error reading the OMDb cache: {e}")
+                return None
+        if row is None:
+            return None
+        payload = json.loads(row[0]) if row[0] is not None else None
+        return payload, row[1]
+
+    def _disk_put(self, key, movie_info, expires_at):
+        payload = json.dumps(movie_info) if movie_info is not None else None
+        with self._disk_lock:
+            disk = self._get_disk()
+            if disk is None:
+                return
+            try:
+                disk.execute(
+                    "INSERT OR REPLACE INTO omdb_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, expires_at)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % self.prune_every == 0:
+                    self._prune(disk, time.time())
+                else:
+                    disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing the OMDb cache: {e}")
+
+    def fetch(self, title):
+        """
+        Query OMDb directly, bypassing the cache.
+        :param title:
+        :return: movie_info dictionary, None for a "not found" answer.
+        :raises requests.RequestException: on connection errors and timeouts.
+        """
+        started = time.perf_counter()
+        try:
+            response = self.session.get(
+                self.base_url, params={"apikey": self.api_key, "t": title}, timeout=self.timeout
+            )
+            api_data = response.json()
+        finally:
+            with self._lock:
+                self._counters["fetch_count"] += 1
+                self._counters["fetch_seconds"] += time.perf_counter() - started
+
+        if api_data.get('Response') == "False":
+            return None
+        return {
+            "title": api_data["Title"],
+            "year": api_data["Year"],
+            "director": api_data["Director"],
+            "rating": api_data["imdbRating"],
+            "poster": api_data["Poster"],
+            "imdb_id": api_data.get("imdbID")
+        }
+
+    def _cached(self, key, now):
+        """
+        Look a normalized title up in memory, then on disk, counting the hit or miss.
+        The disk is read outside self._lock, so other lookups keep being answered from memory meanwhile.
+        :return: (True, movie_info or None) on a hit, (False, None) on a miss.
+        """
+        with self._lock:
+            entry = self._memory_get(key, now)
+            if entry is not None:
+                self._counters["memory_hits"] += 1
+        if entry is None:
+            entry = self._disk_get(key, now)
+            with self._lock:
+                if entry is not None:
+                    self._counters["disk_hits"] += 1
+                    self._memory_put(key, *entry)
+                else:
+                    self._counters["misses"] += 1
+                    return False, None
+        if entry[0] is None:
+            with self._lock:
+                self._counters["negative_hits"] += 1
+            return True, None
+        return True, dict(entry[0])
+
+    def _fetch_and_store(self, title, key, now, raise_errors):
+        try:
+            movie_info = self.fetch(title)
+        except Exception as error:
+            logger.error(f"Error looking up {title!r} on OMDb, check connections: {error}")
+            with self._lock:
+                self._counters["errors"] += 1
+            if raise_errors:
+                raise
+            return None
+
+        expires_at = now + (self.ttl if movie_info is not None else self.negative_ttl)
+        with self._lock:
+            self._memory_put(key, movie_info, expires_at)
+        self._disk_put(key, movie_info, expires_at)
+        return dict(movie_info) if movie_info is not None else None
+
+    def lookup(self, title, raise_errors=False):
+        """
+        Fetch the movie information for a title, using the cache where possible.
+        :param title:
+        :param raise_errors: Re-raise connection errors instead of returning None, so callers can retry.
+        :return: movie_info dictionary or None when the movie was not found.
+        """
+        key = normalize_title(title)
+        if not key:
+            return None
+        now = time.time()
+        hit, movie_info = self._cached(key, now)
+        if hit:
+            return movie_info
+        return self._fetch_and_store(title, key, now, raise_errors)
+
+    async def lookup_async(self, title, raise_errors=False):
+        """
+        Coroutine version of lookup: cache hits are answered straight away, misses wait for OMDb
+        without blocking the event loop.
+        """
+        key = normalize_title(title)
+        if not key:
+            return None
+        now = time.time()
+        hit, movie_info = self._cached(key, now)
+        if hit:
+            return movie_info
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._fetch_and_store, title, key, now, raise_errors)
+
+    async def lookup_many(self, titles, raise_errors=False):
+        """
+        Resolve several titles concurrently, at most pool_size of them waiting on OMDb at a time.
+        :param raise_errors: Return the connection error of a title in its place instead of None.
+        :return: list of movie_info dictionaries (or None, or the exception) in the order of the titles.
+        """
+        return await asyncio.gather(*(self.lookup_async(title, raise_errors) for title in titles),
+                                    return_exceptions=raise_errors)
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the average OMDb round trip in milliseconds.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["avg_fetch_ms"] = (stats["fetch_seconds"] / stats["fetch_count"] * 1000
+                                 if stats["fetch_count"] else 0.0)
+        return stats
+
+    def clear(self):
+        """
+        Drop every cached entry, in memory and on disk.
+        """
+        with self._lock:
+            self._memory.clear()
+        with self._disk_lock:
+            disk = self._get_disk()
+            if disk is not None:
+                disk.execute("DELETE FROM omdb_cache")
+                disk.commit()
+
+
+omdb_client = OMDbClient()
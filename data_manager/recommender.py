@@ -0,0 +1,125 @@
+"""
+Item-to-item recommendations ("users who saved this also saved"), shared by both data managers.
+
+The libraries form a binary user x movie matrix X. The co-occurrence counts of every pair of movies are
+X.T @ X, computed with SciPy one block of movies at a time so only a block x movies slice is ever dense,
+and each movie keeps its TOP_K neighbours by cosine similarity co(i, j) / sqrt(n(i) n(j)), n being the
+number of libraries holding a movie. A user's recommendations add up the neighbour lists of their movies.
+NumPy and SciPy are optional, without them there are no recommendations. They are only imported by
+available(), which every caller checks first: together they take longer to import than the rest of the app.
+"""
+import threading
+
+# Set by available().
+np = sparse = None
+_import_lock = threading.Lock()
+_imported = False
+
+TOP_K = 20
+BLOCK_SIZE = 512
+# Columns of each block the score floor is estimated on, see item_neighbors.
+SAMPLE_COLUMNS = 2048
+# A user's recommendations are built from their most recently saved movies only.
+RECENT_MOVIES = 200
+
+
+def available():
+    """
+    Import NumPy and SciPy on first use and return whether they are installed.
+    """
+    global np, sparse, _imported
+    if not _imported:
+        with _import_lock:
+            if not _imported:
+                try:
+                    import numpy
+                    from scipy import sparse as scipy_sparse
+                except ImportError:  # NumPy and SciPy are optional, recommendations are simply empty without them
+                    pass
+                else:
+                    np, sparse = numpy, scipy_sparse
+                _imported = True
+    return sparse is not None
+
+
+def library_matrix(user_ids, item_ids):
+    """
+    Build the binary user x item matrix of the libraries.
+    :param user_ids: integer array, the owner of each saved movie.
+    :param item_ids: integer array of the same length, the movie saved.
+    :return: (CSR matrix, sorted array of the item id of each column)
+    """
+    users, rows = np.unique(user_ids, return_inverse=True)
+    items, columns = np.unique(item_ids, return_inverse=True)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                               shape=(len(users), len(items)))
+    # A movie saved twice by the same user counts once.
+    matrix.data[:] = 1
+    return matrix, items
+
+
+def item_neighbors(matrix, k=TOP_K, block_size=BLOCK_SIZE):
+    """
+    Find the k most similar items of every item, by cosine similarity of the matrix columns.
+    :param matrix: binary user x item CSR matrix, see library_matrix.
+    :return: generator of (items, neighbors, co_counts, scores) arrays, one tuple per block of items,
+             items and neighbors being column numbers. Each item's neighbours come by decreasing score.
+    """
+    item_count = matrix.shape[1]
+    k = min(k, item_count - 1)
+    if k <= 0:
+        return
+    owners = np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel()
+    inverse_norms = (1 / np.sqrt(owners)).astype(np.float32)
+    by_item = matrix.T.tocsr()
+    for start in range(0, item_count, block_size):
+        stop = min(start + block_size, item_count)
+        co_counts = (by_item[start:stop] @ matrix).toarray()
+        co_counts[np.arange(stop - start), np.arange(start, stop)] = 0
+        # Scaling by the neighbour's norm only, the item's own norm does not change the order of its row.
+        scores = co_counts * inverse_norms
+        # The k-th best score among some of the columns is at most the k-th best of the whole row, so
+        # everything below it can be dropped before sorting, at a fraction of the cost of partitioning
+        # whole rows.
+        sample = scores[:, ::max(1, item_count // SAMPLE_COLUMNS)]
+        if sample.shape[1] > k:
+            floor = np.partition(sample, -k, axis=1)[:, -k]
+        else:
+            floor = np.zeros(stop - start, dtype=scores.dtype)
+        rows, columns = np.nonzero((scores >= floor[:, None]) & (scores > 0))
+        values = scores[rows, columns]
+        order = np.lexsort((columns, -values, rows))
+        rows, columns = rows[order], columns[order]
+        # Keep the first k of each row.
+        keep = np.arange(len(rows)) - np.searchsorted(rows, rows) < k
+        rows, columns = rows[keep], columns[keep]
+        co_counts = co_counts[rows, columns].astype(np.int64)
+        # The float32 scores only rank, the stored ones are recomputed in double precision.
+        yield rows + start, columns, co_counts, neighbor_scores(co_counts, owners[rows + start], owners[columns])
+
+
+def neighbor_scores(co_counts, item_owners, neighbor_owners):
+    """
+    Cosine similarities of one item with the items it co-occurs with.
+    :param co_counts: integer array, libraries holding both the item and each neighbour.
+    :param item_owners: number of libraries holding the item, or an array of them for each co-count.
+    :param neighbor_owners: integer array, number of libraries holding each neighbour.
+    """
+    return np.asarray(co_counts, dtype=np.float64) / np.sqrt(item_owners * np.asarray(neighbor_owners,
+                                                                                       dtype=np.float64))
+
+
+def recommend(owned, neighbor_lists, limit):
+    """
+    Rank the items a user does not have by the summed scores of the neighbour lists of the items they have.
+    :param owned: the user's items, most recent first.
+    :param neighbor_lists: dictionary of item -> list of (neighbor, co_count, score).
+    :return: list of (item, score), best first.
+    """
+    owned_set = set(owned)
+    scores = {}
+    for item in dict.fromkeys(owned[:RECENT_MOVIES]):
+        for neighbor, _, score in neighbor_lists.get(item, ()):
+            if neighbor not in owned_set:
+                scores[neighbor] = scores.get(neighbor, 0.0) + score
+    return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]
@@ -0,0 +1,130 @@
+"""
+Search helpers shared by the data managers: query tokenizing, FTS5 query building,
+snippet highlighting and the in-memory inverted index used by JSONDataManager.
+"""
+import bisect
+import re
+import unicodedata
+
+from markupsafe import Markup, escape
+
+MARK_START = "\x02"
+MARK_END = "\x03"
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase words without diacritics, like FTS5's unicode61 tokenizer.
+    """
+    if not text:
+        return []
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return [word.casefold() for word in _WORD.findall(stripped)]
+
+
+def fts_query(text):
+    """
+    Turn user input into a safe FTS5 query: every word must match, the last one as a prefix
+    so results show up while typing.
+    """
+    words = tokenize(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+
+def highlight(snippet):
+    """
+    Escape a snippet produced with MARK_START/MARK_END around the matches and turn those into <mark> tags.
+    """
+    if snippet is None:
+        return None
+    return Markup(str(escape(snippet)).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>"))
+
+
+def highlight_words(text, words):
+    """
+    Highlight every word of a text that starts with one of the query words.
+    """
+    if not text:
+        return text
+
+    def mark(match):
+        word = tokenize(match.group(0))
+        if word and any(word[0].startswith(query_word) for query_word in words):
+            return f"{MARK_START}{match.group(0)}{MARK_END}"
+        return match.group(0)
+    return highlight(_WORD.sub(mark, str(text)))
+
+
+class InvertedIndex:
+    def __init__(self):
+        """
+        Initialize a new instance of InvertedIndex class: word -> {document key: weight}.
+        """
+        self._postings = {}
+        self._words = None
+
+    def add(self, key, fields):
+        """
+        Index a document.
+        :param key: hashable document key, e.g. (user_id, movie_id).
+        :param fields: list of (text, weight) pairs, e.g. [(title, 10.0), (director, 5.0)].
+        """
+        for text, weight in fields:
+            for word in tokenize(text):
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = {}
+                    self._words = None
+                postings[key] = postings.get(key, 0.0) + weight
+
+    def remove(self, key, fields):
+        """
+        Remove a document indexed earlier with the same fields.
+        """
+        for text, weight in fields:
+            for word in tokenize(text):
+                postings = self._postings.get(word)
+                if postings is None or key not in postings:
+                    continue
+                postings[key] -= weight
+                if postings[key] <= 0:
+                    del postings[key]
+                if not postings:
+                    del self._postings[word]
+                    self._words = None
+
+    def _matching_words(self, prefix):
+        if self._words is None:
+            self._words = sorted(self._postings)
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + "\U0010ffff")
+        return self._words[start:end]
+
+    def search(self, text, limit=20, accept=None):
+        """
+        Return the best matching document keys with their score. Every word of the query must match,
+        the last one as a prefix.
+        :param accept: Optional predicate on the document keys, e.g. to only keep one user's movies.
+        """
+        words = tokenize(text)
+        if not words:
+            return []
+        scores = None
+        for position, word in enumerate(words):
+            candidates = self._matching_words(word) if position == len(words) - 1 else [word]
+            matches = {}
+            for candidate in candidates:
+                for key, weight in self._postings.get(candidate, {}).items():
+                    matches[key] = matches.get(key, 0.0) + weight
+            if scores is None:
+                scores = matches if accept is None else {key: weight for key, weight in matches.items() if accept(key)}
+            else:
+                scores = {key: scores[key] + weight for key, weight in matches.items() if key in scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
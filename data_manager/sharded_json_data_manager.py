@@ -0,0 +1,307 @@
+"""
+A JSONDataManager keeping one file per user, so a write only rewrites the user it changes.
+
+Layout of the data directory:
+    users.json   the users index, [{"id": 1, "name": "..."}, ...], all get_all_users ever reads
+    <id>.json    one user in the single-file format, {"id": 1, "name": "...", "movies": [...]}
+    .locks/      a lock file per shard and one for the index
+
+Shards are read the first time a user is needed and re-read only when their mtime or size changed, so
+writes made by other processes are picked up. A write holds an exclusive lock on its shard (and on the
+index when users are added, renamed or deleted) while it re-reads, changes and atomically replaces the
+file: writers of different users never wait on each other, writers of the same user never lose a change.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # no flock() on Windows, shards are then only locked within the process
+    fcntl = None
+
+from .json_data_manager import JSONDataManager, iter_json_array
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "users.json"
+LOCK_DIRECTORY = ".locks"
+
+
+def _index_entry(user):
+    return {"id": user['id'], "name": user.get('name')}
+
+
+def _read_json(path):
+    """
+    Parse a JSON file, None if it does not exist.
+    """
+    try:
+        with open(path) as fileobj:
+            return json.load(fileobj)
+    except FileNotFoundError:
+        return None
+
+
+def shard_json_file(source, directory, progress=print):
+    """
+    Convert a single-file JSONDataManager data file into the sharded layout, parsing it incrementally.
+    The index is written last, so an interrupted conversion leaves no index and can simply be run again.
+    :param source: JSON data file, in JSONDataManager's format.
+    :param directory: Data directory to create, it must not hold an index yet.
+    :param progress: callable receiving a progress line every 10000 users.
+    :return: the number of users converted.
+    """
+    if os.path.exists(source + ".journal") or os.path.exists(source + ".journal.compacting"):
+        raise ValueError(f"{source} has a journal, compact it first so the file holds every change.")
+    if os.path.exists(os.path.join(directory, INDEX_FILENAME)):
+        raise FileExistsError(f"{directory} already holds a users index.")
+    os.makedirs(directory, exist_ok=True)
+    index = []
+    with open(source) as fileobj:
+        for user in iter_json_array(fileobj):
+            with open(os.path.join(directory, f"{int(user['id'])}.json"), "w") as shard:
+                json.dump(user, shard, indent=4)
+            index.append(_index_entry(user))
+            if len(index) % 10000 == 0:
+                progress(f"{len(index)} users converted.")
+    if hasattr(os, "sync"):
+        # The shards must be on disk before the index points to them.
+        os.sync()
+    index_filename = os.path.join(directory, INDEX_FILENAME)
+    with open(index_filename + ".tmp", "w") as fileobj:
+        json.dump(index, fileobj, indent=4)
+        fileobj.flush()
+        os.fsync(fileobj.fileno())
+    os.replace(index_filename + ".tmp", index_filename)
+    return len(index)
+
+
+class ShardedJSONDataManager(JSONDataManager):
+    def __init__(self, directory):
+        """
+        Initialize a new instance of the ShardedJSONDataManager class.
+        :param directory: Data directory, created with an empty users index if needed.
+                          See shard_json_file to convert an existing data file.
+        """
+        super().__init__(directory)
+        self.index_filename = os.path.join(directory, INDEX_FILENAME)
+        self._shard_signatures = {}
+        self._file_locks = {}
+        self._generation = time.time_ns()
+        os.makedirs(os.path.join(directory, LOCK_DIRECTORY), exist_ok=True)
+        if not os.path.exists(self.index_filename):
+            with self._locked("index"):
+                if not os.path.exists(self.index_filename):
+                    self._write_atomic("[]", self.index_filename)
+
+    def _shard_path(self, user_id):
+        return os.path.join(self.filename, f"{int(user_id)}.json")
+
+    @contextlib.contextmanager
+    def _locked(self, name):
+        """
+        Hold the lock of a shard ("user-<id>") or of the index ("index"), across threads and processes.
+        """
+        with self._lock:
+            thread_lock = self._file_locks.setdefault(name, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.filename, LOCK_DIRECTORY, f"{name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _forget_user(self, user_id):
+        user = self._users_by_id.pop(user_id)
+        for movie in user.get('movies', []):
+            self._pop_movie((user_id, movie['movie_id']))
+        self._shard_signatures.pop(user_id, None)
+        self._sorted_user_ids = None
+        self._bump(f"user:{user_id}", "recommendations")
+
+    def _load(self, force=False):
+        """
+        Make sure the users in memory match the index, re-reading it only if it changed.
+        Users start without a "movies" key until their shard is loaded, see _load_user.
+        :param force: Re-read the index even if its signature did not change, as writers do under its lock.
+        """
+        with self._lock:
+            signature = self._stat(self.index_filename)
+            if signature == self._signature and not force:
+                return
+            entries = {entry['id']: entry for entry in _read_json(self.index_filename) or []}
+            changed = entries.keys() != self._users_by_id.keys()
+            for user_id in [user_id for user_id in self._users_by_id if user_id not in entries]:
+                self._forget_user(user_id)
+            for user_id, entry in entries.items():
+                user = self._users_by_id.setdefault(user_id, {"id": user_id})
+                changed = changed or user.get('name') != entry.get('name')
+                user['name'] = entry.get('name')
+            self._sorted_user_ids = None
+            if changed and self._signature is not None:
+                self._bump("users")
+            self._signature = signature
+
+    def _load_user(self, user_id, force=False):
+        """
+        Make sure one user's movies are loaded and match their shard, re-reading it only if it changed.
+        :param force: Re-read the shard even if its signature did not change, as writers do under its
+                      lock: two writes within the file system's timestamp resolution can look the same.
+        """
+        with self._lock:
+            self._load()
+            user = self._users_by_id.get(user_id)
+            if user is None:
+                return
+            path = self._shard_path(user_id)
+            signature = self._stat(path)
+            loaded = 'movies' in user
+            if loaded and signature == self._shard_signatures.get(user_id) and not force:
+                return
+            shard = _read_json(path)
+            if shard is None and force:
+                # Deleted by another process, which is about to remove it from the index.
+                self._forget_user(user_id)
+                return
+            movies = (shard or {}).get('movies', [])
+            self._shard_signatures[user_id] = signature
+            if loaded and movies == user['movies']:
+                return
+            for movie in user.get('movies', []):
+                self._pop_movie((user_id, movie['movie_id']))
+            user['movies'] = movies
+            for movie in movies:
+                self._put_movie((user_id, movie['movie_id']), movie)
+            if loaded:
+                # Changed by another process.
+                self._bump(f"user:{user_id}", "recommendations")
+
+    def _load_all(self):
+        with self._lock:
+            self._load()
+            for user_id in list(self._users_by_id):
+                self._load_user(user_id)
+
+    def _commit(self, record):
+        """
+        Apply a mutation and rewrite only the files it touches: the user's shard, and the index when
+        users are added, renamed or deleted. Both are re-read under their locks first, so changes made
+        by other processes in the meantime are kept.
+        """
+        op = record['op']
+        changes_index = op in ('add_user', 'delete_user', 'update_user')
+        with self._locked("index") if changes_index else contextlib.nullcontext():
+            if op == 'add_user':
+                with self._lock:
+                    self._load(force=True)
+                    if record['user']['id'] in self._users_by_id:
+                        # Another process took this id since it was generated.
+                        record['user'] = {**record['user'], "id": max(self._users_by_id) + 1}
+            user_id = record['user']['id'] if op == 'add_user' else record['user_id']
+            path = self._shard_path(user_id)
+            with self._locked(f"user-{user_id}"):
+                with self._lock:
+                    if changes_index:
+                        self._load(force=True)
+                    self._load_user(user_id, force=True)
+                    if op != 'add_user' and user_id not in self._users_by_id:
+                        # Deleted by another process, there is nothing left to change.
+                        return
+                    self._number_movies(record)
+                    self._apply(record)
+                    user = self._users_by_id.get(user_id)
+                    shard = json.dumps(user, indent=4) if user is not None else None
+                    index = (json.dumps([_index_entry(entry) for entry in self._users_by_id.values()], indent=4)
+                             if changes_index else None)
+                try:
+                    if shard is None:
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(path)
+                    else:
+                        self._write_atomic(shard, path)
+                    if index is not None:
+                        self._write_atomic(index, self.index_filename)
+                    with self._lock:
+                        self._shard_signatures[user_id] = self._stat(path)
+                        if index is not None:
+                            self._signature = self._stat(self.index_filename)
+                except IOError as error:
+                    # Whatever ended up on disk is the truth now, re-read it on the next access.
+                    with self._lock:
+                        self._shard_signatures.pop(user_id, None)
+                        self._signature = None
+                    logger.error(f"Error writing the JSON shards: {error}")
+                with self._lock:
+                    self._bump(*self._record_scopes(record))
+
+    def get_all_users(self, after=None, before=None, limit=None):
+        """
+        Return all the users, or one page of them ordered by id, as index entries: {"id": ..., "name": ...}
+        without "movies", whether or not their shard is loaded, so listing users never reads a shard.
+        Use get_user_movie for a user's movies.
+        """
+        return [_index_entry(user) for user in super().get_all_users(after=after, before=before, limit=limit)]
+
+    def compact(self, background=False):
+        """
+        There is no journal to fold, every write already replaces its shard.
+        """
+
+    def update_json(self, new_file, rebuild_index=True):
+        """
+        Replace the whole data set with a list of users, one shard each.
+        :param new_file: list of user dictionaries in the single-file format.
+        :param rebuild_index: Unused, the users are always re-read from the new files.
+        """
+        try:
+            with self._locked("index"):
+                old_ids = {entry['id'] for entry in _read_json(self.index_filename) or []}
+                for user in new_file:
+                    self._write_atomic(json.dumps(user, indent=4), self._shard_path(user['id']))
+                self._write_atomic(json.dumps([_index_entry(user) for user in new_file], indent=4),
+                                   self.index_filename)
+                for user_id in old_ids - {user['id'] for user in new_file}:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(self._shard_path(user_id))
+        except IOError as error:
+            logger.error(f"Error writing the JSON shards: {error}")
+        with self._lock:
+            self._build_index([])
+            self._shard_signatures = {}
+            self._signature = None
+            self._generation = time.time_ns()
+            self._versions = {}
+
+    def iter_movies(self, user_id=None, batch_size=1000):
+        """
+        Stream the movies of one user, or of everyone, in index order, in the same shape as
+        JSONDataManager.iter_movies. Shards that are not loaded are read from disk without being kept,
+        so exporting everything never loads the whole data set.
+        :param user_id: Only export this user's movies, or everyone's if None.
+        :param batch_size: Unused, for compatibility with SQLiteDataManager.
+        :return: generator of dictionaries.
+        """
+        with self._lock:
+            self._load()
+            user_ids = list(self._users_by_id) if user_id is None else [user_id]
+        for exported_id in user_ids:
+            with self._lock:
+                user = self._users_by_id.get(exported_id)
+                if user is None:
+                    continue
+                loaded = 'movies' in user
+                if loaded:
+                    self._load_user(exported_id)
+                    rows = list(self._movie_rows(user))
+            if not loaded:
+                shard = _read_json(self._shard_path(exported_id)) or {}
+                rows = list(self._movie_rows({**shard, "id": exported_id, "name": user.get('name')}))
+            yield from rows
@@ -1,8 +1,213 @@
-import requests
+import json
+import logging
+from sqlalchemy import insert, func, text, delete, update, select, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
 from .data_manager_interface import DataManagerInterface
-from Moviweb_app.models.data_models import User, Movie, Review
+from .omdb_client import omdb_client
+from .search_index import fts_query, highlight, MARK_START, MARK_END
+from .user_stats import stat_deltas, summarize, same_aggregate, TOP_DIRECTORS
+from .batch import BATCH_OPERATIONS, check_operations, operation_runs, latest_ratings
+from . import recommender
+from Moviweb_app.models.data_models import (User, Movie, Review, DataVersion, UserStat, CatalogMovie, MovieNeighbor,
+                                            NeighborQueue)
+from Moviweb_app.models.migrations import REBUILD_SEARCH_INDEX, USER_STATS_SELECT, LIBRARY_MOVIES
 
-API_KEY = 79153533
+logger = logging.getLogger(__name__)
+
+# Titles weigh more than directors in the ranking. bm25() is lower for better matches.
+SEARCH_SQL = text("""
+    SELECT * FROM (
+        SELECT 'movie' AS kind, Movie.user_id, Movie.movie_id, NULL AS review_id,
+               CatalogMovie.title, CatalogMovie.director,
+               highlight(movie_fts, 0, :mark_start, :mark_end) ||
+               coalesce(' - ' || highlight(movie_fts, 1, :mark_start, :mark_end), '') AS snippet,
+               bm25(movie_fts, 10.0, 5.0) AS score
+        FROM movie_fts
+        JOIN CatalogMovie ON CatalogMovie.catalog_id = movie_fts.rowid
+        JOIN Movie ON Movie.catalog_id = CatalogMovie.catalog_id
+        WHERE movie_fts MATCH :query AND (:user_id IS NULL OR Movie.user_id = :user_id)
+        ORDER BY score LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'review' AS kind, Review.user_id, Review.movie_id, Review.review_id,
+               CatalogMovie.title, CatalogMovie.director,
+               snippet(review_fts, 0, :mark_start, :mark_end, '…', 16) AS snippet,
+               bm25(review_fts) AS score
+        FROM review_fts
+        JOIN Review ON Review.review_id = review_fts.rowid
+        JOIN Movie ON Movie.movie_id = Review.movie_id
+        JOIN CatalogMovie ON CatalogMovie.catalog_id = Movie.catalog_id
+        WHERE review_fts MATCH :query AND (:user_id IS NULL OR Review.user_id = :user_id)
+        ORDER BY score LIMIT :limit
+    )
+    ORDER BY score LIMIT :limit
+""")
+
+# Batches pass their ids and values as a single JSON array parameter, read back with json_each, so each
+# run is one statement whatever its size and never hits SQLite's limit on bound variables.
+BATCH_MOVIES_SQL = text("""
+    SELECT Movie.movie_id, Movie.catalog_id, Movie.rating,
+           CatalogMovie.title, CatalogMovie.director, CatalogMovie.year
+    FROM Movie JOIN CatalogMovie ON CatalogMovie.catalog_id = Movie.catalog_id
+    WHERE Movie.user_id = :user_id AND Movie.movie_id IN (SELECT value FROM json_each(:movie_ids))
+""")
+DELETE_BATCH_MOVIE_REVIEWS = text("""
+    DELETE FROM Review WHERE user_id = :user_id AND movie_id IN (SELECT value FROM json_each(:movie_ids))
+""")
+DELETE_BATCH_MOVIES = text("""
+    DELETE FROM Movie WHERE user_id = :user_id AND movie_id IN (SELECT value FROM json_each(:movie_ids))
+""")
+# Materialized first, so each change is a primary key lookup instead of a scan of the user's movies.
+UPDATE_BATCH_RATINGS = text("""
+    WITH changes (movie_id, rating) AS MATERIALIZED (
+        SELECT json_extract(value, '$.movie_id'), json_extract(value, '$.rating') FROM json_each(:ratings)
+    )
+    UPDATE Movie SET rating = changes.rating FROM changes
+    WHERE Movie.movie_id = changes.movie_id AND Movie.user_id = :user_id
+""")
+# Reviews are only added to movies the user still has, in batch order.
+INSERT_BATCH_REVIEWS = text("""
+    INSERT INTO Review (user_id, movie_id, review)
+    SELECT Movie.user_id, Movie.movie_id, json_extract(reviews.value, '$.review')
+    FROM json_each(:reviews) AS reviews
+    JOIN Movie ON Movie.movie_id = json_extract(reviews.value, '$.movie_id') AND Movie.user_id = :user_id
+    ORDER BY reviews.key
+""")
+DELETE_BATCH_REVIEWS = text("""
+    DELETE FROM Review WHERE user_id = :user_id AND review_id IN (SELECT value FROM json_each(:review_ids))
+""")
+
+# A deleted user's movies leave the recommendations, their neighbour lists need a refresh.
+QUEUE_USER_NEIGHBORS = text("""
+    INSERT INTO NeighborQueue (catalog_id, version)
+    SELECT DISTINCT catalog_id, 1 FROM Movie WHERE user_id = :user_id
+    ON CONFLICT (catalog_id) DO UPDATE SET version = NeighborQueue.version + 1
+""")
+# ON DELETE CASCADE would remove the children too, deleting them first keeps the result the same on
+# connections without foreign key enforcement. Every statement is covered by a user_id index.
+DELETE_USER_SQL = [
+    text("DELETE FROM Review WHERE user_id = :user_id"),
+    text("DELETE FROM Movie WHERE user_id = :user_id"),
+    text("DELETE FROM UserStat WHERE user_id = :user_id"),
+    text('DELETE FROM "User" WHERE id = :user_id'),
+]
+
+# Rows left behind by deletes that ran before the foreign keys cascaded, in the order they are removed:
+# each step can orphan rows of the next ones, never of the previous ones.
+MISSING_USER = 'NOT EXISTS (SELECT 1 FROM "User" WHERE "User".id = {table}.user_id)'
+ORPHANS = [
+    ("reviews", "Review", MISSING_USER.format(table="Review") + """ OR NOT EXISTS (
+        SELECT 1 FROM Movie JOIN "User" ON "User".id = Movie.user_id WHERE Movie.movie_id = Review.movie_id)"""),
+    ("movies", "Movie", MISSING_USER.format(table="Movie")),
+    ("user_stats", "UserStat", MISSING_USER.format(table="UserStat")),
+    ("neighbors", "MovieNeighbor", """
+        NOT EXISTS (SELECT 1 FROM Movie WHERE Movie.catalog_id = MovieNeighbor.catalog_id)
+        OR NOT EXISTS (SELECT 1 FROM Movie WHERE Movie.catalog_id = MovieNeighbor.neighbor_id)"""),
+    ("catalog_movies", "CatalogMovie",
+     "NOT EXISTS (SELECT 1 FROM Movie WHERE Movie.catalog_id = CatalogMovie.catalog_id)"),
+    ("queued_neighbors", "NeighborQueue",
+     "NOT EXISTS (SELECT 1 FROM CatalogMovie WHERE CatalogMovie.catalog_id = NeighborQueue.catalog_id)"),
+]
+# The users still there whose reviews are removed, their pages change.
+ORPHAN_REVIEW_USERS = text(f"""
+    SELECT DISTINCT user_id FROM Review WHERE ({ORPHANS[0][2]}) AND NOT ({MISSING_USER.format(table="Review")})
+""")
+# The catalog movies of removed movies may still be in other libraries, their neighbour lists need a refresh.
+QUEUE_ORPHAN_NEIGHBORS = text(f"""
+    INSERT INTO NeighborQueue (catalog_id, version)
+    SELECT DISTINCT catalog_id, 1 FROM Movie WHERE {MISSING_USER.format(table="Movie")}
+    ON CONFLICT (catalog_id) DO UPDATE SET version = NeighborQueue.version + 1
+""")
+
+# A full rebuild is cheaper than refreshing this many queued movies one at a time.
+REBUILD_THRESHOLD = 200
+
+# Sum the neighbour scores of the user's recent movies, leaving out the movies they already have.
+RECOMMENDATIONS_SQL = text("""
+    WITH recent AS (
+        SELECT DISTINCT catalog_id FROM (
+            SELECT catalog_id FROM Movie WHERE user_id = :user_id ORDER BY movie_id DESC LIMIT :recent
+        )
+    )
+    SELECT CatalogMovie.catalog_id, CatalogMovie.title, CatalogMovie.director, CatalogMovie.year,
+           CatalogMovie.imdb_id, CatalogMovie.poster, CatalogMovie.poster_hash, sum(MovieNeighbor.score) AS score
+    FROM recent
+    JOIN MovieNeighbor ON MovieNeighbor.catalog_id = recent.catalog_id
+    JOIN CatalogMovie ON CatalogMovie.catalog_id = MovieNeighbor.neighbor_id
+    WHERE MovieNeighbor.neighbor_id NOT IN (SELECT catalog_id FROM Movie WHERE user_id = :user_id)
+    GROUP BY MovieNeighbor.neighbor_id
+    ORDER BY score DESC, MovieNeighbor.neighbor_id LIMIT :limit
+""")
+
+SIMILAR_MOVIES_SQL = text("""
+    SELECT CatalogMovie.catalog_id, CatalogMovie.title, CatalogMovie.director, CatalogMovie.year,
+           CatalogMovie.imdb_id, CatalogMovie.poster, CatalogMovie.poster_hash,
+           MovieNeighbor.co_count, MovieNeighbor.score
+    FROM MovieNeighbor JOIN CatalogMovie ON CatalogMovie.catalog_id = MovieNeighbor.neighbor_id
+    WHERE MovieNeighbor.catalog_id = :catalog_id
+    ORDER BY MovieNeighbor.score DESC, MovieNeighbor.neighbor_id LIMIT :limit
+""")
+
+# How many libraries hold each catalog movie, one scan of the (catalog_id, user_id) index.
+OWNER_COUNTS_SQL = text("SELECT catalog_id, count(DISTINCT user_id) FROM Movie GROUP BY catalog_id")
+
+# For one catalog movie: every movie sharing a library with it, and in how many libraries.
+CO_COUNTS_SQL = text("""
+    SELECT other.catalog_id, count(DISTINCT other.user_id) AS co_count
+    FROM (SELECT DISTINCT user_id FROM Movie WHERE catalog_id = :catalog_id) AS owners
+    JOIN Movie AS other ON other.user_id = owners.user_id
+    WHERE other.catalog_id != :catalog_id
+    GROUP BY other.catalog_id
+""")
+
+INSERT_NEIGHBOR = text("""
+    INSERT INTO MovieNeighbor (catalog_id, neighbor_id, co_count, score)
+    VALUES (:catalog_id, :neighbor_id, :co_count, :score)
+""")
+
+# Movies changed again since they were read from the queue keep their entry.
+DEQUEUE_NEIGHBORS = text("DELETE FROM NeighborQueue WHERE catalog_id = :catalog_id AND version = :version")
+
+# After a movie's scores changed: it enters the lists of the movies it now beats (or that have room),
+# then those lists are cut back to their top k.
+ENTER_NEIGHBOR_LISTS = text("""
+    INSERT INTO MovieNeighbor (catalog_id, neighbor_id, co_count, score)
+    SELECT candidate.catalog_id, :catalog_id, candidate.co_count, candidate.score
+    FROM neighbor_candidates AS candidate
+    WHERE (SELECT count(*) FROM MovieNeighbor WHERE MovieNeighbor.catalog_id = candidate.catalog_id) < :k
+       OR candidate.score >= (SELECT min(score) FROM MovieNeighbor
+                              WHERE MovieNeighbor.catalog_id = candidate.catalog_id)
+""")
+TRIM_NEIGHBOR_LISTS = text("""
+    DELETE FROM MovieNeighbor WHERE rowid IN (
+        SELECT rowid FROM (
+            SELECT MovieNeighbor.rowid, row_number() OVER (
+                PARTITION BY MovieNeighbor.catalog_id ORDER BY MovieNeighbor.score DESC, MovieNeighbor.neighbor_id
+            ) AS rank
+            FROM MovieNeighbor
+            WHERE MovieNeighbor.catalog_id IN (SELECT catalog_id FROM MovieNeighbor WHERE neighbor_id = :catalog_id)
+        ) WHERE rank > :k
+    )
+""")
+
+# session.info key of the scopes changed in the current transaction, data manager -> list of scopes.
+PENDING_SCOPES = "moviweb_pending_scopes"
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    """
+    Notify the listeners of the scopes a transaction changed, once it is committed.
+    """
+    for data_manager, scopes in session.info.pop(PENDING_SCOPES, {}).items():
+        data_manager._notify(*dict.fromkeys(scopes))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_SCOPES, None)
 
 
 class SQLiteDataManager(DataManagerInterface):
@@ -12,31 +217,494 @@ class SQLiteDataManager(DataManagerInterface):
         :param db:
         """
         self.db = db
+        self._listeners = []
+
+    @staticmethod
+    def _keyset(query, column, after=None, before=None, limit=None):
+        """
+        Apply keyset pagination on an indexed column: rows after `after`, or the last rows
+        before `before`, at most `limit` of them, always returned in ascending order.
+        """
+        if after is not None:
+            query = query.filter(column > after)
+        if before is not None:
+            query = query.filter(column < before).order_by(column.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            return list(reversed(query.all()))
+        query = query.order_by(column)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def add_listener(self, callback):
+        """
+        Register a callable notified with the changed scopes ("users", "user:<id>") after every committed write.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, *scopes):
+        for callback in self._listeners:
+            callback(*scopes)
+
+    def _bump_version(self, *scopes):
+        """
+        Increment the DataVersion counters of the given scopes in the current transaction.
+        The listeners are notified once it is committed, and never if it is rolled back.
+        """
+        for scope in scopes:
+            statement = sqlite_insert(DataVersion).values(scope=scope, version=1)
+            self.db.session.execute(statement.on_conflict_do_update(
+                index_elements=[DataVersion.scope], set_={"version": DataVersion.version + 1}
+            ))
+        self.db.session.info.setdefault(PENDING_SCOPES, {}).setdefault(self, []).extend(scopes)
 
-    def get_all_users(self):
+    def _adjust_stats(self, user_id, removed=(), added=()):
+        """
+        Apply the UserStat changes of removing and adding some movies, in the current transaction.
+        :param removed: movie dictionaries leaving the user's library (or their values before an update).
+        :param added: movie dictionaries entering it.
+        """
+        deltas = stat_deltas(removed, sign=-1)
+        for bucket, (count, rated_count, rating_sum) in stat_deltas(added).items():
+            delta = deltas.setdefault(bucket, [0, 0, 0.0])
+            delta[0] += count
+            delta[1] += rated_count
+            delta[2] += rating_sum
+        rows = [
+            {"user_id": user_id, "dimension": dimension, "key": key,
+             "count": count, "rated_count": rated_count, "rating_sum": rating_sum}
+            for (dimension, key), (count, rated_count, rating_sum) in deltas.items()
+            if count or rated_count or rating_sum
+        ]
+        if not rows:
+            return
+        statement = sqlite_insert(UserStat)
+        self.db.session.execute(statement.on_conflict_do_update(
+            index_elements=[UserStat.user_id, UserStat.dimension, UserStat.key],
+            set_={
+                "count": UserStat.count + statement.excluded.count,
+                "rated_count": UserStat.rated_count + statement.excluded.rated_count,
+                "rating_sum": UserStat.rating_sum + statement.excluded.rating_sum,
+            }
+        ), rows)
+        if any(row["count"] < 0 for row in rows):
+            self.db.session.execute(delete(UserStat).where(
+                UserStat.user_id == user_id, UserStat.count <= 0
+            ))
+
+    def _queue_neighbors(self, catalog_ids):
+        """
+        Queue the catalog movies whose neighbour lists a library change made stale, in the current transaction.
+        """
+        rows = [{"catalog_id": catalog_id, "version": 1} for catalog_id in set(catalog_ids)]
+        if not rows:
+            return
+        statement = sqlite_insert(NeighborQueue)
+        self.db.session.execute(statement.on_conflict_do_update(
+            index_elements=[NeighborQueue.catalog_id], set_={"version": NeighborQueue.version + 1}
+        ), rows)
+
+    def get_user_stats(self, user_id):
+        """
+        Read the user's statistics from the UserStat summary table, without touching their movies.
+        :param user_id:
+        :return: dictionary with the movie count, average rating, rating histogram, top directors
+                 and movies per decade.
+        """
+        try:
+            rows = self.db.session.query(UserStat).filter(
+                UserStat.user_id == user_id, UserStat.dimension != "director"
+            ).all()
+            directors = (self.db.session.query(UserStat)
+                         .filter(UserStat.user_id == user_id, UserStat.dimension == "director")
+                         .order_by(UserStat.count.desc(), UserStat.key.desc())
+                         .limit(TOP_DIRECTORS).all())
+            aggregate = {(row.dimension, row.key): [row.count, row.rated_count, row.rating_sum] for row in rows}
+            return summarize(aggregate, [(row.key, [row.count, row.rated_count, row.rating_sum])
+                                         for row in directors])
+        except Exception as e:
+            logger.error(f"Error retrieving the user's stats from the database: {e}")
+            return None
+
+    def check_user_stats(self, user_id=None, repair=False):
+        """
+        Recompute the UserStat aggregates from the Movie table and compare them with the stored ones.
+        :param user_id: Only check this user, or everyone if None.
+        :param repair: Replace the stored aggregates of the users that drifted.
+        :return: the ids of the users whose stored aggregates did not match.
+        """
+        params = {} if user_id is None else {"user_id": user_id}
+        user_filter = "1" if user_id is None else "user_id = :user_id"
+        expected, stored = {}, {}
+        statement = text(USER_STATS_SELECT.format(movies=LIBRARY_MOVIES, user_filter=user_filter))
+        for row in self.db.session.execute(statement, params):
+            expected.setdefault(row.user_id, {})[(row.dimension, row.key)] = [
+                row.count, row.rated_count, row.rating_sum]
+        query = self.db.session.query(UserStat)
+        if user_id is not None:
+            query = query.filter(UserStat.user_id == user_id)
+        for row in query:
+            stored.setdefault(row.user_id, {})[(row.dimension, row.key)] = [
+                row.count, row.rated_count, row.rating_sum]
+
+        drifted = sorted(
+            drifted_id for drifted_id in expected.keys() | stored.keys()
+            if not same_aggregate(stored.get(drifted_id, {}), expected.get(drifted_id, {}))
+        )
+        if repair and drifted:
+            try:
+                self.db.session.execute(delete(UserStat).where(UserStat.user_id.in_(drifted)))
+                self.db.session.execute(insert(UserStat), [
+                    {"user_id": drifted_id, "dimension": dimension, "key": key,
+                     "count": count, "rated_count": rated_count, "rating_sum": rating_sum}
+                    for drifted_id in drifted
+                    for (dimension, key), (count, rated_count, rating_sum) in expected.get(drifted_id, {}).items()
+                ])
+                self._bump_version(*(f"user:{drifted_id}" for drifted_id in drifted))
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                logger.error(f"Error repairing the user stats: {e}")
+        return drifted
+
+    def clean_orphans(self, dry_run=False):
+        """
+        Delete the rows whose parent is gone, e.g. left by deletes that ran before the foreign keys cascaded:
+        reviews of deleted movies or users, movies and stats of deleted users, and the catalog movies no
+        library holds any more with their neighbour lists and queue entries. One set-based DELETE per table.
+        :param dry_run: Only count them, everything is rolled back.
+        :return: dictionary of kind -> number of rows deleted, or None if the transaction was rolled back.
+        """
+        try:
+            user_ids = self.db.session.scalars(ORPHAN_REVIEW_USERS).all()
+            self.db.session.execute(QUEUE_ORPHAN_NEIGHBORS)
+            counts = {name: self.db.session.execute(text(f'DELETE FROM "{table}" WHERE {condition}')).rowcount
+                      for name, table, condition in ORPHANS}
+            if dry_run:
+                self.db.session.rollback()
+                return counts
+            scopes = [f"user:{user_id}" for user_id in user_ids]
+            if counts["neighbors"]:
+                scopes.append("recommendations")
+            self._bump_version(*scopes)
+            self.db.session.commit()
+            return counts
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error deleting the orphaned rows: {e}")
+            return None
+
+    def get_data_version(self, user_id=None, scope=None):
+        """
+        Return the version of the users list, or of everything belonging to one user.
+        It changes on every write, so it can be used for ETags and cache keys without loading any rows.
+        :param user_id:
+        :param scope: Another scope instead, e.g. "recommendations", bumped whenever neighbour lists change.
+        :return:
+        """
+        scope = scope or ("users" if user_id is None else f"user:{user_id}")
+        try:
+            version = self.db.session.get(DataVersion, scope)
+            return version.version if version else 0
+        except Exception as e:
+            logger.error(f"Error retrieving the data version from the database: {e}")
+            return None
+
+    def get_all_users(self, after=None, before=None, limit=None):
         """
         Retrieve a list of all the Users from the Database.
+        :param after: Only return users with an id greater than this one.
+        :param before: Only return users with an id smaller than this one.
+        :param limit: Maximum number of users to return.
         :return:
         """
         try:
-            return User.query.all()
+            return self._keyset(User.query, User.id, after, before, limit)
         except Exception as e:
-            print(f"Error retrieving users from the database: {e}")
+            logger.error(f"Error retrieving users from the database: {e}")
             return []
 
-    def get_user_movie(self, user_id):
+    def get_user_movie(self, user_id, after=None, before=None, limit=None):
         """
         Retrieve a list of movies for a specific User
         :param user_id:
+        :param after: Only return movies with a movie_id greater than this one.
+        :param before: Only return movies with a movie_id smaller than this one.
+        :param limit: Maximum number of movies to return.
         :return:
         """
         try:
-            movies = self.db.session.query(Movie).filter(Movie.user_id == user_id).all()
+            query = self.db.session.query(Movie).filter(Movie.user_id == user_id)
+            movies = self._keyset(query, Movie.movie_id, after, before, limit)
             return movies
         except Exception as e:
-            print(f"Error retrieving movies for user from the database: {e}")
+            logger.error(f"Error retrieving movies for user from the database: {e}")
+            return []
+
+    def get_user_library(self, user_id, after=None, before=None, limit=None):
+        """
+        Retrieve the user's name and a page of their movies with the number of reviews of each,
+        in two statements whatever the size of the library.
+        :param user_id:
+        :return: (user_name, list of movie dictionaries with a "review_count" key)
+        """
+        try:
+            user_name = self.db.session.query(User.name).filter(User.id == user_id).scalar()
+            review_counts = (
+                self.db.session.query(Review.movie_id, func.count(Review.review_id).label('review_count'))
+                .filter(Review.user_id == user_id)
+                .group_by(Review.movie_id)
+                .subquery()
+            )
+            query = (
+                self.db.session.query(Movie, func.coalesce(review_counts.c.review_count, 0))
+                .outerjoin(review_counts, review_counts.c.movie_id == Movie.movie_id)
+                .filter(Movie.user_id == user_id)
+            )
+            rows = self._keyset(query, Movie.movie_id, after, before, limit)
+            return user_name, [{**movie.to_dict(), "review_count": review_count} for movie, review_count in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving the library of the user from the database: {e}")
+            return None, []
+
+    def search(self, query, user_id=None, limit=20):
+        """
+        Ranked full-text search over movie titles, directors and reviews, using the FTS5 indexes.
+        Every word must match, the last one as a prefix.
+        :param query: Text typed by the user, it is never passed to FTS5 as is.
+        :param user_id: Only search this user's movies and reviews, or everyone's if None.
+        :param limit: Maximum number of results.
+        :return: list of dictionaries, "snippet" holds the matching text with <mark> tags around the matches.
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        try:
+            rows = self.db.session.execute(SEARCH_SQL, {
+                "query": match, "user_id": user_id, "limit": limit,
+                "mark_start": MARK_START, "mark_end": MARK_END,
+            }).mappings().all()
+            return [{**row, "snippet": highlight(row["snippet"])} for row in rows]
+        except Exception as e:
+            logger.error(f"Error searching the database: {e}")
+            return []
+
+    def _stream(self, statement, what, batch_size):
+        """
+        Run a SELECT and yield its rows as dictionaries, fetched batch_size at a time from a
+        server-side cursor instead of all at once.
+        """
+        try:
+            result = self.db.session.execute(statement, execution_options={"yield_per": batch_size})
+            for row in result.mappings():
+                yield dict(row)
+        except Exception as e:
+            logger.error(f"Error exporting {what} from the database: {e}")
+            # A truncated export must not look complete.
+            raise
+
+    def iter_movies(self, user_id=None, batch_size=1000):
+        """
+        Stream the movies of one user, or of everyone, ordered by user and movie id.
+        :param user_id: Only export this user's movies, or everyone's if None.
+        :param batch_size: Rows fetched from the cursor at a time.
+        :return: generator of dictionaries with the user's id and name and the movie's fields.
+        """
+        statement = (
+            select(Movie.user_id, User.name.label('user_name'), Movie.movie_id, CatalogMovie.title,
+                   CatalogMovie.director, CatalogMovie.year, Movie.rating, CatalogMovie.imdb_id, CatalogMovie.poster)
+            .join(User, User.id == Movie.user_id)
+            .join(CatalogMovie, CatalogMovie.catalog_id == Movie.catalog_id)
+            .order_by(Movie.user_id, Movie.movie_id)
+        )
+        if user_id is not None:
+            statement = statement.where(Movie.user_id == user_id)
+        return self._stream(statement, "movies", batch_size)
+
+    def iter_reviews(self, user_id=None, batch_size=1000):
+        """
+        Stream the reviews of one user, or of everyone, ordered by user, movie and review id.
+        :param user_id: Only export this user's reviews, or everyone's if None.
+        :param batch_size: Rows fetched from the cursor at a time.
+        :return: generator of dictionaries with the review and the title of its movie.
+        """
+        statement = (
+            select(Review.user_id, Review.movie_id, Review.review_id, CatalogMovie.title, Review.review)
+            .join(Movie, Movie.movie_id == Review.movie_id)
+            .join(CatalogMovie, CatalogMovie.catalog_id == Movie.catalog_id)
+            .order_by(Review.user_id, Review.movie_id, Review.review_id)
+        )
+        if user_id is not None:
+            statement = statement.where(Review.user_id == user_id)
+        return self._stream(statement, "reviews", batch_size)
+
+    def get_recommendations(self, user_id, limit=12):
+        """
+        Recommend movies saved by the users who saved the same movies as this user, from the
+        persisted neighbour lists of their most recent movies.
+        :param user_id:
+        :param limit: Maximum number of movies.
+        :return: list of catalog movie dictionaries with a "score", best first.
+        """
+        try:
+            rows = self.db.session.execute(RECOMMENDATIONS_SQL, {
+                "user_id": user_id, "recent": recommender.RECENT_MOVIES, "limit": limit
+            }).mappings().all()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving recommendations from the database: {e}")
             return []
 
+    def get_similar_movies(self, user_id, movie_id, limit=recommender.TOP_K):
+        """
+        Return the movies most often saved together with one of the user's movies.
+        :param user_id:
+        :param movie_id:
+        :param limit: Maximum number of movies.
+        :return: list of catalog movie dictionaries with a "co_count" and a "score", None if the user
+                 has no such movie.
+        """
+        try:
+            catalog_id = self.db.session.scalar(select(Movie.catalog_id).where(
+                Movie.user_id == user_id, Movie.movie_id == movie_id
+            ))
+            if catalog_id is None:
+                return None
+            rows = self.db.session.execute(SIMILAR_MOVIES_SQL, {
+                "catalog_id": catalog_id, "limit": limit
+            }).mappings().all()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving similar movies from the database: {e}")
+            return []
+
+    def rebuild_recommendations(self):
+        """
+        Recompute every neighbour list from scratch: the whole user x movie matrix is read at once and
+        multiplied with itself by blocks with SciPy, see recommender.item_neighbors.
+        Movies queued while this ran stay queued.
+        :return: the number of neighbour rows written, None if it failed or NumPy/SciPy are missing.
+        """
+        if not recommender.available():
+            return None
+        try:
+            queued = self.db.session.execute(select(NeighborQueue.catalog_id, NeighborQueue.version)).all()
+            pairs = self.db.session.execute(text("SELECT user_id, catalog_id FROM Movie")).all()
+            self.db.session.execute(delete(MovieNeighbor))
+            written = 0
+            if pairs:
+                # Much faster than np.array() on a list of rows.
+                pairs = recommender.np.fromiter((value for pair in pairs for value in pair),
+                                                dtype=recommender.np.int64, count=2 * len(pairs)).reshape(-1, 2)
+                matrix, items = recommender.library_matrix(pairs[:, 0], pairs[:, 1])
+                for rows, columns, co_counts, scores in recommender.item_neighbors(matrix):
+                    self.db.session.execute(INSERT_NEIGHBOR, [
+                        {"catalog_id": catalog_id, "neighbor_id": neighbor_id, "co_count": co_count, "score": score}
+                        for catalog_id, neighbor_id, co_count, score in zip(
+                            items[rows].tolist(), items[columns].tolist(), co_counts.tolist(), scores.tolist())
+                    ])
+                    written += len(rows)
+            if queued:
+                self.db.session.execute(DEQUEUE_NEIGHBORS, [{"catalog_id": catalog_id, "version": version}
+                                                            for catalog_id, version in queued])
+            self._bump_version("recommendations")
+            self.db.session.commit()
+            return written
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error rebuilding the recommendations: {e}")
+            return None
+
+    def _refresh_neighbors(self, catalog_id, owner_counts, k=recommender.TOP_K):
+        """
+        Recompute the neighbour list of one catalog movie, and its place in the lists of the movies it
+        shares a library with, in the current transaction. Only the pairs involving this movie changed,
+        so the lists stay exact except that a list the movie left may miss an entry until the next rebuild.
+        :param owner_counts: dictionary of catalog_id -> number of libraries holding it, see OWNER_COUNTS_SQL.
+        """
+        np = recommender.np
+        rows = self.db.session.execute(CO_COUNTS_SQL, {"catalog_id": catalog_id}).all()
+        self.db.session.execute(delete(MovieNeighbor).where(MovieNeighbor.catalog_id == catalog_id))
+        self.db.session.execute(delete(MovieNeighbor).where(MovieNeighbor.neighbor_id == catalog_id))
+        if not rows:
+            return
+        items, co_counts = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        # A movie first saved after the counts were read is queued again, its co-count will do until then.
+        owners = np.array([owner_counts.get(item, co_count) for item, co_count in rows], dtype=np.int64)
+        item_owners = self.db.session.scalar(
+            select(func.count(func.distinct(Movie.user_id))).where(Movie.catalog_id == catalog_id)
+        )
+        scores = recommender.neighbor_scores(co_counts, item_owners, owners)
+        top = np.lexsort((items, -scores))[:k]
+        self.db.session.execute(INSERT_NEIGHBOR, [
+            {"catalog_id": catalog_id, "neighbor_id": neighbor_id, "co_count": co_count, "score": score}
+            for neighbor_id, co_count, score in zip(items[top].tolist(), co_counts[top].tolist(),
+                                                    scores[top].tolist())
+        ])
+        self.db.session.execute(text(
+            "CREATE TEMP TABLE IF NOT EXISTS neighbor_candidates "
+            "(catalog_id INTEGER PRIMARY KEY, co_count INTEGER, score FLOAT)"
+        ))
+        self.db.session.execute(text("DELETE FROM neighbor_candidates"))
+        self.db.session.execute(
+            text("INSERT INTO neighbor_candidates (catalog_id, co_count, score) VALUES (:catalog_id, :co_count, :score)"),
+            [{"catalog_id": item, "co_count": co_count, "score": score}
+             for item, co_count, score in zip(items.tolist(), co_counts.tolist(), scores.tolist())]
+        )
+        self.db.session.execute(ENTER_NEIGHBOR_LISTS, {"catalog_id": catalog_id, "k": k})
+        self.db.session.execute(TRIM_NEIGHBOR_LISTS, {"catalog_id": catalog_id, "k": k})
+        self.db.session.execute(text("DELETE FROM neighbor_candidates"))
+
+    def refresh_recommendations(self, limit=100):
+        """
+        Bring the neighbour lists of queued movies up to date, one movie per transaction, or rebuild them
+        all when the queue is long or nothing was built yet.
+        :param limit: Maximum number of queued movies refreshed by this call.
+        :return: the number of movies refreshed, or of neighbour rows written by a rebuild. None if it
+                 failed or NumPy/SciPy are missing.
+        """
+        if not recommender.available():
+            return None
+        try:
+            queue_length = self.db.session.query(func.count(NeighborQueue.catalog_id)).scalar()
+            if not queue_length:
+                return 0
+            if queue_length > REBUILD_THRESHOLD or not self.db.session.query(MovieNeighbor.catalog_id).first():
+                return self.rebuild_recommendations()
+            queued = self.db.session.execute(
+                select(NeighborQueue.catalog_id, NeighborQueue.version).limit(limit)
+            ).all()
+            owner_counts = dict(self.db.session.execute(OWNER_COUNTS_SQL).all())
+            for catalog_id, version in queued:
+                self._refresh_neighbors(catalog_id, owner_counts)
+                self.db.session.execute(DEQUEUE_NEIGHBORS, {"catalog_id": catalog_id, "version": version})
+                self.db.session.commit()
+            self._bump_version("recommendations")
+            self.db.session.commit()
+            return len(queued)
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error refreshing the recommendations: {e}")
+            return None
+
+    def rebuild_search_index(self):
+        """
+        Rebuild the FTS5 indexes from the Movie and Review tables, e.g. after a bulk load with the
+        triggers disabled or if the indexes got out of sync.
+        :return:
+        """
+        try:
+            for statement in REBUILD_SEARCH_INDEX.split(";"):
+                if statement.strip():
+                    self.db.session.execute(text(statement))
+            self.db.session.commit()
+            return True
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error rebuilding the search index: {e}")
+            return False
+
     def add_user(self, new_user):
         """
         Add a new user in the database
@@ -45,25 +713,32 @@ class SQLiteDataManager(DataManagerInterface):
         """
         try:
             self.db.session.add(new_user)
+            self._bump_version("users")
             self.db.session.commit()
             return True
         except Exception as e:
-            print(f"Error adding a new user to the database: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error adding a new user to the database: {e}")
             return False
 
     def delete_user(self, user_id):
         """
-        Delete a user from the database
+        Delete a user from the database, with their movies, reviews and stats, in a few set-based
+        statements that never load them.
         :param user_id:
         :return:
         """
         try:
-            user = self.db.session.query(User).filter(User.id == user_id).first()
-            if user:
-                self.db.session.delete(user)
-                self.db.session.commit()
+            params = {"user_id": user_id}
+            self.db.session.execute(QUEUE_USER_NEIGHBORS, params)
+            for statement in DELETE_USER_SQL:
+                deleted = self.db.session.execute(statement, params).rowcount
+            if deleted:
+                self._bump_version("users", f"user:{user_id}")
+            self.db.session.commit()
         except Exception as e:
-            print(f"Error deleting user from the database: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error deleting user from the database: {e}")
 
     def update_user(self, user_id, new_name):
         """
@@ -76,9 +751,11 @@ class SQLiteDataManager(DataManagerInterface):
             user = self.db.session.query(User).filter(User.id == user_id).first()
             if user:
                 user.name = new_name
+                self._bump_version("users", f"user:{user_id}")
                 self.db.session.commit()
         except Exception as e:
-            print(f"Error updating user in the database: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error updating user in the database: {e}")
 
     @staticmethod
     def create_user_details(user_id, user_name):
@@ -104,7 +781,7 @@ class SQLiteDataManager(DataManagerInterface):
             else:
                 return None
         except Exception as e:
-            print(f"Error retrieving user name from the database: {e}")
+            logger.error(f"Error retrieving user name from the database: {e}")
 
     @staticmethod
     def generate_user_id(users):
@@ -125,51 +802,280 @@ class SQLiteDataManager(DataManagerInterface):
         """
         return None
 
+    def _catalog_ids(self, new_movies):
+        """
+        Find or create the CatalogMovie entries of some movie_info dictionaries, with a few set-based
+        statements whatever the number of movies. Entries are keyed by IMDb id when OMDb gave one,
+        an older entry with the same title, year and director is adopted instead of duplicated.
+        :param new_movies: list of movie_info dictionaries.
+        :return: the catalog_id of each movie, in the same order.
+        """
+        entries = []
+        for new_movie in new_movies:
+            year = Movie.parse_year(new_movie.get('year'))
+            title_key = CatalogMovie.make_key(new_movie.get('title'), year, new_movie.get('director'))
+            imdb_id = new_movie.get('imdb_id') or None
+            entries.append((CatalogMovie.make_key(None, None, None, imdb_id) if imdb_id else title_key, title_key, {
+                "imdb_id": imdb_id,
+                "title": new_movie.get('title'),
+                "year": year,
+                "director": new_movie.get('director'),
+                "imdb_rating": Movie.parse_rating(new_movie.get('rating')),
+                "poster": new_movie.get('poster'),
+                "poster_hash": new_movie.get('poster_hash')
+            }))
+
+        def find(keys):
+            return dict(self.db.session.query(CatalogMovie.catalog_key, CatalogMovie.catalog_id)
+                        .filter(CatalogMovie.catalog_key.in_(keys)).all())
+
+        found = find({key for key, _, _ in entries} | {title_key for _, title_key, _ in entries})
+        adopted = set()
+        for key, title_key, row in entries:
+            catalog_id = found.get(title_key)
+            if key not in found and catalog_id is not None and catalog_id not in adopted:
+                self.db.session.execute(update(CatalogMovie).where(CatalogMovie.catalog_id == catalog_id)
+                                        .values(catalog_key=key, imdb_id=row["imdb_id"]))
+                adopted.add(catalog_id)
+                found[key] = catalog_id
+        missing = {key: {**row, "catalog_key": key} for key, _, row in entries if key not in found}
+        if missing:
+            self.db.session.execute(
+                sqlite_insert(CatalogMovie).on_conflict_do_nothing(index_elements=[CatalogMovie.catalog_key]),
+                list(missing.values())
+            )
+            found.update(find(missing.keys()))
+        return [found[key] for key, _, _ in entries]
+
     def add_movie_for_user(self, user_id, new_movie):
         """
         Add a new movie for a user in the database.
+        :return: True if the movie was added, False if the transaction was rolled back, e.g. for an unknown user.
         """
 
         try:
             movie = Movie(
                 user_id=user_id,
-                title=new_movie['title'],
-                director=new_movie['director'],
-                year=new_movie['year'],
-                rating=new_movie['rating'],
-                poster=new_movie['poster']
+                catalog_id=self._catalog_ids([new_movie])[0],
+                rating=Movie.parse_rating(new_movie['rating'])
             )
             self.db.session.add(movie)
+            self._queue_neighbors([movie.catalog_id])
+            self._adjust_stats(user_id, added=[new_movie])
+            self._bump_version(f"user:{user_id}")
+            self.db.session.commit()
+            return True
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error adding a new movie for the user: {e}")
+            return False
+
+    def add_movies_for_user(self, user_id, new_movies):
+        """
+        Add many movies for a user with a single bulk INSERT in one transaction.
+        :param user_id:
+        :param new_movies: list of movie_info dictionaries as returned by movies_api.
+        :return: True if all the movies were added, False if the transaction was rolled back.
+        """
+        if not new_movies:
+            return True
+        try:
+            catalog_ids = self._catalog_ids(new_movies)
+            self.db.session.execute(insert(Movie), [
+                {"user_id": user_id, "catalog_id": catalog_id, "rating": Movie.parse_rating(new_movie['rating'])}
+                for catalog_id, new_movie in zip(catalog_ids, new_movies)
+            ])
+            self._queue_neighbors(catalog_ids)
+            self._adjust_stats(user_id, added=new_movies)
+            self._bump_version(f"user:{user_id}")
+            self.db.session.commit()
+            return True
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error adding movies for the user: {e}")
+            return False
+
+    def import_users(self, users, before_commit=None):
+        """
+        Insert whole users with their movies and reviews in one transaction, with bulk INSERTs.
+        User ids are kept. JSON movie ids are only unique per user, so a movie keeps its id when no
+        other movie took it yet and gets a new one otherwise. The users must not exist yet.
+        :param users: list of user dictionaries in JSONDataManager's format, optionally with a "reviews"
+                      list of {"movie_id", "review"} referring to the user's own movie ids.
+        :param before_commit: callable run with the returned counts in the same transaction just before
+                              the commit, e.g. to save a checkpoint.
+        :return: dictionary with the number of users, movies and reviews inserted and of renumbered movies.
+        """
+        try:
+            if users:
+                self.db.session.execute(insert(User), [{"id": user['id'], "name": user.get('name')}
+                                                       for user in users])
+            owned = [(user, movie) for user in users for movie in user.get('movies', [])]
+            catalog_ids = self._catalog_ids([movie for _, movie in owned]) if owned else []
+
+            wanted = {movie.get('movie_id') for _, movie in owned} - {None}
+            taken = set(self.db.session.scalars(select(Movie.movie_id).where(Movie.movie_id.in_(wanted))))
+            next_id = max([self.db.session.query(func.max(Movie.movie_id)).scalar() or 0, *wanted]) + 1
+            movie_rows, new_ids, renumbered = [], {}, 0
+            for (user, movie), catalog_id in zip(owned, catalog_ids):
+                movie_id = movie.get('movie_id')
+                if movie_id is None or movie_id in taken:
+                    movie_id, next_id = next_id, next_id + 1
+                    renumbered += 1
+                taken.add(movie_id)
+                new_ids[(user['id'], movie.get('movie_id'))] = movie_id
+                movie_rows.append({"movie_id": movie_id, "user_id": user['id'], "catalog_id": catalog_id,
+                                   "rating": Movie.parse_rating(movie.get('rating'))})
+            if movie_rows:
+                self.db.session.execute(insert(Movie), movie_rows)
+            self._queue_neighbors(catalog_ids)
+
+            stat_rows = [
+                {"user_id": user['id'], "dimension": dimension, "key": key,
+                 "count": count, "rated_count": rated_count, "rating_sum": rating_sum}
+                for user in users
+                for (dimension, key), (count, rated_count, rating_sum) in stat_deltas(user.get('movies', [])).items()
+            ]
+            if stat_rows:
+                self.db.session.execute(insert(UserStat), stat_rows)
+
+            review_rows = [
+                {"user_id": user['id'], "movie_id": new_ids[(user['id'], review.get('movie_id'))],
+                 "review": review.get('review')}
+                for user in users for review in user.get('reviews', [])
+                if (user['id'], review.get('movie_id')) in new_ids
+            ]
+            if review_rows:
+                self.db.session.execute(insert(Review), review_rows)
+
+            self._bump_version("users", *(f"user:{user['id']}" for user in users))
+            counts = {"users": len(users), "movies": len(movie_rows), "reviews": len(review_rows),
+                      "renumbered": renumbered}
+            if before_commit is not None:
+                before_commit(counts)
             self.db.session.commit()
+            return counts
         except Exception as e:
-            print(f"Error adding a new movie for the user: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error importing users into the database: {e}")
+            raise
 
     def update_movie(self, user_id, movie_id, new_title, new_director, new_year, new_rating):
         """
         Update user's movie information in the database.
+        The catalog entry is shared with other users, so a changed title, director or year points
+        this user's movie to another entry instead of editing it.
         """
         try:
             movie = self.db.session.query(Movie).filter(Movie.user_id == user_id, Movie.movie_id == movie_id).first()
             if movie:
-                movie.title = new_title
-                movie.director = new_director
-                movie.year = new_year
-                movie.rating = new_rating
+                old_values = movie.to_dict()
+                new_values = {"title": new_title, "director": new_director, "year": Movie.parse_year(new_year),
+                              "rating": Movie.parse_rating(new_rating)}
+                if (movie.title, movie.director, movie.year) != (new_title, new_director, new_values["year"]):
+                    old_catalog_id = movie.catalog_id
+                    movie.catalog_id = self._catalog_ids([
+                        {**new_values, "rating": movie.catalog.imdb_rating,
+                         "poster": movie.poster, "poster_hash": movie.poster_hash}
+                    ])[0]
+                    self._queue_neighbors([old_catalog_id, movie.catalog_id])
+                movie.rating = new_values["rating"]
+                self._adjust_stats(user_id, removed=[old_values], added=[new_values])
+                self._bump_version(f"user:{user_id}")
                 self.db.session.commit()
         except Exception as e:
-            print(f"Error updating movie in the database: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error updating movie in the database: {e}")
 
     def delete_movie(self, user_id, movie_id):
         """
-        Delete a specific movie for a user from the Database
+        Delete a specific movie for a user from the Database, with its reviews.
         """
+        self.delete_movies(user_id, [movie_id])
+
+    def _batch_movies(self, user_id, movie_ids):
+        """
+        Return the user's movies among some ids, as dictionaries with their catalog_id and stat fields.
+        """
+        rows = self.db.session.execute(BATCH_MOVIES_SQL, {"user_id": user_id,
+                                                          "movie_ids": json.dumps(list(movie_ids))})
+        return [dict(row._mapping) for row in rows]
+
+    def _run_batch(self, user_id, op, run):
+        """
+        Apply one run of a batch as a set-based statement in the current transaction, keeping the stats
+        and the neighbour queue in step.
+        :return: the number of movies or reviews changed.
+        """
+        if op == "delete_movie":
+            movies = self._batch_movies(user_id, {operation["movie_id"] for operation in run})
+            if not movies:
+                return 0
+            params = {"user_id": user_id, "movie_ids": json.dumps([movie["movie_id"] for movie in movies])}
+            self.db.session.execute(DELETE_BATCH_MOVIE_REVIEWS, params)
+            self.db.session.execute(DELETE_BATCH_MOVIES, params)
+            self._queue_neighbors(movie["catalog_id"] for movie in movies)
+            self._adjust_stats(user_id, removed=movies)
+            return len(movies)
+        if op == "update_rating":
+            ratings = latest_ratings(run)
+            movies = self._batch_movies(user_id, ratings)
+            if not movies:
+                return 0
+            self.db.session.execute(UPDATE_BATCH_RATINGS, {"user_id": user_id, "ratings": json.dumps([
+                {"movie_id": movie["movie_id"], "rating": ratings[movie["movie_id"]]} for movie in movies
+            ])})
+            self._adjust_stats(user_id, removed=movies,
+                               added=[{**movie, "rating": ratings[movie["movie_id"]]} for movie in movies])
+            return len(movies)
+        if op == "add_review":
+            return self.db.session.execute(INSERT_BATCH_REVIEWS, {"user_id": user_id,
+                                                                  "reviews": json.dumps(run)}).rowcount
+        return self.db.session.execute(DELETE_BATCH_REVIEWS, {
+            "user_id": user_id, "review_ids": json.dumps([operation["review_id"] for operation in run])
+        }).rowcount
+
+    def apply_batch(self, user_id, operations):
+        """
+        Apply a batch of changes to a user's library (see data_manager.batch) in one transaction,
+        each run of consecutive operations of the same kind as one set-based statement.
+        Operations on movies or reviews the user does not have are skipped.
+        :param user_id:
+        :param operations: list of operation dictionaries.
+        :return: dictionary of op -> number of movies or reviews changed, None if the transaction was rolled back.
+        :raises ValueError: if an operation is invalid, before anything is changed.
+        """
+        runs = operation_runs(check_operations(operations))
         try:
-            movie = self.db.session.query(Movie).filter(Movie.user_id == user_id, Movie.movie_id == movie_id).first()
-            if movie:
-                self.db.session.delete(movie)
-                self.db.session.commit()
+            counts = dict.fromkeys(BATCH_OPERATIONS, 0)
+            for op, run in runs:
+                counts[op] += self._run_batch(user_id, op, run)
+            if any(counts.values()):
+                self._bump_version(f"user:{user_id}")
+            self.db.session.commit()
+            return counts
         except Exception as e:
-            print(f"Error deleting movie from the database: {e}")
+            self.db.session.rollback()
+            logger.error(f"Error applying a batch of changes for the user: {e}")
+            return None
+
+    def delete_movies(self, user_id, movie_ids):
+        """
+        Delete many movies of a user, with their reviews, in one transaction.
+        :return: the number of movies deleted, None if the transaction was rolled back.
+        """
+        counts = self.apply_batch(user_id, [{"op": "delete_movie", "movie_id": movie_id} for movie_id in movie_ids])
+        return counts and counts["delete_movie"]
+
+    def update_ratings(self, user_id, ratings):
+        """
+        Change the rating of many movies of a user in one transaction.
+        :param ratings: dictionary of movie_id -> new rating.
+        :return: the number of movies updated, None if the transaction was rolled back.
+        """
+        counts = self.apply_batch(user_id, [{"op": "update_rating", "movie_id": movie_id, "rating": rating}
+                                            for movie_id, rating in ratings.items()])
+        return counts and counts["update_rating"]
 
     def get_movie_by_id(self, user_id, movie_id):
         """
@@ -184,13 +1090,61 @@ class SQLiteDataManager(DataManagerInterface):
                     "year": movie.year,
                     "rating": movie.rating,
                     "poster": movie.poster,
+                    "poster_hash": movie.poster_hash,
                     "movie_id": movie.movie_id
                 }
                 return movie_info
             else:
                 return None
         except Exception as e:
-            print(f"Error retrieving movie from the database: {e}")
+            logger.error(f"Error retrieving movie from the database: {e}")
+
+    def get_posters_to_cache(self):
+        """
+        Return the distinct remote poster URLs of the catalog entries whose poster was never cached locally.
+        :return:
+        """
+        try:
+            rows = (self.db.session.query(CatalogMovie.poster)
+                    .filter(CatalogMovie.poster_hash.is_(None), CatalogMovie.poster.like('http%'))
+                    .distinct().all())
+            return [poster for poster, in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving the posters to cache from the database: {e}")
+            return []
+
+    def set_poster_hashes(self, hashes):
+        """
+        Record the digests of cached posters on every catalog entry using them, in one UPDATE.
+        :param hashes: dictionary of poster URL -> sha256 digest.
+        :return: the number of catalog entries updated.
+        """
+        if not hashes:
+            return 0
+        try:
+            self.db.session.execute(text(
+                "CREATE TEMP TABLE IF NOT EXISTS poster_hashes (url VARCHAR PRIMARY KEY, digest VARCHAR)"
+            ))
+            self.db.session.execute(text("DELETE FROM poster_hashes"))
+            self.db.session.execute(text("INSERT INTO poster_hashes (url, digest) VALUES (:url, :digest)"),
+                                    [{"url": url, "digest": digest} for url, digest in hashes.items()])
+            user_ids = self.db.session.execute(text("""
+                SELECT DISTINCT Movie.user_id FROM poster_hashes
+                JOIN CatalogMovie ON CatalogMovie.poster = poster_hashes.url AND CatalogMovie.poster_hash IS NULL
+                JOIN Movie ON Movie.catalog_id = CatalogMovie.catalog_id
+            """)).scalars().all()
+            updated = self.db.session.execute(text("""
+                UPDATE CatalogMovie SET poster_hash = poster_hashes.digest FROM poster_hashes
+                WHERE CatalogMovie.poster = poster_hashes.url AND CatalogMovie.poster_hash IS NULL
+            """)).rowcount
+            self.db.session.execute(text("DELETE FROM poster_hashes"))
+            self._bump_version(*(f"user:{user_id}" for user_id in user_ids))
+            self.db.session.commit()
+            return updated
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error saving the poster digests to the database: {e}")
+            return 0
 
     @staticmethod
     def movies_api(new_movie):
@@ -199,33 +1153,26 @@ class SQLiteDataManager(DataManagerInterface):
         :param new_movie:
         :return:
         """
-        api_url = f'http://www.omdbapi.com/?apikey={API_KEY}&t={new_movie}'
-        try:
-            response = requests.get(api_url)
-            api_data = response.json()
-            if api_data['Response'] == "False":
-                return None
-            else:
-                movie_info = {
-                    "title": api_data["Title"],
-                    "year": api_data["Year"],
-                    "director": api_data["Director"],
-                    "rating": api_data["imdbRating"],
-                    "poster": api_data["Poster"]
-                }
-                return movie_info
-        except Exception as error:
-            print(f"{error}\n Check connections!")
-            return None
+        return omdb_client.lookup(new_movie)
 
     def add_review(self, user_id, movie_id, review):
         """
         Gets new user details data and returns a review of user
+        :return: the Review, None if the user has no such movie or the transaction was rolled back.
         """
-        review_to_add = Review(user_id=user_id, movie_id=movie_id, review=review)
-        self.db.session.add(review_to_add)
-        self.db.session.commit()
-        return review_to_add
+        try:
+            if self.db.session.query(Movie.movie_id).filter(
+                    Movie.movie_id == movie_id, Movie.user_id == user_id).first() is None:
+                return None
+            review_to_add = Review(user_id=user_id, movie_id=movie_id, review=review)
+            self.db.session.add(review_to_add)
+            self._bump_version(f"user:{user_id}")
+            self.db.session.commit()
+            return review_to_add
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error adding a review to the database: {e}")
+            return None
 
     def get_reviews(self, user_id, movie_id):
         """
@@ -242,10 +1189,28 @@ class SQLiteDataManager(DataManagerInterface):
     def delete_review(self, user_id, movie_id, review_id):
         """
         Deletes a review from database
+        :return: True if the review was deleted, False if the user has no such review or on error.
         """
-        self.db.session.query(Review).filter(
-            Review.movie_id == movie_id,
-            Review.user_id == user_id,
-            Review.review_id == review_id
-        ).delete()
-        self.db.session.commit()
+        try:
+            deleted = self.db.session.query(Review).filter(
+                Review.movie_id == movie_id,
+                Review.user_id == user_id,
+                Review.review_id == review_id
+            ).delete()
+            if deleted:
+                self._bump_version(f"user:{user_id}")
+            self.db.session.commit()
+            return deleted > 0
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"Error deleting a review from the database: {e}")
+            return False
+
+    def delete_reviews(self, user_id, review_ids):
+        """
+        Delete many reviews of a user in one transaction.
+        :return: the number of reviews deleted, None if the transaction was rolled back.
+        """
+        counts = self.apply_batch(user_id, [{"op": "delete_review", "review_id": review_id}
+                                            for review_id in review_ids])
+        return counts and counts["delete_review"]
@@ -0,0 +1,107 @@
+"""
+Per-user statistics kept as incremental aggregates, shared by both data managers.
+
+Every movie contributes to a few (dimension, key) buckets: ("all", "") for the totals, ("rating", "0".."10"),
+("decade", "1990") and ("director", name). Each bucket holds [count, rated_count, rating_sum], so adding
+or removing a movie only touches its own buckets and reading the stats never scans the movies.
+"""
+import heapq
+
+from Moviweb_app.models.data_models import Movie
+
+TOP_DIRECTORS = 10
+RATING_BUCKETS = range(0, 11)
+# Float sums drift by tiny amounts after many incremental updates, that is not a real inconsistency.
+RATING_SUM_TOLERANCE = 1e-6
+
+
+def movie_buckets(movie):
+    """
+    Return the (dimension, key) buckets a movie counts in, with its parsed rating.
+    :param movie: dictionary with the director, year and rating, as stored by either backend.
+    :return: (list of (dimension, key), rating or None)
+    """
+    year = Movie.parse_year(movie.get('year'))
+    rating = Movie.parse_rating(movie.get('rating'))
+    director = movie.get('director')
+    buckets = [("all", "")]
+    if rating is not None:
+        buckets.append(("rating", str(max(0, min(10, int(rating))))))
+    if year is not None:
+        buckets.append(("decade", str(year // 10 * 10)))
+    if director and director != 'N/A':
+        buckets.append(("director", director))
+    return buckets, rating
+
+
+def stat_deltas(movies, sign=1):
+    """
+    Sum up how much a list of movies adds to (sign=1) or removes from (sign=-1) each bucket.
+    :return: dictionary of (dimension, key) -> [count, rated_count, rating_sum]
+    """
+    deltas = {}
+    for movie in movies:
+        buckets, rating = movie_buckets(movie)
+        for bucket in buckets:
+            delta = deltas.setdefault(bucket, [0, 0, 0.0])
+            delta[0] += sign
+            if rating is not None:
+                delta[1] += sign
+                delta[2] += sign * rating
+    return deltas
+
+
+def apply_deltas(aggregate, deltas):
+    """
+    Add deltas to an in-memory aggregate, dropping the buckets that became empty.
+    """
+    for bucket, (count, rated_count, rating_sum) in deltas.items():
+        values = aggregate.setdefault(bucket, [0, 0, 0.0])
+        values[0] += count
+        values[1] += rated_count
+        values[2] += rating_sum
+        if values[0] <= 0:
+            del aggregate[bucket]
+
+
+def same_aggregate(stored, expected):
+    """
+    Compare two aggregates, allowing for float drift in the rating sums.
+    """
+    if stored.keys() != expected.keys():
+        return False
+    return all(
+        stored[bucket][0] == expected[bucket][0] and stored[bucket][1] == expected[bucket][1]
+        and abs(stored[bucket][2] - expected[bucket][2]) <= RATING_SUM_TOLERANCE
+        for bucket in expected
+    )
+
+
+def summarize(aggregate, top_directors=None):
+    """
+    Turn the buckets of one user into the stats shown on the dashboard.
+    :param aggregate: dictionary of (dimension, key) -> [count, rated_count, rating_sum]
+    :param top_directors: the director buckets already cut down to the top ones, as ((key, values), ...).
+                          Picked from the aggregate when None.
+    """
+    count, rated_count, rating_sum = aggregate.get(("all", ""), (0, 0, 0.0))
+    if top_directors is None:
+        top_directors = heapq.nlargest(
+            TOP_DIRECTORS,
+            ((key, values) for (dimension, key), values in aggregate.items() if dimension == "director"),
+            key=lambda item: (item[1][0], item[0])
+        )
+    histogram = {int(key): values[0] for (dimension, key), values in aggregate.items() if dimension == "rating"}
+    decades = sorted((int(key), values) for (dimension, key), values in aggregate.items() if dimension == "decade")
+    return {
+        "movie_count": count,
+        "rated_count": rated_count,
+        "average_rating": round(rating_sum / rated_count, 2) if rated_count else None,
+        "rating_histogram": [{"rating": bucket, "count": histogram.get(bucket, 0)} for bucket in RATING_BUCKETS],
+        "top_directors": [
+            {"director": key, "count": values[0],
+             "average_rating": round(values[2] / values[1], 2) if values[1] else None}
+            for key, values in top_directors
+        ],
+        "decades": [{"decade": decade, "count": values[0]} for decade, values in decades],
+    }
@@ -0,0 +1,94 @@
+"""
+Helpers for the JSON endpoints: strong ETags built from data versions, conditional GET and compression.
+"""
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+
+
+def make_etag(version):
+    """
+    Build a strong ETag for the current URL at a given data version.
+    """
+    digest = hashlib.sha1(f"{request.full_path}|{version}".encode()).hexdigest()[:20]
+    return digest
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _not_modified(version):
+    """
+    Return a 304 response if the client already has this version of the URL, else None with the
+    encoding and the ETags of each representation.
+    """
+    etag = make_etag(version)
+    encoding = _choose_encoding()
+    # Each encoding is a different representation, so it gets its own strong ETag.
+    tags = {name: f"{etag}-{name}" if name else etag for name in (None, 'gzip', 'br')}
+    matched = next((tag for tag in tags.values() if request.if_none_match.contains(tag)), None)
+    if version is not None and matched:
+        response = Response(status=304)
+        response.set_etag(matched)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response, encoding, tags
+    return None, encoding, tags
+
+
+def _json_response(payload, encoding, tags):
+    body = json.dumps(payload, separators=(',', ':'), default=str).encode()
+    response = Response(body, mimetype='application/json')
+    if encoding and len(body) >= COMPRESS_MIN_SIZE:
+        response.set_data(_compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(tags[encoding])
+    else:
+        response.set_etag(tags[None])
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional_json(version, build):
+    """
+    Answer a GET with JSON, or with 304 Not Modified when the client already has this version.
+    :param version: data version of the resource, cheap to look up.
+    :param build: callable returning the JSON-serializable payload, only called when needed.
+    :return: a Flask Response
+    """
+    not_modified, encoding, tags = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    return _json_response(build(), encoding, tags)
+
+
+async def conditional_json_async(version, build):
+    """
+    conditional_json for async views.
+    :param build: coroutine function returning the payload, only awaited when needed.
+    """
+    not_modified, encoding, tags = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    return _json_response(await build(), encoding, tags)
@@ -0,0 +1,111 @@
+"""
+Move the users and movies of a JSONDataManager file (data/data.json) into the SQLite database.
+
+The file is parsed incrementally with iter_json_array and written in large transactions of bulk INSERTs,
+so the memory used is bounded by one batch however large the file is. Every transaction also records
+how many users of the file it covered, so an interrupted migration resumes after its last commit.
+"""
+import os
+import time
+
+from sqlalchemy import func, text
+
+from Moviweb_app.models.data_models import User
+from data_manager.json_data_manager import iter_json_array, PLACEHOLDER_TITLE
+
+BATCH_SIZE = 5000
+
+CHECKPOINT_TABLE = """
+    CREATE TABLE IF NOT EXISTS json_migration (
+        source VARCHAR PRIMARY KEY, signature VARCHAR NOT NULL,
+        users INTEGER NOT NULL, movies INTEGER NOT NULL, reviews INTEGER NOT NULL, renumbered INTEGER NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0
+    )
+"""
+SAVE_CHECKPOINT = """
+    INSERT INTO json_migration (source, signature, users, movies, reviews, renumbered, finished)
+    VALUES (:source, :signature, :users, :movies, :reviews, :renumbered, :finished)
+    ON CONFLICT (source) DO UPDATE SET signature = excluded.signature, users = excluded.users,
+        movies = excluded.movies, reviews = excluded.reviews, renumbered = excluded.renumbered,
+        finished = excluded.finished
+"""
+
+
+class MigrationError(Exception):
+    """
+    The migration cannot start or resume, the message says why.
+    """
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _batches(users, batch_size):
+    """
+    Group whole users into batches of about batch_size movies and reviews, leaving out the placeholder movies.
+    """
+    batch, movie_count = [], 0
+    for user in users:
+        movies = [movie for movie in user.get('movies', []) if movie.get('title') != PLACEHOLDER_TITLE]
+        batch.append({**user, "movies": movies})
+        movie_count += len(movies) + len(user.get('reviews', []))
+        if movie_count >= batch_size or len(batch) >= batch_size:
+            yield batch
+            batch, movie_count = [], 0
+    if batch:
+        yield batch
+
+
+def migrate_json(path, data_manager, batch_size=BATCH_SIZE, progress=print):
+    """
+    Copy the users of a JSON data file, their movies and reviews into the SQLite database.
+    :param path: JSON data file, in JSONDataManager's format.
+    :param data_manager: SQLiteDataManager of the database to fill, it must have no users yet
+                         unless an earlier migration of the same file is resumed.
+    :param batch_size: About how many movies and reviews are inserted per transaction.
+    :param progress: callable receiving a progress line after every transaction.
+    :return: dictionary with the number of users, movies, reviews and renumbered movies migrated.
+    """
+    if os.path.exists(path + ".journal") or os.path.exists(path + ".journal.compacting"):
+        raise MigrationError(f"{path} has a journal, compact it first so the file holds every change.")
+    session = data_manager.db.session
+    source, signature = os.path.abspath(path), _signature(path)
+    session.execute(text(CHECKPOINT_TABLE))
+    session.commit()
+    checkpoint = session.execute(text("SELECT * FROM json_migration WHERE source = :source"),
+                                 {"source": source}).mappings().first()
+    if checkpoint is None:
+        if session.query(func.count(User.id)).scalar():
+            raise MigrationError("The database already has users, migrate into an empty database.")
+        totals = {"users": 0, "movies": 0, "reviews": 0, "renumbered": 0}
+    else:
+        if checkpoint["signature"] != signature:
+            raise MigrationError(f"{path} changed since the migration started, it cannot be resumed.")
+        totals = {key: checkpoint[key] for key in ("users", "movies", "reviews", "renumbered")}
+        if checkpoint["finished"]:
+            progress(f"{path} was already migrated.")
+            return totals
+        progress(f"Resuming after {totals['users']} users.")
+
+    def save_checkpoint(counts):
+        session.execute(text(SAVE_CHECKPOINT), {"source": source, "signature": signature, "finished": 0,
+                                                **{key: totals[key] + counts[key] for key in totals}})
+
+    started = time.perf_counter()
+    rows = 0
+    with open(path) as fileobj:
+        users = iter_json_array(fileobj)
+        for _ in range(totals["users"]):
+            next(users)
+        for batch in _batches(users, batch_size):
+            counts = data_manager.import_users(batch, before_commit=save_checkpoint)
+            for key in totals:
+                totals[key] += counts[key]
+            rows += counts["users"] + counts["movies"] + counts["reviews"]
+            progress(f"{totals['users']} users, {totals['movies']} movies, {totals['reviews']} reviews migrated, "
+                     f"{rows / (time.perf_counter() - started):.0f} rows/s.")
+    session.execute(text(SAVE_CHECKPOINT), {"source": source, "signature": signature, "finished": 1, **totals})
+    session.commit()
+    return totals
@@ -0,0 +1,75 @@
+"""
+Streaming export of users' libraries and reviews as NDJSON or CSV.
+
+Rows come one at a time from the data managers' iter_movies / iter_reviews generators and are encoded
+into chunks of about 64 KiB, optionally gzip-compressed on the fly, so the memory used stays flat
+whatever the size of the export. The CSV export has a "title" column, so it can be imported back.
+"""
+import csv
+import io
+import json
+import zlib
+
+MOVIE_FIELDS = ("user_id", "user_name", "movie_id", "title", "director", "year", "rating", "imdb_id", "poster")
+REVIEW_FIELDS = ("user_id", "movie_id", "review_id", "title", "review")
+EXPORT_KINDS = {"movies": MOVIE_FIELDS, "reviews": REVIEW_FIELDS}
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CHUNK_SIZE = 64 * 1024
+
+
+def export_rows(data_manager, kind, user_id=None):
+    """
+    Return the generator of rows to export.
+    :param data_manager: JSONDataManager or SQLiteDataManager.
+    :param kind: "movies" or "reviews".
+    :param user_id: Only export this user, or everyone if None.
+    """
+    if kind == "movies":
+        return data_manager.iter_movies(user_id=user_id)
+    return data_manager.iter_reviews(user_id=user_id)
+
+
+def encode_rows(rows, fields, fmt, chunk_size=CHUNK_SIZE):
+    """
+    Encode rows as NDJSON or CSV and yield the UTF-8 text in chunks of about chunk_size bytes.
+    :param rows: iterable of dictionaries.
+    :param fields: the columns written, in order.
+    :param fmt: "ndjson" or "csv".
+    """
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps({field: row.get(field) for field in fields}, ensure_ascii=False, default=str))
+            buffer.write("\n")
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress a stream of byte chunks into a gzip stream, chunk by chunk.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_filename(kind, fmt, user_id=None):
+    """
+    Return the file name offered for a download, e.g. "moviweb-user-3-movies.csv".
+    """
+    scope = "all" if user_id is None else f"user-{user_id}"
+    return f"moviweb-{scope}-{kind}.{fmt}"
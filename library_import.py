@@ -0,0 +1,148 @@
+"""
+Bulk import of a user's library from a list of titles or a CSV export (e.g. Letterboxd's watched.csv).
+
+Titles are resolved against OMDb concurrently by a bounded pool of threads, deduplicated against
+the user's existing library, their posters cached locally and inserted with a single add_movies_for_user call.
+import_titles_async does the same from an async view, awaiting the lookups instead of using threads.
+"""
+import asyncio
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from data_manager.omdb_client import omdb_client, normalize_title
+from poster_cache import poster_cache
+
+# Column names recognised as the movie title in a CSV header, Letterboxd uses "Name".
+TITLE_COLUMNS = ("title", "name", "movie", "film")
+MAX_TITLES = 2000
+
+
+def _field(row, key):
+    """
+    Read a field from either a JSON dictionary or a SQLAlchemy model.
+    """
+    return row[key] if isinstance(row, dict) else getattr(row, key)
+
+
+def parse_titles(text):
+    """
+    Return the non-empty lines of a text, one title per line.
+    """
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def parse_csv(text):
+    """
+    Return the titles of a CSV export. The title column is found by its header,
+    without a recognised header the first column is used.
+    """
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [column.strip().casefold() for column in rows[0]]
+    column = next((header.index(name) for name in TITLE_COLUMNS if name in header), None)
+    if column is None:
+        column = 0
+    else:
+        rows = rows[1:]
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def _plan(existing_movies, titles):
+    """
+    Split the titles into the ones to resolve and the duplicates of the library or of each other.
+    :return: (report, titles to resolve, normalized titles of the library)
+    """
+    report = {"added": [], "duplicates": [], "not_found": [], "failed": []}
+    existing = {normalize_title(_field(movie, 'title')) for movie in existing_movies or []}
+    to_resolve = []
+    seen = set(existing)
+    for title in titles[:MAX_TITLES]:
+        key = normalize_title(title)
+        if key in seen:
+            report["duplicates"].append(title)
+        else:
+            seen.add(key)
+            to_resolve.append(title)
+    for title in titles[MAX_TITLES:]:
+        report["failed"].append({"title": title, "error": f"Only {MAX_TITLES} titles can be imported at once"})
+    return report, to_resolve, existing
+
+
+def _new_movies(report, existing, results):
+    """
+    Sort the (title, movie_data, error) lookup results into the report, returning the movies to add.
+    """
+    new_movies = []
+    for title, movie_data, error in results:
+        if error is not None:
+            report["failed"].append({"title": title, "error": error})
+        elif movie_data is None:
+            report["not_found"].append(title)
+        elif normalize_title(movie_data['title']) in existing:
+            # "inception " and "Inception" resolve to the same movie as well
+            report["duplicates"].append(title)
+        else:
+            existing.add(normalize_title(movie_data['title']))
+            new_movies.append(movie_data)
+    return new_movies
+
+
+def _saved(report, new_movies, added):
+    if added:
+        report["added"] = [movie['title'] for movie in new_movies]
+    else:
+        report["failed"].extend({"title": movie['title'], "error": "Could not save the movie"} for movie in new_movies)
+    return report
+
+
+def import_titles(data_manager, user_id, titles, workers=8, lookup=None, posters=None):
+    """
+    Resolve the titles concurrently and add the new ones to the user's library in one batch.
+    :param data_manager: JSONDataManager or SQLiteDataManager.
+    :param titles: list of movie titles.
+    :param workers: Maximum number of concurrent OMDb lookups.
+    :param lookup: Callable resolving a title, raising on connection errors. Defaults to the shared OMDb client.
+    :param posters: PosterCache the posters of the new movies are downloaded into. Defaults to the shared one.
+    :return: a report dictionary with the added titles, the skipped duplicates and the per-title failures.
+    """
+    lookup = lookup or (lambda title: omdb_client.lookup(title, raise_errors=True))
+    posters = posters or poster_cache
+    report, to_resolve, existing = _plan(data_manager.get_user_movie(user_id), titles)
+
+    def resolve(title):
+        try:
+            return title, lookup(title), None
+        except Exception as error:
+            return title, None, str(error)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_resolve)))) as pool:
+        results = list(pool.map(resolve, to_resolve))
+
+    new_movies = _new_movies(report, existing, results)
+    if new_movies:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(new_movies)))) as pool:
+            list(pool.map(posters.attach, new_movies))
+
+    return _saved(report, new_movies, data_manager.add_movies_for_user(user_id, new_movies))
+
+
+async def import_titles_async(data_manager, user_id, titles, posters=None):
+    """
+    import_titles for async views: the OMDb lookups are awaited together, as many at a time as the
+    OMDb client has connections, and the posters are downloaded concurrently as well.
+    :param data_manager: AsyncDataManager.
+    :return: the same report as import_titles.
+    """
+    posters = posters or poster_cache
+    report, to_resolve, existing = _plan(await data_manager.get_user_movie(user_id), titles)
+    answers = await omdb_client.lookup_many(to_resolve, raise_errors=True)
+    results = [(title, None, str(answer)) if isinstance(answer, Exception) else (title, answer, None)
+               for title, answer in zip(to_resolve, answers)]
+
+    new_movies = _new_movies(report, existing, results)
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(None, posters.attach, movie) for movie in new_movies))
+
+    return _saved(report, new_movies, await data_manager.add_movies_for_user(user_id, new_movies))
@@ -0,0 +1,179 @@
+"""
+Per-request instrumentation: route latency, SQL query counts and time, template rendering time.
+
+Every response gets a Server-Timing header, requests issuing more queries than the configured
+QUERY_BUDGET are logged as likely N+1 patterns, and everything is exposed in the Prometheus
+text format on /metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DEFAULT_QUERY_BUDGET = 20
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.setdefault(labels, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0})
+        series["counts"][bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Initialize a new instance of Metrics class, the registry behind /metrics.
+        """
+        self._lock = threading.Lock()
+        self.request_latency = Histogram(
+            "moviweb_request_duration_seconds", "Time spent handling a request.", LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            "moviweb_request_sql_queries", "SQL queries issued per request.", QUERY_COUNT_BUCKETS)
+        self.request_sql_time = Histogram(
+            "moviweb_request_sql_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+        self.request_render_time = Histogram(
+            "moviweb_request_render_seconds", "Time spent rendering templates per request.", LATENCY_BUCKETS)
+        self.query_budget_exceeded = {}
+        self._stats_sources = []
+
+    def register_stats(self, prefix, stats):
+        """
+        Export the numeric values of a stats() dictionary as gauges named <prefix>_<key>.
+        Registering a prefix again replaces its source, e.g. when another app is created.
+        """
+        self._stats_sources = [source for source in self._stats_sources if source[0] != prefix]
+        self._stats_sources.append((prefix, stats))
+
+    def observe_request(self, endpoint, method, status, total, queries, sql_time, render_time, over_budget):
+        labels = (("endpoint", endpoint), ("method", method))
+        with self._lock:
+            self.request_latency.observe(labels + (("status", status),), total)
+            self.request_queries.observe(labels, queries)
+            self.request_sql_time.observe(labels, sql_time)
+            self.request_render_time.observe(labels, render_time)
+            if over_budget:
+                self.query_budget_exceeded[labels] = self.query_budget_exceeded.get(labels, 0) + 1
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = []
+            for histogram in (self.request_latency, self.request_queries,
+                              self.request_sql_time, self.request_render_time):
+                lines += histogram.render()
+            lines += ["# HELP moviweb_query_budget_exceeded_total Requests that issued more queries than the budget.",
+                      "# TYPE moviweb_query_budget_exceeded_total counter"]
+            for labels, count in sorted(self.query_budget_exceeded.items()):
+                lines.append(f"moviweb_query_budget_exceeded_total{_format_labels(labels)} {count}")
+
+        for prefix, stats in self._stats_sources:
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def init_metrics(app, db):
+    """
+    Instrument the app's requests, its SQLAlchemy engine and its templates, and add the /metrics route.
+    :param app:
+    :param db:
+    :return:
+    """
+    query_budget = app.config.get('QUERY_BUDGET', DEFAULT_QUERY_BUDGET)
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.setdefault("sql_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and g.get("sql_started"):
+            g.sql_time = g.get("sql_time", 0.0) + time.perf_counter() - g.sql_started.pop()
+            g.sql_count = g.get("sql_count", 0) + 1
+
+    def before_render(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault("render_started", []).append(time.perf_counter())
+
+    def after_render(sender, template, context, **extra):
+        if has_request_context() and g.get("render_started"):
+            g.render_time = g.get("render_time", 0.0) + time.perf_counter() - g.render_started.pop()
+
+    before_render_template.connect(before_render, app, weak=False)
+    template_rendered.connect(after_render, app, weak=False)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if "request_started" not in g:
+            return response
+        total = time.perf_counter() - g.request_started
+        queries = g.get("sql_count", 0)
+        sql_time = g.get("sql_time", 0.0)
+        render_time = g.get("render_time", 0.0)
+        endpoint = request.endpoint or "unmatched"
+        over_budget = queries > query_budget
+        if over_budget:
+            app.logger.warning("%s %s issued %d SQL queries (budget %d), possible N+1 pattern",
+                               request.method, request.path, queries, query_budget)
+        metrics.observe_request(endpoint, request.method, response.status_code,
+                                total, queries, sql_time, render_time, over_budget)
+        response.headers.add(
+            "Server-Timing",
+            f'sql;dur={sql_time * 1000:.2f};desc="{queries} queries", '
+            f'render;dur={render_time * 1000:.2f}, total;dur={total * 1000:.2f}'
+        )
+        return response
+
+    def metrics_endpoint():
+        """
+        Expose the collected metrics in the Prometheus text format.
+        """
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
@@ -8,7 +8,12 @@ class User(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    movies = db.relationship('Movie', backref='user', lazy=True)
+    # Deleting a user deletes their movies, reviews and stats in the database (ON DELETE CASCADE),
+    # passive_deletes keeps the ORM from loading them first.
+    movies = db.relationship('Movie', backref='user', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name}
 
     def __repr__(self):
         return f"<User(id={self.id}, name='{self.name}')>"
@@ -17,17 +22,115 @@ class User(db.Model):
         return f"User: {self.name}"
 
 
-class Movie(db.Model):
-    __tablename__ = 'Movie'
+# SQLite's lower() and trim() only fold ASCII letters and strip spaces, the catalog keys built here
+# must match the ones migration 5 builds in SQL.
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
 
-    movie_id = db.Column(db.Integer, primary_key=True)
+
+class CatalogMovie(db.Model):
+    """
+    The OMDb metadata of a movie, stored once however many users saved it.
+    """
+    __tablename__ = 'CatalogMovie'
+    __table_args__ = (
+        db.Index('ix_catalog_movie_catalog_key', 'catalog_key', unique=True),
+    )
+
+    catalog_id = db.Column(db.Integer, primary_key=True)
+    # "imdb:<IMDb id>", or "title:<title>|<year>|<director>" for movies without one (older rows, edits).
+    catalog_key = db.Column(db.String, nullable=False)
+    imdb_id = db.Column(db.String, nullable=True)
     title = db.Column(db.String)
-    year = db.Column(db.String)
-    rating = db.Column(db.Float)
+    year = db.Column(db.Integer)
     director = db.Column(db.String)
+    imdb_rating = db.Column(db.Float, nullable=True)
     poster = db.Column(db.String)
+    # sha256 of the locally cached poster, see poster_cache.py. None until it was downloaded.
+    poster_hash = db.Column(db.String, nullable=True)
+
+    @staticmethod
+    def make_key(title, year, director, imdb_id=None):
+        """
+        Build the catalog key of a movie, by IMDb id when there is one.
+        """
+        if imdb_id:
+            return f"imdb:{imdb_id}"
+        title = (title or "").strip(" ").translate(_ASCII_LOWER)
+        director = (director or "").strip(" ").translate(_ASCII_LOWER)
+        return f"title:{title}|{year if year is not None else ''}|{director}"
+
+    def __repr__(self):
+        return f"<CatalogMovie(id={self.catalog_id}, key='{self.catalog_key}', title='{self.title}')>"
+
 
-    user_id = db.Column(db.Integer, db.ForeignKey('User.id'), nullable=False)
+class Movie(db.Model):
+    """
+    A movie in a user's library: the per-user fields, the shared metadata lives in CatalogMovie.
+    """
+    __tablename__ = 'Movie'
+    __table_args__ = (
+        db.Index('ix_movie_user_id_movie_id', 'user_id', 'movie_id'),
+        # Covers the owner counts of the recommender, see data_manager/recommender.py.
+        db.Index('ix_movie_catalog_id_user_id', 'catalog_id', 'user_id'),
+    )
+
+    movie_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('User.id', ondelete='CASCADE'), nullable=False)
+    # Catalog entries are shared, one still used by a movie cannot be deleted.
+    catalog_id = db.Column(db.Integer, db.ForeignKey('CatalogMovie.catalog_id'), nullable=False)
+    # The user's own rating, starts as the OMDb rating.
+    rating = db.Column(db.Float, nullable=True)
+
+    catalog = db.relationship('CatalogMovie', lazy='joined', innerjoin=True)
+
+    @property
+    def title(self):
+        return self.catalog.title
+
+    @property
+    def year(self):
+        return self.catalog.year
+
+    @property
+    def director(self):
+        return self.catalog.director
+
+    @property
+    def poster(self):
+        return self.catalog.poster
+
+    @property
+    def poster_hash(self):
+        return self.catalog.poster_hash
+
+    @staticmethod
+    def parse_year(value):
+        """
+        Turn an OMDb or form year such as "2010" or "2010–2014" into an int, None if there is none.
+        """
+        digits = str(value).strip()[:4] if value is not None else ""
+        return int(digits) if digits.isdigit() else None
+
+    @staticmethod
+    def parse_rating(value):
+        """
+        Turn an OMDb or form rating such as "8.8" into a float, None for "N/A" or empty values.
+        """
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def to_dict(self):
+        return {
+            "movie_id": self.movie_id,
+            "title": self.title,
+            "director": self.director,
+            "year": self.year,
+            "rating": self.rating,
+            "poster": self.poster,
+            "poster_hash": self.poster_hash
+        }
 
     def __repr__(self):
         return f"<Movie(id={self.movie_id}, title='{self.title}', year={self.year}, rating={self.rating})>"
@@ -38,14 +141,24 @@ class Movie(db.Model):
 
 class Review(db.Model):
     __tablename__ = 'Review'
+    __table_args__ = (
+        db.Index('ix_review_user_id_movie_id_review_id', 'user_id', 'movie_id', 'review_id'),
+        # Looked up by every cascaded movie delete.
+        db.Index('ix_review_movie_id', 'movie_id'),
+    )
 
     review_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    movie_id = db.Column(db.Integer, db.ForeignKey('Movie.movie_id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('User.id'), nullable=False)
+    movie_id = db.Column(db.Integer, db.ForeignKey('Movie.movie_id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('User.id', ondelete='CASCADE'), nullable=False)
     review = db.Column(db.String)
 
-    movie = db.relationship('Movie', backref='reviews', lazy=True)
-    user = db.relationship('User', backref='reviews', lazy=True)
+    movie = db.relationship('Movie', lazy=True, backref=db.backref(
+        'reviews', cascade="all, delete-orphan", passive_deletes=True))
+    user = db.relationship('User', lazy=True, backref=db.backref(
+        'reviews', cascade="all, delete-orphan", passive_deletes=True))
+
+    def to_dict(self):
+        return {"review_id": self.review_id, "movie_id": self.movie_id, "user_id": self.user_id, "review": self.review}
 
     def __repr__(self) -> str:
         return (f"Review(review_id={self.review_id}, user_id={self.user_id},"
@@ -53,3 +166,75 @@ class Review(db.Model):
 
     def __str__(self) -> str:
         return f"Review: {self.review_id}, {self.review}"
+
+
+class DataVersion(db.Model):
+    """
+    Counters bumped by the data manager on every write: "users" for the list of users and
+    "user:<id>" for everything belonging to one user, "recommendations" for the neighbour lists.
+    Used to build ETags and cache keys.
+    """
+    __tablename__ = 'DataVersion'
+
+    scope = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion(scope='{self.scope}', version={self.version})>"
+
+
+class UserStat(db.Model):
+    """
+    Per-user aggregates maintained by the data manager on every movie write, see data_manager/user_stats.py.
+    One row per (dimension, key) bucket: ("all", "") holds the totals, then one row per rating bucket,
+    decade and director.
+    """
+    __tablename__ = 'UserStat'
+    __table_args__ = (
+        db.Index('ix_user_stat_user_id_dimension_count', 'user_id', 'dimension', 'count'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('User.id', ondelete='CASCADE'), primary_key=True)
+    dimension = db.Column(db.String, primary_key=True)
+    key = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rated_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<UserStat(user_id={self.user_id}, dimension='{self.dimension}', key='{self.key}', count={self.count})>"
+
+
+class MovieNeighbor(db.Model):
+    """
+    One of the TOP_K most similar movies of a catalog movie, by how many libraries hold both.
+    Maintained by the data manager, see data_manager/recommender.py.
+    """
+    __tablename__ = 'MovieNeighbor'
+    __table_args__ = (
+        db.Index('ix_movie_neighbor_neighbor_id', 'neighbor_id'),
+    )
+
+    catalog_id = db.Column(db.Integer, db.ForeignKey('CatalogMovie.catalog_id', ondelete='CASCADE'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('CatalogMovie.catalog_id', ondelete='CASCADE'), primary_key=True)
+    # Number of libraries holding both movies.
+    co_count = db.Column(db.Integer, nullable=False)
+    # Cosine similarity, co_count / sqrt(libraries holding one * libraries holding the other).
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<MovieNeighbor(catalog_id={self.catalog_id}, neighbor_id={self.neighbor_id}, score={self.score})>"
+
+
+class NeighborQueue(db.Model):
+    """
+    Catalog movies whose neighbour lists are out of date since a library changed. The version is bumped on
+    every change, so a refresh only dequeues the movies nothing changed again while it ran.
+    """
+    __tablename__ = 'NeighborQueue'
+
+    catalog_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f"<NeighborQueue(catalog_id={self.catalog_id}, version={self.version})>"
@@ -0,0 +1,465 @@
+"""
+Versioned schema migrations for data.sqlite3.
+
+The schema version lives in SQLite's PRAGMA user_version, each migration moves it up by one.
+Run them with `flask --app main upgrade-db`, or `python -m models.migrations data/data.sqlite3`;
+create_app also applies them with ensure_schema when the version is behind.
+"""
+import sqlite3
+import sys
+
+
+def _table_exists(connection, name):
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def _column_exists(connection, table, column):
+    return any(row[1] == column for row in connection.execute(f'PRAGMA table_info("{table}")'))
+
+
+def _typed_movie_columns_and_indexes(connection):
+    """
+    Version 1: Movie.year becomes an INTEGER, Movie.rating a nullable REAL ("N/A" turns into NULL),
+    and the (user_id, movie_id) / (user_id, movie_id, review_id) indexes are added.
+    """
+    script = []
+    if _table_exists(connection, 'Movie'):
+        script.append("""
+            CREATE TABLE "Movie_new" (
+                movie_id INTEGER NOT NULL,
+                title VARCHAR,
+                year INTEGER,
+                rating FLOAT,
+                director VARCHAR,
+                poster VARCHAR,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (movie_id),
+                FOREIGN KEY(user_id) REFERENCES "User" (id)
+            );
+            INSERT INTO "Movie_new" (movie_id, title, year, rating, director, poster, user_id)
+            SELECT movie_id, title,
+                   CASE WHEN substr(trim(year), 1, 4) GLOB '[0-9][0-9][0-9][0-9]'
+                        THEN CAST(substr(trim(year), 1, 4) AS INTEGER) END,
+                   CASE WHEN typeof(rating) IN ('integer', 'real') THEN rating
+                        WHEN trim(rating) GLOB '[0-9]*' THEN CAST(trim(rating) AS REAL) END,
+                   director, poster, user_id
+            FROM "Movie";
+            DROP TABLE "Movie";
+            ALTER TABLE "Movie_new" RENAME TO "Movie";
+            CREATE INDEX IF NOT EXISTS ix_movie_user_id_movie_id ON "Movie" (user_id, movie_id);
+        """)
+    if _table_exists(connection, 'Review'):
+        script.append("""
+            CREATE INDEX IF NOT EXISTS ix_review_user_id_movie_id_review_id
+            ON "Review" (user_id, movie_id, review_id);
+        """)
+    return "".join(script)
+
+
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+# Version 2 indexed Movie itself, version 5 moved the movie index to CatalogMovie.
+MOVIE_SEARCH_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_insert AFTER INSERT ON "Movie" BEGIN
+        INSERT INTO movie_fts (rowid, title, director) VALUES (new.movie_id, new.title, new.director);
+    END;
+    CREATE TRIGGER IF NOT EXISTS movie_fts_delete AFTER DELETE ON "Movie" BEGIN
+        INSERT INTO movie_fts (movie_fts, rowid, title, director)
+        VALUES ('delete', old.movie_id, old.title, old.director);
+    END;
+    CREATE TRIGGER IF NOT EXISTS movie_fts_update AFTER UPDATE OF title, director ON "Movie" BEGIN
+        INSERT INTO movie_fts (movie_fts, rowid, title, director)
+        VALUES ('delete', old.movie_id, old.title, old.director);
+        INSERT INTO movie_fts (rowid, title, director) VALUES (new.movie_id, new.title, new.director);
+    END;
+"""
+
+CATALOG_SEARCH_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_insert AFTER INSERT ON "CatalogMovie" BEGIN
+        INSERT INTO movie_fts (rowid, title, director) VALUES (new.catalog_id, new.title, new.director);
+    END;
+    CREATE TRIGGER IF NOT EXISTS movie_fts_delete AFTER DELETE ON "CatalogMovie" BEGIN
+        INSERT INTO movie_fts (movie_fts, rowid, title, director)
+        VALUES ('delete', old.catalog_id, old.title, old.director);
+    END;
+    CREATE TRIGGER IF NOT EXISTS movie_fts_update AFTER UPDATE OF title, director ON "CatalogMovie" BEGIN
+        INSERT INTO movie_fts (movie_fts, rowid, title, director)
+        VALUES ('delete', old.catalog_id, old.title, old.director);
+        INSERT INTO movie_fts (rowid, title, director) VALUES (new.catalog_id, new.title, new.director);
+    END;
+"""
+
+REVIEW_SEARCH_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS review_fts_insert AFTER INSERT ON "Review" BEGIN
+        INSERT INTO review_fts (rowid, review) VALUES (new.review_id, new.review);
+    END;
+    CREATE TRIGGER IF NOT EXISTS review_fts_delete AFTER DELETE ON "Review" BEGIN
+        INSERT INTO review_fts (review_fts, rowid, review) VALUES ('delete', old.review_id, old.review);
+    END;
+    CREATE TRIGGER IF NOT EXISTS review_fts_update AFTER UPDATE OF review ON "Review" BEGIN
+        INSERT INTO review_fts (review_fts, rowid, review) VALUES ('delete', old.review_id, old.review);
+        INSERT INTO review_fts (rowid, review) VALUES (new.review_id, new.review);
+    END;
+"""
+
+REBUILD_SEARCH_INDEX = """
+    INSERT INTO movie_fts (movie_fts) VALUES ('rebuild');
+    INSERT INTO review_fts (review_fts) VALUES ('rebuild');
+"""
+
+
+def _full_text_search(connection):
+    """
+    Version 2: FTS5 indexes over Movie (title, director) and Review (review), kept in sync by triggers.
+    Both are external-content tables, the text itself is only stored once in Movie and Review.
+    """
+    if not (_table_exists(connection, 'Movie') and _table_exists(connection, 'Review')):
+        return ""
+    return f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS movie_fts USING fts5(
+            title, director, content = 'Movie', content_rowid = 'movie_id', {FTS_OPTIONS}
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS review_fts USING fts5(
+            review, content = 'Review', content_rowid = 'review_id', {FTS_OPTIONS}
+        );
+        {MOVIE_SEARCH_TRIGGERS}
+        {REVIEW_SEARCH_TRIGGERS}
+        {REBUILD_SEARCH_INDEX}
+    """
+
+
+def _poster_hash_column(connection):
+    """
+    Version 3: Movie.poster_hash, the digest of the locally cached poster (see poster_cache.py).
+    Filled for existing rows by `flask --app main backfill-posters`.
+    """
+    if not _table_exists(connection, 'Movie') or _column_exists(connection, 'Movie', 'poster_hash'):
+        return ""
+    return 'ALTER TABLE "Movie" ADD COLUMN poster_hash VARCHAR;'
+
+
+# The user_id, rating, year and director of every library movie, before and after version 5.
+LEGACY_LIBRARY_MOVIES = '"Movie"'
+LIBRARY_MOVIES = """(
+    SELECT "Movie".user_id, "Movie".rating, "CatalogMovie".year, "CatalogMovie".director
+    FROM "Movie" JOIN "CatalogMovie" ON "CatalogMovie".catalog_id = "Movie".catalog_id
+)"""
+
+# Recomputes the UserStat rows, the same buckets as data_manager/user_stats.py.
+# {movies} is LIBRARY_MOVIES, {user_filter} narrows it down to some users, e.g. "user_id = :user_id",
+# or "1" for everyone.
+USER_STATS_SELECT = """
+    SELECT user_id, 'all' AS dimension, '' AS key, count(*) AS count, count(rating) AS rated_count,
+           coalesce(sum(rating), 0.0) AS rating_sum
+    FROM {movies} WHERE {user_filter} GROUP BY user_id
+    UNION ALL
+    SELECT user_id, 'rating', CAST(max(0, min(10, CAST(rating AS INTEGER))) AS TEXT), count(*), count(*), sum(rating)
+    FROM {movies} WHERE rating IS NOT NULL AND {user_filter} GROUP BY 1, 3
+    UNION ALL
+    SELECT user_id, 'decade', CAST(year / 10 * 10 AS TEXT), count(*), count(rating), coalesce(sum(rating), 0.0)
+    FROM {movies} WHERE year IS NOT NULL AND {user_filter} GROUP BY 1, 3
+    UNION ALL
+    SELECT user_id, 'director', director, count(*), count(rating), coalesce(sum(rating), 0.0)
+    FROM {movies} WHERE director IS NOT NULL AND director NOT IN ('', 'N/A') AND {user_filter} GROUP BY 1, 3
+"""
+
+
+def _user_stats(connection):
+    """
+    Version 4: the UserStat summary table, filled from the existing movies.
+    """
+    if not _table_exists(connection, 'Movie'):
+        return ""
+    return f"""
+        CREATE TABLE IF NOT EXISTS "UserStat" (
+            user_id INTEGER NOT NULL,
+            dimension VARCHAR NOT NULL,
+            "key" VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            rated_count INTEGER NOT NULL,
+            rating_sum FLOAT NOT NULL,
+            PRIMARY KEY (user_id, dimension, "key"),
+            FOREIGN KEY(user_id) REFERENCES "User" (id)
+        );
+        CREATE INDEX IF NOT EXISTS ix_user_stat_user_id_dimension_count ON "UserStat" (user_id, dimension, count);
+        DELETE FROM "UserStat";
+        INSERT INTO "UserStat" (user_id, dimension, "key", count, rated_count, rating_sum)
+        {USER_STATS_SELECT.format(movies=LEGACY_LIBRARY_MOVIES, user_filter="1")};
+    """
+
+
+# SQL twin of CatalogMovie.make_key for movies without an IMDb id, {table} is the Movie alias.
+CATALOG_KEY_SQL = ("'title:' || lower(trim(coalesce({table}.title, ''))) || '|' || coalesce({table}.year, '')"
+                   " || '|' || lower(trim(coalesce({table}.director, '')))")
+CATALOG_BATCH_SIZE = 50_000
+
+CATALOG_SEARCH_INDEX = f"""
+    DROP TABLE IF EXISTS movie_fts;
+    CREATE VIRTUAL TABLE movie_fts USING fts5(
+        title, director, content = 'CatalogMovie', content_rowid = 'catalog_id', {FTS_OPTIONS}
+    );
+    {CATALOG_SEARCH_TRIGGERS}
+    INSERT INTO movie_fts (movie_fts) VALUES ('rebuild');
+"""
+
+
+def _movie_catalog(connection):
+    """
+    Version 5: the OMDb metadata moves to CatalogMovie, one row per distinct movie, and Movie keeps only
+    the per-user fields (user_id, catalog_id, the user's rating). Movie ids are kept, so reviews still match.
+    Rows are deduplicated by title, year and director, one movie_id range at a time so the GROUP BY
+    never has to hold the whole table.
+    """
+    if not _table_exists(connection, 'Movie') or _column_exists(connection, 'Movie', 'catalog_id'):
+        return ""
+    max_movie_id = connection.execute('SELECT coalesce(max(movie_id), 0) FROM "Movie"').fetchone()[0]
+    batches = range(0, max_movie_id + 1, CATALOG_BATCH_SIZE)
+    key = CATALOG_KEY_SQL.format(table="m")
+    script = ["""
+        CREATE TABLE IF NOT EXISTS "CatalogMovie" (
+            catalog_id INTEGER NOT NULL,
+            catalog_key VARCHAR NOT NULL,
+            imdb_id VARCHAR,
+            title VARCHAR,
+            year INTEGER,
+            director VARCHAR,
+            imdb_rating FLOAT,
+            poster VARCHAR,
+            poster_hash VARCHAR,
+            PRIMARY KEY (catalog_id)
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_catalog_movie_catalog_key ON "CatalogMovie" (catalog_key);
+    """]
+    for start in batches:
+        # min(movie_id) makes the bare columns come from the oldest copy of each movie.
+        script.append(f"""
+            INSERT OR IGNORE INTO "CatalogMovie" (catalog_key, title, year, director, imdb_rating, poster, poster_hash)
+            SELECT {key}, m.title, m.year, m.director, m.rating, m.poster, m.poster_hash
+            FROM (SELECT *, min(movie_id) FROM "Movie" AS m
+                  WHERE m.movie_id >= {start} AND m.movie_id < {start + CATALOG_BATCH_SIZE}
+                  GROUP BY {key}) AS m;
+        """)
+    script.append("""
+        CREATE TABLE "Movie_new" (
+            movie_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            catalog_id INTEGER NOT NULL,
+            rating FLOAT,
+            PRIMARY KEY (movie_id),
+            FOREIGN KEY(user_id) REFERENCES "User" (id),
+            FOREIGN KEY(catalog_id) REFERENCES "CatalogMovie" (catalog_id)
+        );
+    """)
+    for start in batches:
+        script.append(f"""
+            INSERT INTO "Movie_new" (movie_id, user_id, catalog_id, rating)
+            SELECT m.movie_id, m.user_id, c.catalog_id, m.rating
+            FROM "Movie" AS m JOIN "CatalogMovie" AS c ON c.catalog_key = {key}
+            WHERE m.movie_id >= {start} AND m.movie_id < {start + CATALOG_BATCH_SIZE};
+        """)
+    script.append(f"""
+        DROP TABLE "Movie";
+        ALTER TABLE "Movie_new" RENAME TO "Movie";
+        CREATE INDEX IF NOT EXISTS ix_movie_user_id_movie_id ON "Movie" (user_id, movie_id);
+        CREATE INDEX IF NOT EXISTS ix_movie_catalog_id ON "Movie" (catalog_id);
+        {CATALOG_SEARCH_INDEX}
+    """)
+    return "".join(script)
+
+
+def _movie_neighbors(connection):
+    """
+    Version 6: MovieNeighbor, the persisted neighbour lists of the recommender, and NeighborQueue, the
+    movies whose lists are out of date. Every movie starts queued, the first refresh rebuilds all lists.
+    The catalog_id index of Movie gets user_id too, so counting the libraries holding a movie is covered.
+    """
+    if not _table_exists(connection, 'Movie'):
+        return ""
+    return """
+        CREATE TABLE IF NOT EXISTS "MovieNeighbor" (
+            catalog_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            co_count INTEGER NOT NULL,
+            score FLOAT NOT NULL,
+            PRIMARY KEY (catalog_id, neighbor_id),
+            FOREIGN KEY(catalog_id) REFERENCES "CatalogMovie" (catalog_id),
+            FOREIGN KEY(neighbor_id) REFERENCES "CatalogMovie" (catalog_id)
+        );
+        CREATE INDEX IF NOT EXISTS ix_movie_neighbor_neighbor_id ON "MovieNeighbor" (neighbor_id);
+        CREATE TABLE IF NOT EXISTS "NeighborQueue" (
+            catalog_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (catalog_id)
+        );
+        INSERT OR IGNORE INTO "NeighborQueue" (catalog_id, version) SELECT DISTINCT catalog_id, 1 FROM "Movie";
+        DROP INDEX IF EXISTS ix_movie_catalog_id;
+        CREATE INDEX IF NOT EXISTS ix_movie_catalog_id_user_id ON "Movie" (catalog_id, user_id);
+    """
+
+
+# The tables version 7 rebuilds: their columns, definition and indexes.
+CASCADING_TABLES = {
+    "Movie": ("movie_id, user_id, catalog_id, rating", """
+        movie_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        catalog_id INTEGER NOT NULL,
+        rating FLOAT,
+        PRIMARY KEY (movie_id),
+        FOREIGN KEY(user_id) REFERENCES "User" (id) ON DELETE CASCADE,
+        FOREIGN KEY(catalog_id) REFERENCES "CatalogMovie" (catalog_id)
+    """, """
+        CREATE INDEX IF NOT EXISTS ix_movie_user_id_movie_id ON "Movie" (user_id, movie_id);
+        CREATE INDEX IF NOT EXISTS ix_movie_catalog_id_user_id ON "Movie" (catalog_id, user_id);
+    """),
+    "Review": ("review_id, movie_id, user_id, review", """
+        review_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        review VARCHAR,
+        PRIMARY KEY (review_id),
+        FOREIGN KEY(movie_id) REFERENCES "Movie" (movie_id) ON DELETE CASCADE,
+        FOREIGN KEY(user_id) REFERENCES "User" (id) ON DELETE CASCADE
+    """, """
+        CREATE INDEX IF NOT EXISTS ix_review_user_id_movie_id_review_id ON "Review" (user_id, movie_id, review_id);
+        CREATE INDEX IF NOT EXISTS ix_review_movie_id ON "Review" (movie_id);
+    """),
+    "UserStat": ('user_id, dimension, "key", count, rated_count, rating_sum', """
+        user_id INTEGER NOT NULL,
+        dimension VARCHAR NOT NULL,
+        "key" VARCHAR NOT NULL,
+        count INTEGER NOT NULL,
+        rated_count INTEGER NOT NULL,
+        rating_sum FLOAT NOT NULL,
+        PRIMARY KEY (user_id, dimension, "key"),
+        FOREIGN KEY(user_id) REFERENCES "User" (id) ON DELETE CASCADE
+    """, """
+        CREATE INDEX IF NOT EXISTS ix_user_stat_user_id_dimension_count ON "UserStat" (user_id, dimension, count);
+    """),
+    "MovieNeighbor": ("catalog_id, neighbor_id, co_count, score", """
+        catalog_id INTEGER NOT NULL,
+        neighbor_id INTEGER NOT NULL,
+        co_count INTEGER NOT NULL,
+        score FLOAT NOT NULL,
+        PRIMARY KEY (catalog_id, neighbor_id),
+        FOREIGN KEY(catalog_id) REFERENCES "CatalogMovie" (catalog_id) ON DELETE CASCADE,
+        FOREIGN KEY(neighbor_id) REFERENCES "CatalogMovie" (catalog_id) ON DELETE CASCADE
+    """, """
+        CREATE INDEX IF NOT EXISTS ix_movie_neighbor_neighbor_id ON "MovieNeighbor" (neighbor_id);
+    """),
+}
+
+
+def _cascading_foreign_keys(connection):
+    """
+    Version 7: the foreign keys to User, Movie and CatalogMovie get ON DELETE CASCADE, so deleting a user
+    deletes their movies, reviews and stats inside SQLite, and deleting a movie its reviews. Review gets an
+    index on movie_id, otherwise every cascaded movie delete would scan it.
+    SQLite cannot alter a constraint, so the tables are rebuilt. Rows are copied as they are, orphans left
+    by older versions included, `flask --app main clean-orphans` removes those.
+    """
+    script = []
+    for table, (columns, definition, indexes) in CASCADING_TABLES.items():
+        if not _table_exists(connection, table):
+            continue
+        script.append(f"""
+            CREATE TABLE "{table}_new" ({definition});
+            INSERT INTO "{table}_new" ({columns}) SELECT {columns} FROM "{table}";
+            DROP TABLE "{table}";
+            ALTER TABLE "{table}_new" RENAME TO "{table}";
+            {indexes}
+        """)
+        if table == "Review" and _table_exists(connection, 'review_fts'):
+            # Review ids are kept so the search index stays valid, only its triggers went with the old table.
+            script.append(REVIEW_SEARCH_TRIGGERS)
+    return "".join(script)
+
+
+def _fresh_schema(connection):
+    """
+    A database created by db.create_all() from the current models only lacks the search indexes.
+    """
+    return f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS review_fts USING fts5(
+            review, content = 'Review', content_rowid = 'review_id', {FTS_OPTIONS}
+        );
+        {REVIEW_SEARCH_TRIGGERS}
+        INSERT INTO review_fts (review_fts) VALUES ('rebuild');
+        {CATALOG_SEARCH_INDEX}
+    """
+
+
+# Each entry returns the SQL script that upgrades the schema by one version.
+# Run them after db.create_all(), so a fresh database already has its tables.
+MIGRATIONS = [
+    _typed_movie_columns_and_indexes,
+    _full_text_search,
+    _poster_hash_column,
+    _user_stats,
+    _movie_catalog,
+    _movie_neighbors,
+    _cascading_foreign_keys,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(connection, target=None):
+    """
+    Apply every pending migration in place, each one in its own transaction.
+    :param connection: a sqlite3 connection.
+    :param target: Stop at this schema version instead of the latest one.
+    :return: the list of versions that were applied.
+    """
+    applied = []
+    version = current_version(connection)
+    foreign_keys = connection.execute("PRAGMA foreign_keys").fetchone()[0]
+    if version == 0 and target is None and _column_exists(connection, 'Movie', 'catalog_id'):
+        # Created by db.create_all() with the current schema, there is nothing to migrate.
+        connection.commit()
+        connection.executescript(
+            f"BEGIN;\n{_fresh_schema(connection)}\nPRAGMA user_version = {SCHEMA_VERSION};\nCOMMIT;"
+        )
+        return list(range(1, SCHEMA_VERSION + 1))
+    for number, migration in enumerate(MIGRATIONS[version:target], start=version + 1):
+        connection.commit()
+        connection.execute("PRAGMA foreign_keys = OFF")
+        connection.executescript(
+            f"BEGIN;\n{migration(connection)}\nPRAGMA user_version = {number};\nCOMMIT;"
+        )
+        connection.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+        applied.append(number)
+    return applied
+
+
+def upgrade_engine(engine):
+    """
+    Run upgrade() on a raw connection of a SQLAlchemy engine.
+    """
+    with engine.connect() as connection:
+        return upgrade(connection.connection.driver_connection)
+
+
+def ensure_schema(db):
+    """
+    Create the tables and apply the pending migrations, only if the database is not at SCHEMA_VERSION yet,
+    so starting a worker on an up-to-date database costs a single PRAGMA query.
+    :param db: the Flask-SQLAlchemy extension, used within an app context.
+    :return: the list of versions that were applied.
+    """
+    with db.engine.connect() as connection:
+        if current_version(connection.connection.driver_connection) == SCHEMA_VERSION:
+            return []
+    db.create_all()
+    return upgrade_engine(db.engine)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/data.sqlite3'
+    with sqlite3.connect(path) as sqlite_connection:
+        versions = upgrade(sqlite_connection)
+    print(f"Applied migrations: {versions}" if versions else f"Already at version {SCHEMA_VERSION}")
@@ -0,0 +1,35 @@
+from sqlalchemy import event
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """
+    Run the configured PRAGMA statements on a freshly opened SQLite connection.
+    :param dbapi_connection: a sqlite3 connection.
+    :param pragmas: dictionary of pragma name to value, e.g. {"journal_mode": "WAL"}.
+    :return:
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def init_storage_profile(app, db):
+    """
+    Hook the SQLite pragmas from app.config['SQLITE_PRAGMAS'] onto every connection of the app's engine.
+    Engines for other databases are left alone.
+    :param app:
+    :param db:
+    :return:
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
@@ -0,0 +1,173 @@
+"""
+Background pipeline for movie additions, so a slow OMDb answer never holds a web worker.
+
+api.add_movie submits a job and returns straight away; a small pool of worker threads
+does the OMDb lookup (with retries) and the insert, and the page polls the job status.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from data_manager.omdb_client import omdb_client
+from poster_cache import poster_cache
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+
+
+class MovieJobQueue:
+    def __init__(self, data_manager, lookup=None, workers=4, max_queue=100, retries=3, backoff=0.5,
+                 job_timeout=30, keep_finished=1000, posters=None):
+        """
+        Initialize a new instance of MovieJobQueue class.
+        :param data_manager: Manager the movies are added with.
+        :param lookup: Callable resolving a title, raising on connection errors. Defaults to the shared OMDb client.
+        :param workers: Number of worker threads.
+        :param max_queue: Maximum number of waiting jobs, submit() raises queue.Full beyond that.
+        :param retries: How many times a failed lookup is retried.
+        :param backoff: First retry delay in seconds, doubled on every retry.
+        :param job_timeout: Seconds after which a job stops retrying and is marked failed.
+        :param keep_finished: Number of finished jobs kept around for status polling.
+        :param posters: PosterCache the posters are downloaded into. Defaults to the shared one.
+        """
+        self.data_manager = data_manager
+        self.lookup = lookup or (lambda title: omdb_client.lookup(title, raise_errors=True))
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.job_timeout = job_timeout
+        self.keep_finished = keep_finished
+        self.posters = posters or poster_cache
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counters = {"submitted": 0, "rejected": 0, "retries": 0, "running": 0,
+                          DONE: 0, NOT_FOUND: 0, FAILED: 0}
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"movie-job-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, user_id, title, app=None):
+        """
+        Queue the addition of a movie for a user.
+        :param app: Flask app whose context the insert runs in (needed by SQLiteDataManager).
+        :return: the job dictionary, its "id" is used to poll the status.
+        :raises queue.Full: when too many additions are already waiting.
+        """
+        self._start_workers()
+        job = {
+            "id": next(self._ids),
+            "user_id": user_id,
+            "title": title,
+            "status": PENDING,
+            "attempts": 0,
+            "error": None,
+            "movie": None,
+            "submitted_at": time.time(),
+        }
+        try:
+            self._queue.put_nowait((job, app))
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.keep_finished + self._queue.maxsize + self.workers:
+                self._jobs.popitem(last=False)
+        return dict(job)
+
+    def get(self, job_id):
+        """
+        Return a copy of a job by its id, None if it is unknown or long forgotten.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _resolve(self, job):
+        """
+        Look the title up, retrying connection errors with exponential backoff until the job times out.
+        """
+        deadline = job["submitted_at"] + self.job_timeout
+        delay = self.backoff
+        while True:
+            self._update(job, attempts=job["attempts"] + 1)
+            try:
+                return self.lookup(job["title"])
+            except Exception as error:
+                self._update(job, error=str(error))
+                if job["attempts"] > self.retries or time.time() + delay > deadline:
+                    raise
+            with self._lock:
+                self._counters["retries"] += 1
+            time.sleep(delay)
+            delay *= 2
+
+    def _run(self, job, app):
+        if time.time() > job["submitted_at"] + self.job_timeout:
+            raise TimeoutError("The job timed out while waiting in the queue")
+        movie_data = self._resolve(job)
+        if movie_data is None:
+            return NOT_FOUND, None
+        self.posters.attach(movie_data)
+        if app is not None:
+            with app.app_context():
+                added = self.data_manager.add_movie_for_user(job["user_id"], movie_data)
+        else:
+            added = self.data_manager.add_movie_for_user(job["user_id"], movie_data)
+        if not added:
+            raise RuntimeError(f"The movie could not be saved for user {job['user_id']}")
+        return DONE, movie_data
+
+    def _work(self):
+        while True:
+            job, app = self._queue.get()
+            with self._lock:
+                self._counters["running"] += 1
+            self._update(job, status=RUNNING)
+            try:
+                status, movie_data = self._run(job, app)
+                self._update(job, status=status, movie=movie_data, error=None)
+            except Exception as error:
+                logger.error(f"Error adding '{job['title']}' for user {job['user_id']}: {error}")
+                status = FAILED
+                self._update(job, status=status, error=str(error))
+            finally:
+                with self._lock:
+                    self._counters["running"] -= 1
+                    self._counters[status] += 1
+                self._queue.task_done()
+
+    def stats(self):
+        """
+        Return queue depth, in-flight jobs and the outcome counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["workers"] = self.workers
+        return stats
@@ -0,0 +1,96 @@
+"""
+A local stand-in for the OMDb API and its poster image host, so the lookup and poster caches
+can be exercised offline.
+
+Run it with `python omdb_stub.py` and start the app with
+OMDB_BASE_URL=http://127.0.0.1:8765/ to point movies_api at it.
+"""
+import json
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MOVIES = {
+    "inception": {
+        "Title": "Inception", "Year": "2010", "Director": "Christopher Nolan",
+        "imdbRating": "8.8", "Poster": "posters/inception.png", "imdbID": "tt1375666", "Response": "True"
+    },
+    "titanic": {
+        "Title": "Titanic", "Year": "1997", "Director": "James Cameron",
+        "imdbRating": "7.9", "Poster": "posters/titanic.png", "imdbID": "tt0120338", "Response": "True"
+    },
+    "barbie": {
+        "Title": "Barbie", "Year": "2023", "Director": "Greta Gerwig",
+        "imdbRating": "6.8", "Poster": "N/A", "imdbID": "tt1517268", "Response": "True"
+    },
+}
+NOT_FOUND = {"Response": "False", "Error": "Movie not found!"}
+POSTER_COLORS = {"inception": (40, 60, 90), "titanic": (20, 40, 120)}
+
+
+def make_png(width, height, rgb):
+    """
+    Encode a plain-colored RGB image as PNG, so the stub needs no imaging library.
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+class OMDbStubHandler(BaseHTTPRequestHandler):
+    # Seconds to sleep before answering, to simulate a slow upstream.
+    delay = 0.0
+    request_count = 0
+
+    def do_GET(self):
+        type(self).request_count += 1
+        if self.delay:
+            time.sleep(self.delay)
+        url = urlparse(self.path)
+        if url.path.startswith("/posters/"):
+            return self._send_poster(url.path[len("/posters/"):].rsplit(".", 1)[0])
+        query = parse_qs(url.query)
+        title = " ".join(query.get("t", [""])[0].split()).casefold()
+        movie = dict(MOVIES.get(title, NOT_FOUND))
+        if movie.get("Poster", "N/A") != "N/A":
+            movie["Poster"] = f"http://{self.headers['Host']}/{movie['Poster']}"
+        body = json.dumps(movie).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_poster(self, name):
+        if name not in POSTER_COLORS:
+            self.send_error(404)
+            return
+        body = make_png(300, 450, POSTER_COLORS[name])
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host="127.0.0.1", port=0, delay=0.0):
+    """
+    Start the stub in a background thread.
+    :return: (server, base_url) - call server.shutdown() when done.
+    """
+    handler = type("OMDbStub", (OMDbStubHandler,), {"delay": delay, "request_count": 0})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+if __name__ == '__main__':
+    ThreadingHTTPServer(("127.0.0.1", 8765), OMDbStubHandler).serve_forever()
@@ -0,0 +1,92 @@
+"""
+A bounded LRU cache for rendered pages.
+
+Entries are keyed by the data version of their scope ("users" or "user:<id>"), so a write
+always leads to a new key and stale HTML can never be served, even when the write happened
+in another worker. The data managers also notify the cache of every change so entries of
+older versions are dropped right away instead of waiting for eviction.
+"""
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        """
+        Initialize a new instance of PageCache class.
+        :param max_entries: Maximum number of cached pages.
+        :param max_bytes: Maximum total size of the cached pages.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _remove(self, key):
+        html = self._entries.pop(key)
+        self._size -= len(html)
+
+    def get_or_render(self, scope, version, key, render):
+        """
+        Return the cached page for (scope, version, key), rendering and storing it on a miss.
+        :param scope: "users" or "user:<id>", matches the data manager's version scopes.
+        :param version: current data version of the scope, None disables caching.
+        :param key: anything else the page depends on, e.g. the query string.
+        :param render: callable returning the page as a string.
+        """
+        if version is None:
+            return render()
+        cache_key = (scope, version, key)
+        with self._lock:
+            html = self._entries.get(cache_key)
+            if html is not None:
+                self._entries.move_to_end(cache_key)
+                self._counters["hits"] += 1
+                return html
+            self._counters["misses"] += 1
+
+        html = render()
+        if len(html) > self.max_bytes:
+            return html
+        with self._lock:
+            if cache_key in self._entries:
+                self._remove(cache_key)
+            self._entries[cache_key] = html
+            self._size += len(html)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+        return html
+
+    def invalidate(self, *scopes):
+        """
+        Drop every cached page of the given scopes, called by the data managers after a write.
+        """
+        scopes = set(scopes)
+        with self._lock:
+            stale = [cache_key for cache_key in self._entries if cache_key[0] in scopes]
+            for cache_key in stale:
+                self._remove(cache_key)
+            self._counters["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Return the hit/miss counters, the hit rate and the current size of the cache.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+page_cache = PageCache()
@@ -0,0 +1,204 @@
+"""
+Local, content-addressed store for movie posters, so pages never hot-link OMDb/Amazon poster URLs.
+
+A poster is downloaded once when its movie is added and saved as data/posters/<ab>/<sha256>,
+next to pre-generated JPEG thumbnails. api.poster serves them with long-lived caching headers.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Set by _pillow().
+Image = None
+_pillow_imported = False
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_POSTER_DIR = os.path.join(BASE_DIR, 'data', 'posters')
+
+# Thumbnail widths in pixels, the card on user_movies.html is 250px wide.
+THUMBNAIL_SIZES = {"small": 160, "medium": 320}
+ORIGINAL = "original"
+MAX_POSTER_BYTES = 5 * 1024 * 1024
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _pillow():
+    """
+    Import Pillow on first use, like requests it is only needed once a poster is downloaded.
+    :return: PIL.Image, None if Pillow is not installed.
+    """
+    global Image, _pillow_imported
+    if not _pillow_imported:
+        try:
+            from PIL import Image as pil_image
+        except ImportError:  # Pillow is optional, without it every size serves the original image
+            pil_image = None
+        Image, _pillow_imported = pil_image, True
+    return Image
+
+
+def sniff_image_type(head):
+    """
+    Return the mimetype of an image from its first bytes, None if it is not a supported image.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class PosterCache:
+    def __init__(self, root=DEFAULT_POSTER_DIR, timeout=10, max_bytes=MAX_POSTER_BYTES, sizes=None):
+        """
+        Initialize a new instance of PosterCache class.
+        :param root: Directory the posters and thumbnails are stored in.
+        :param timeout: Download timeout in seconds.
+        :param max_bytes: Larger posters are not stored.
+        :param sizes: Thumbnail name -> width, defaults to THUMBNAIL_SIZES.
+        """
+        self.root = root
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.sizes = sizes or THUMBNAIL_SIZES
+        self._session = None
+        self._lock = threading.Lock()
+        self._digests_by_url = {}
+        self._counters = {"downloads": 0, "reused": 0, "failures": 0, "thumbnails": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def path(self, digest, size=ORIGINAL):
+        """
+        Return where a poster, or one of its thumbnails, is stored.
+        """
+        name = digest if size == ORIGINAL else f"{digest}_{size}.jpg"
+        return os.path.join(self.root, digest[:2], name)
+
+    @staticmethod
+    def _write_atomic(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fileobj:
+            fileobj.write(content)
+        os.replace(tmp_path, path)
+
+    def _get_session(self):
+        """
+        Create the download session on first use, so importing the cache does not import requests.
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+                self._session = session
+            return self._session
+
+    def _download(self, url):
+        with self._get_session().get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                content += chunk
+                if len(content) > self.max_bytes:
+                    raise ValueError(f"the poster is larger than {self.max_bytes} bytes")
+        return bytes(content)
+
+    def _make_thumbnails(self, digest, content):
+        if _pillow() is None:
+            return
+        with Image.open(io.BytesIO(content)) as image:
+            image = image.convert("RGB")
+            for size, width in self.sizes.items():
+                path = self.path(digest, size)
+                if os.path.exists(path):
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                thumbnail = image.resize((width, height), Image.LANCZOS) if image.width > width else image
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+                self._write_atomic(path, buffer.getvalue())
+                self._count("thumbnails")
+
+    def fetch(self, url):
+        """
+        Download a poster once and store it with its thumbnails.
+        :param url: Poster URL as returned by OMDb, "N/A" and empty values are ignored.
+        :return: the sha256 hex digest the poster is stored under, None if there is no usable poster.
+        """
+        if not url or not str(url).startswith(("http://", "https://")):
+            return None
+        with self._lock:
+            digest = self._digests_by_url.get(url)
+        if digest is not None and os.path.exists(self.path(digest)):
+            self._count("reused")
+            return digest
+        try:
+            content = self._download(url)
+            if sniff_image_type(content[:12]) is None:
+                raise ValueError("the response is not a supported image")
+            digest = hashlib.sha256(content).hexdigest()
+            if os.path.exists(self.path(digest)):
+                self._count("reused")
+            else:
+                self._write_atomic(self.path(digest), content)
+                self._count("downloads")
+            self._make_thumbnails(digest, content)
+        except Exception as error:
+            self._count("failures")
+            logger.error(f"Error caching the poster {url}: {error}")
+            return None
+        with self._lock:
+            self._digests_by_url[url] = digest
+        return digest
+
+    def attach(self, movie_info):
+        """
+        Cache the poster of a movie_info dictionary and store its digest under "poster_hash".
+        :return: the same dictionary.
+        """
+        movie_info["poster_hash"] = self.fetch(movie_info.get("poster"))
+        return movie_info
+
+    def file_for(self, digest, size):
+        """
+        Find the file to serve for a poster size, the original if that thumbnail was never generated.
+        :return: (path, mimetype), or None if the poster is unknown.
+        """
+        if not _DIGEST.match(digest) or (size != ORIGINAL and size not in self.sizes):
+            return None
+        if size != ORIGINAL and os.path.exists(self.path(digest, size)):
+            return self.path(digest, size), "image/jpeg"
+        try:
+            with open(self.path(digest), "rb") as fileobj:
+                mimetype = sniff_image_type(fileobj.read(12))
+        except FileNotFoundError:
+            return None
+        return self.path(digest), mimetype or "application/octet-stream"
+
+    def stats(self):
+        """
+        Return the download, reuse, failure and thumbnail counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["known_urls"] = len(self._digests_by_url)
+        stats["thumbnails_enabled"] = int(_pillow() is not None)
+        return stats
+
+
+poster_cache = PosterCache(os.environ.get('MOVIWEB_POSTER_DIR', DEFAULT_POSTER_DIR))
@@ -0,0 +1,107 @@
+"""
+Background upkeep of the recommendations, so adding or deleting a movie never waits for them.
+
+The data managers queue the movies whose neighbour lists went stale in the same transaction as the
+change and notify their listeners; the refresher wakes up on user changes, waits a moment so a burst of
+additions is handled in one pass, and brings the queued lists up to date (see refresh_recommendations).
+It also runs every few minutes, to pick up changes made by other processes.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationRefresher:
+    def __init__(self, data_manager, delay=2.0, interval=300, batch_size=100):
+        """
+        Initialize a new instance of RecommendationRefresher class.
+        :param data_manager: Data manager whose queued neighbour lists are refreshed, the JSON ones queue none.
+        :param delay: Seconds to wait after a change before refreshing, changes in between are batched.
+        :param interval: Seconds between two refreshes when nothing changed in this process.
+        :param batch_size: Maximum number of queued movies refreshed per pass.
+        """
+        self.data_manager = data_manager
+        self.delay = delay
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._app = None
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._counters = {"notifications": 0, "runs": 0, "failures": 0, "refreshed": 0}
+        self._last_seconds = 0.0
+
+    def start(self, app):
+        """
+        Start the background thread, once. Called on the first request rather than at import time,
+        so CLI commands such as migrate-json never compete with it for the database.
+        :param app: Flask app whose context the refreshes run in.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._work, name="recommendation-refresher", daemon=True)
+            self._thread.start()
+
+    def notify(self, *scopes):
+        """
+        Data manager listener: wake the refresher when a user's library may have changed.
+        """
+        if any(scope.startswith("user:") for scope in scopes):
+            with self._lock:
+                self._counters["notifications"] += 1
+            self._changed.set()
+
+    def _work(self):
+        while True:
+            if self._changed.wait(self.interval):
+                time.sleep(self.delay)
+            self._changed.clear()
+            try:
+                self.run_once()
+            except Exception as error:
+                # A failed pass must not end the thread, the next change or interval retries.
+                logger.error(f"Error refreshing the recommendations: {error}")
+                with self._lock:
+                    self._counters["runs"] += 1
+                    self._counters["failures"] += 1
+
+    def run_once(self, app=None):
+        """
+        Refresh the queued neighbour lists until the queue is empty.
+        :param app: Flask app to run in, defaults to the one given to start().
+        :return: the number of movies refreshed (or neighbour rows rebuilt), None if a pass failed.
+        """
+        started = time.perf_counter()
+        total = 0
+        with (app or self._app).app_context():
+            while True:
+                refreshed = self.data_manager.refresh_recommendations(limit=self.batch_size)
+                if refreshed is None:
+                    total = None
+                    break
+                total += refreshed
+                if refreshed < self.batch_size:
+                    break
+        with self._lock:
+            self._counters["runs"] += 1
+            if total is None:
+                self._counters["failures"] += 1
+            else:
+                self._counters["refreshed"] += total
+            self._last_seconds = time.perf_counter() - started
+        return total
+
+    def stats(self):
+        """
+        Return the run counters and the duration of the last pass.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["last_seconds"] = self._last_seconds
+        stats["running"] = int(self._thread is not None and self._thread.is_alive())
+        return stats
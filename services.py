@@ -0,0 +1,47 @@
+"""
+The objects shared by every request of an app: its data manager and what is built on it.
+
+create_app builds them once and stores them in app.extensions['moviweb']; the views, API and CLI
+commands reach them through the proxies below, which resolve to the current app's instances.
+"""
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from data_manager.async_data_manager import AsyncDataManager
+from movie_jobs import MovieJobQueue
+from recommendation_refresher import RecommendationRefresher
+
+EXTENSION = "moviweb"
+
+
+class Services:
+    def __init__(self, data_manager):
+        """
+        Initialize a new instance of Services class.
+        :param data_manager: JSONDataManager or SQLiteDataManager of the app.
+        """
+        self.data_manager = data_manager
+        # For async views, so independent queries can be awaited together.
+        self.async_data_manager = AsyncDataManager(data_manager)
+        self.movie_jobs = MovieJobQueue(data_manager)
+        self.recommendations = RecommendationRefresher(data_manager)
+
+
+def init_services(app, data_manager):
+    """
+    Create the shared objects of an app around its data manager.
+    :return: the Services instance, also stored in app.extensions['moviweb'].
+    """
+    services = Services(data_manager)
+    app.extensions[EXTENSION] = services
+    return services
+
+
+def _current(name):
+    return LocalProxy(lambda: getattr(current_app.extensions[EXTENSION], name))
+
+
+data_manager = _current("data_manager")
+async_data_manager = _current("async_data_manager")
+movie_jobs = _current("movie_jobs")
+recommendations = _current("recommendations")
@@ -0,0 +1,52 @@
+"""
+Shared fixtures. The app imports its modules both from the repository root (`services`, `data_manager`)
+and as the `Moviweb_app` package, so both the root and its parent directory go on sys.path; the checkout
+has to be named Moviweb_app, as for running the app.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.dirname(ROOT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from config import Config  # noqa: E402
+from omdb_stub import start_stub  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    An app built by create_app on an empty SQLite database in a temporary directory.
+    """
+    from main import create_app
+
+    class TestConfig(Config):
+        TESTING = True
+        DATABASE_PATH = str(tmp_path / "test.sqlite3")
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{DATABASE_PATH}"
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def data_manager(app):
+    """
+    The app's data manager, inside an app context.
+    """
+    with app.app_context():
+        yield app.extensions["moviweb"].data_manager
+
+
+@pytest.fixture
+def omdb_stub():
+    """
+    A local OMDb stand-in: yields (server, base_url), server.RequestHandlerClass.request_count counts requests.
+    """
+    server, base_url = start_stub()
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,137 @@
+import pytest
+
+import api
+from Moviweb_app.models.data_models import Review, User
+from data_manager.batch import check_operations
+from data_manager.json_data_manager import JSONDataManager
+
+LIBRARY = [{"title": f"Movie {number}", "director": f"Director {number}", "year": str(2000 + number),
+            "rating": "5.0", "poster": "N/A", "imdb_id": f"tt{number:07d}"} for number in range(5)]
+
+
+def sqlite_library(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    assert data_manager.add_movies_for_user(user.id, LIBRARY)
+    return user.id, [movie.movie_id for movie in data_manager.get_user_movie(user.id)]
+
+
+def json_library(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("[]")
+    data_manager = JSONDataManager(str(path))
+    data_manager.add_user({"id": 1, "name": "Alice", "movies": []})
+    assert data_manager.add_movies_for_user(1, LIBRARY)
+    return data_manager, [movie["movie_id"] for movie in data_manager.get_user_movie(1)]
+
+
+def ratings(movies):
+    """
+    Title -> rating of SQLite Movie rows or JSON movie dictionaries.
+    """
+    movies = [movie if isinstance(movie, dict) else movie.to_dict() for movie in movies]
+    return {movie["title"]: float(movie["rating"]) for movie in movies}
+
+
+@pytest.mark.parametrize("operation, message", [
+    ({"op": "update_rating", "movie_id": 1, "rating": "abc"}, "rating must be a number"),
+    ({"op": "update_rating", "movie_id": 1, "rating": None}, "rating must be a number"),
+    ({"op": "update_rating", "movie_id": 1, "rating": True}, "rating must be a number"),
+    ({"op": "update_rating", "movie_id": 1, "rating": "nan"}, "rating must be between 0 and 10"),
+    ({"op": "update_rating", "movie_id": 1, "rating": 99}, "rating must be between 0 and 10"),
+    ({"op": "update_rating", "movie_id": 1, "rating": -1}, "rating must be between 0 and 10"),
+    ({"op": "add_review", "movie_id": 1, "review": {"x": 1}}, "review must be a non-empty string"),
+    ({"op": "add_review", "movie_id": 1, "review": 123}, "review must be a non-empty string"),
+    ({"op": "add_review", "movie_id": 1, "review": "  "}, "review must be a non-empty string"),
+    ({"op": "delete_movie", "movie_id": "1"}, "movie_id must be an integer"),
+    ({"op": "delete_review"}, "missing review_id"),
+    ({"op": "rename"}, "unsupported op 'rename'"),
+])
+def test_invalid_operations_are_rejected(operation, message):
+    with pytest.raises(ValueError, match=f"^Operation 1: {message}"):
+        check_operations([{"op": "delete_movie", "movie_id": 1}, operation])
+
+
+def test_ratings_are_stored_as_numbers():
+    assert check_operations([{"op": "update_rating", "movie_id": 1, "rating": "8.5", "extra": 1}]) == [
+        {"op": "update_rating", "movie_id": 1, "rating": 8.5}]
+
+
+def test_invalid_batch_changes_nothing(data_manager, tmp_path):
+    user_id, movie_ids = sqlite_library(data_manager)
+    json_manager, json_movie_ids = json_library(tmp_path)
+    for manager, owner, ids in ((data_manager, user_id, movie_ids), (json_manager, 1, json_movie_ids)):
+        with pytest.raises(ValueError):
+            manager.apply_batch(owner, [{"op": "delete_movie", "movie_id": ids[0]},
+                                        {"op": "update_rating", "movie_id": ids[1], "rating": 99}])
+        assert ratings(manager.get_user_movie(owner)) == ratings(LIBRARY)
+
+
+def test_failing_statement_rolls_the_whole_batch_back(data_manager, monkeypatch):
+    user_id, movie_ids = sqlite_library(data_manager)
+    run_batch = data_manager._run_batch
+
+    def fail_on_reviews(user_id, op, run):
+        if op == "add_review":
+            raise RuntimeError("disk I/O error")
+        return run_batch(user_id, op, run)
+
+    monkeypatch.setattr(data_manager, "_run_batch", fail_on_reviews)
+    assert data_manager.apply_batch(user_id, [
+        {"op": "delete_movie", "movie_id": movie_ids[0]},
+        {"op": "update_rating", "movie_id": movie_ids[1], "rating": 9},
+        {"op": "add_review", "movie_id": movie_ids[1], "review": "Great"},
+    ]) is None
+    assert ratings(data_manager.get_user_movie(user_id)) == ratings(LIBRARY)
+
+
+def test_sqlite_and_json_batches_agree(data_manager, tmp_path):
+    user_id, movie_ids = sqlite_library(data_manager)
+    json_manager, json_movie_ids = json_library(tmp_path)
+
+    def batch(ids):
+        return [{"op": "update_rating", "movie_id": ids[0], "rating": 7},
+                {"op": "update_rating", "movie_id": ids[1], "rating": "6.5"},
+                {"op": "update_rating", "movie_id": ids[0], "rating": 9.5},
+                {"op": "delete_movie", "movie_id": ids[2]},
+                {"op": "delete_movie", "movie_id": 12345},
+                {"op": "update_rating", "movie_id": ids[2], "rating": 1}]
+
+    sqlite_counts = data_manager.apply_batch(user_id, batch(movie_ids))
+    json_counts = json_manager.apply_batch(1, batch(json_movie_ids))
+    assert sqlite_counts == {"delete_movie": 1, "update_rating": 2, "add_review": 0, "delete_review": 0}
+    assert json_counts == {"delete_movie": 1, "update_rating": 2}
+    assert ratings(data_manager.get_user_movie(user_id)) == ratings(json_manager.get_user_movie(1)) == {
+        "Movie 0": 9.5, "Movie 1": 6.5, "Movie 3": 5.0, "Movie 4": 5.0}
+
+
+def test_batch_endpoint(app, data_manager, monkeypatch):
+    user_id, movie_ids = sqlite_library(data_manager)
+    client = app.test_client()
+    url = f"/api/v1/users/{user_id}/batch"
+
+    response = client.post(url, json={"operations": [
+        {"op": "update_rating", "movie_id": movie_ids[0], "rating": "8"},
+        {"op": "add_review", "movie_id": movie_ids[0], "review": "Great"},
+        {"op": "delete_movie", "movie_id": movie_ids[1]},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()["applied"] == {"update_rating": 1, "add_review": 1, "delete_movie": 1,
+                                              "delete_review": 0}
+
+    monkeypatch.setattr(api, "MAX_BATCH_OPERATIONS", 2)
+    for payload, error in [
+        ([], "Expected a JSON object with an 'operations' list."),
+        ({"operations": {"op": "delete_movie"}}, "Expected a JSON object with an 'operations' list."),
+        ({"operations": [{"op": "delete_movie", "movie_id": 1}] * 3}, "At most 2 operations per batch."),
+        ({"operations": [{"op": "update_rating", "movie_id": movie_ids[0], "rating": "abc"}]},
+         "Operation 0: rating must be a number."),
+        ({"operations": [{"op": "delete_movie", "movie_id": movie_ids[2]},
+                         {"op": "add_review", "movie_id": movie_ids[2], "review": 123}]},
+         "Operation 1: review must be a non-empty string."),
+    ]:
+        response = client.post(url, json=payload)
+        assert response.status_code == 400 and response.get_json() == {"error": error}
+    assert client.post("/api/v1/users/999/batch", json={"operations": []}).status_code == 404
+    assert len(data_manager.get_user_movie(user_id)) == len(LIBRARY) - 1
+    assert Review.query.count() == 1
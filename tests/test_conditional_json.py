@@ -0,0 +1,74 @@
+import gzip
+import json
+
+import pytest
+
+import http_utils
+from Moviweb_app.models.data_models import User
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+         "poster": "N/A", "imdb_id": "tt1375666"}
+
+
+@pytest.fixture
+def library(data_manager):
+    """
+    A user whose movies page is well above COMPRESS_MIN_SIZE, and a user with a page below it.
+    """
+    user, small = User(name="Alice"), User(name="Bob")
+    assert data_manager.add_user(user) and data_manager.add_user(small)
+    assert data_manager.add_movies_for_user(user.id, [{**MOVIE, "title": f"Movie {number}",
+                                                       "imdb_id": f"tt{number:07d}"} for number in range(20)])
+    return f"/api/v1/users/{user.id}/movies", f"/api/v1/users/{small.id}/movies", user.id
+
+
+def test_if_none_match_gets_a_304_until_the_data_changes(app, data_manager, library):
+    url, _, user_id = library
+    client = app.test_client()
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and response.headers["Cache-Control"] == "no-cache"
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b"" and response.headers["ETag"] == etag
+    # Another URL, or another page of the same list, is another resource.
+    assert client.get(url + "?limit=5", headers={"If-None-Match": etag}).status_code == 200
+
+    assert data_manager.add_movie_for_user(user_id, {**MOVIE, "title": "New"})
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert response.get_json()["movies"][-1]["title"] == "New"
+
+
+def test_gzip_is_negotiated_with_its_own_etag(app, library):
+    url, small_url, _ = library
+    client = app.test_client()
+    plain = client.get(url)
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip" and response.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    assert len(response.data) < len(plain.data)
+    assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert client.get(url, headers={"Accept-Encoding": "gzip",
+                                    "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    # Small bodies are sent as they are.
+    response = client.get(small_url, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers and response.get_json()["movies"] == []
+
+
+def test_brotli_falls_back_when_it_is_not_installed(app, library, monkeypatch):
+    url, _, _ = library
+    monkeypatch.setattr(http_utils, "brotli", None)
+    client = app.test_client()
+    assert client.get(url, headers={"Accept-Encoding": "br, gzip"}).headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in client.get(url, headers={"Accept-Encoding": "br"}).headers
+
+
+def test_brotli_is_preferred_when_installed(app, library):
+    brotli = pytest.importorskip("brotli")
+    url, _, _ = library
+    client = app.test_client()
+    response = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br" and response.headers["ETag"].endswith('-br"')
+    assert json.loads(brotli.decompress(response.data)) == client.get(url).get_json()
@@ -0,0 +1,96 @@
+import sqlite3
+
+from Moviweb_app.models.data_models import CatalogMovie, Movie, MovieNeighbor, Review, User, UserStat, db
+
+LIBRARY = [{"title": f"Movie {number}", "director": f"Director {number}", "year": str(2000 + number),
+            "rating": "5.0", "poster": "N/A", "imdb_id": f"tt{number:07d}"} for number in range(3)]
+
+
+def add_reviewed_library(data_manager, name):
+    user = User(name=name)
+    assert data_manager.add_user(user)
+    assert data_manager.add_movies_for_user(user.id, LIBRARY)
+    movie_ids = [movie.movie_id for movie in data_manager.get_user_movie(user.id)]
+    for movie_id in movie_ids:
+        assert data_manager.add_review(user.id, movie_id, "Great")
+    return user.id, movie_ids
+
+
+def rows(model, **filters):
+    return db.session.query(model).filter_by(**filters).count()
+
+
+def test_delete_review_only_bumps_when_a_review_goes(data_manager):
+    user_id, movie_ids = add_reviewed_library(data_manager, "Alice")
+    other_id, other_movie_ids = add_reviewed_library(data_manager, "Bob")
+    review_id = data_manager.get_reviews(user_id, movie_ids[0])[0].review_id
+    version = data_manager.get_data_version(user_id)
+
+    assert data_manager.delete_review(user_id, movie_ids[0], 999) is False
+    assert data_manager.delete_review(other_id, other_movie_ids[0], review_id) is False
+    assert data_manager.get_data_version(user_id) == version
+
+    assert data_manager.delete_review(user_id, movie_ids[0], review_id) is True
+    assert data_manager.get_data_version(user_id) > version
+    assert data_manager.get_reviews(user_id, movie_ids[0]) is None
+    assert rows(Review) == 5
+
+
+def test_failed_delete_review_is_rolled_back(data_manager, monkeypatch):
+    user_id, movie_ids = add_reviewed_library(data_manager, "Alice")
+    review_id = data_manager.get_reviews(user_id, movie_ids[0])[0].review_id
+    version = data_manager.get_data_version(user_id)
+
+    def fail(*scopes):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(data_manager, "_bump_version", fail)
+    assert data_manager.delete_review(user_id, movie_ids[0], review_id) is False
+    monkeypatch.undo()
+    assert rows(Review) == 3 and data_manager.get_data_version(user_id) == version
+    assert data_manager.delete_review(user_id, movie_ids[0], review_id) is True
+
+
+def test_delete_movie_cascades_to_its_reviews(data_manager):
+    user_id, movie_ids = add_reviewed_library(data_manager, "Alice")
+    data_manager.delete_movie(user_id, movie_ids[0])
+    assert rows(Movie, user_id=user_id) == 2
+    assert rows(Review, movie_id=movie_ids[0]) == 0 and rows(Review) == 2
+
+
+def test_delete_user_cascades_to_everything_they_own(data_manager):
+    user_id, movie_ids = add_reviewed_library(data_manager, "Alice")
+    other_id, other_movie_ids = add_reviewed_library(data_manager, "Bob")
+    data_manager.delete_user(user_id)
+    db.session.expire_all()
+    assert db.session.get(User, user_id) is None
+    assert rows(Movie, user_id=user_id) == rows(Review, user_id=user_id) == rows(UserStat, user_id=user_id) == 0
+    assert rows(Movie, user_id=other_id) == 3 and rows(Review, user_id=other_id) == 3
+
+
+def test_clean_orphans(app, data_manager):
+    user_id, movie_ids = add_reviewed_library(data_manager, "Alice")
+    other_id, other_movie_ids = add_reviewed_library(data_manager, "Bob")
+    data_manager.add_movie_for_user(user_id, {**LIBRARY[0], "title": "Only Alice's", "imdb_id": "tt9999999"})
+    data_manager.refresh_recommendations()
+    db.session.commit()
+    # Delete the user the way older versions could, without the foreign keys.
+    with sqlite3.connect(app.config["DATABASE_PATH"]) as connection:
+        connection.execute('DELETE FROM "User" WHERE id = ?', (user_id,))
+    db.session.expire_all()
+
+    counts = data_manager.clean_orphans(dry_run=True)
+    assert counts["reviews"] == 3 and counts["movies"] == 4 and counts["user_stats"] > 0
+    assert counts["catalog_movies"] == 1
+    assert rows(Movie, user_id=user_id) == 4
+
+    result = app.test_cli_runner().invoke(args=["clean-orphans"])
+    assert result.exit_code == 0 and f"Deleted {sum(counts.values())} orphaned rows" in result.output
+    db.session.expire_all()
+    assert rows(Movie, user_id=user_id) == rows(Review, user_id=user_id) == rows(UserStat, user_id=user_id) == 0
+    assert rows(CatalogMovie) == 3 and rows(Movie, user_id=other_id) == 3 and rows(Review, user_id=other_id) == 3
+    assert rows(MovieNeighbor) > 0
+    catalog_ids = {movie.catalog_id for movie in db.session.query(Movie)}
+    assert all(neighbor.catalog_id in catalog_ids and neighbor.neighbor_id in catalog_ids
+               for neighbor in db.session.query(MovieNeighbor))
+    assert data_manager.clean_orphans() == dict.fromkeys(counts, 0)
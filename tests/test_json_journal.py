@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from data_manager.json_data_manager import JSONDataManager
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8", "poster": "N/A"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("[]")
+    return str(path)
+
+
+def fill(data_manager, users=3, movies=4):
+    for user_id in range(1, users + 1):
+        data_manager.add_user({"id": user_id, "name": f"User {user_id}", "movies": []})
+        data_manager.add_movies_for_user(user_id, [{**MOVIE, "title": f"Movie {number}"} for number in range(movies)])
+    data_manager.update_movie(1, 2, "Renamed", "Someone", "1999", "7.5")
+    data_manager.delete_movie(2, 1)
+    data_manager.update_user(3, "Carol")
+
+
+def contents(data_manager):
+    return {user["id"]: (user["name"], data_manager.get_user_movie(user["id"]))
+            for user in data_manager.get_all_users()}
+
+
+def journal_records(path):
+    with open(path + ".journal") as fileobj:
+        return [json.loads(line) for line in fileobj]
+
+
+def test_journal_is_replayed_on_open(path):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer)
+    with open(path) as fileobj:
+        assert json.load(fileobj) == []
+    assert len(journal_records(path)) == 9
+    assert contents(JSONDataManager(path, journal=True)) == contents(writer)
+
+
+def test_compact_folds_the_journal_into_the_snapshot(path):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer)
+    writer.compact()
+    assert not os.path.exists(path + ".journal") and not os.path.exists(path + ".journal.compacting")
+    with open(path) as fileobj:
+        assert {user["id"]: (user["name"], user["movies"]) for user in json.load(fileobj)} == contents(writer)
+    writer.add_movie_for_user(1, {**MOVIE, "title": "After compaction"})
+    assert len(journal_records(path)) == 1
+    assert contents(JSONDataManager(path, journal=True)) == contents(writer)
+
+
+def test_background_compaction_keeps_every_write(path):
+    writer = JSONDataManager(path, journal=True, fsync="never", compact_threshold=2048)
+    fill(writer, users=20, movies=10)
+    for number in range(50):
+        writer.update_movie(1 + number % 20, number % 10 + 1, f"Title {number}", "Director", "2000", "5.0")
+    writer._compactor.join()
+    assert os.path.getsize(path) > 2048
+    assert contents(JSONDataManager(path, journal=True)) == contents(writer)
+
+
+def test_writes_during_compaction_are_not_in_the_snapshot_copy(path, monkeypatch):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer)
+    taken = []
+    monkeypatch.setattr(writer, "_write_snapshot", lambda users, rewrites: taken.append((users, rewrites)))
+    writer.compact()
+    before = json.loads(json.dumps(taken[0][0]))
+    # Every kind of change the live store can make while the copy is serialized.
+    writer.update_movie(1, 1, "Changed", "Someone", "1999", "1.0")
+    writer.add_movie_for_user(1, {**MOVIE, "title": "Added"})
+    writer.delete_movie(2, 2)
+    writer.update_user(3, "Renamed")
+    writer.apply_batch(1, [{"op": "update_rating", "movie_id": 2, "rating": 9}])
+    assert json.loads(json.dumps(taken[0][0])) == before
+    monkeypatch.undo()
+    writer._write_snapshot(*taken[0])
+    with open(path) as fileobj:
+        assert json.load(fileobj) == before
+    assert contents(JSONDataManager(path, journal=True)) == contents(writer)
+
+
+def test_compaction_never_overwrites_a_newer_update_json(path, monkeypatch):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer)
+    taken = []
+    monkeypatch.setattr(writer, "_write_snapshot", lambda users, rewrites: taken.append((users, rewrites)))
+    writer.compact()
+    monkeypatch.undo()
+    replacement = [{"id": 7, "name": "Replacement", "movies": []}]
+    writer.update_json(replacement)
+    writer._write_snapshot(*taken[0])
+    with open(path) as fileobj:
+        assert json.load(fileobj) == replacement
+    assert [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")] == []
+
+
+def test_crash_between_rotation_and_rename_is_recovered(path):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer, users=2)
+    os.replace(path + ".journal", path + ".journal.compacting")
+    writer.add_movie_for_user(2, {**MOVIE, "title": "Written after the rotation"})
+    reader = JSONDataManager(path, journal=True)
+    assert contents(reader) == contents(writer)
+    assert reader.get_user_movie(2)[-1]["title"] == "Written after the rotation"
+
+
+def test_torn_last_record_is_cut_off(path, caplog):
+    writer = JSONDataManager(path, journal=True)
+    fill(writer)
+    expected = contents(writer)
+    complete_size = os.path.getsize(path + ".journal")
+    line = json.dumps({"op": "add_movie", "user_id": 1, "movie": {**MOVIE, "movie_id": 99}}).encode()
+    with open(path + ".journal", "ab") as fileobj:
+        fileobj.write(line[:len(line) // 2])
+    assert contents(JSONDataManager(path, journal=True)) == expected
+    assert "Discarding an incomplete record" in caplog.text
+    assert os.path.getsize(path + ".journal") == complete_size
+    reopened = JSONDataManager(path, journal=True)
+    reopened.add_movie_for_user(1, {**MOVIE, "title": "After the crash"})
+    assert contents(JSONDataManager(path, journal=True)) == contents(reopened)
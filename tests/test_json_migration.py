@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from Moviweb_app.models.data_models import Movie, Review, User, db
+from data_manager.json_data_manager import PLACEHOLDER_TITLE
+from json_migration import MigrationError, migrate_json
+
+USERS = 6
+MOVIES = 3
+
+
+@pytest.fixture
+def source(tmp_path):
+    """
+    A JSON data file where every user numbers their movies from 1, as JSONDataManager does.
+    """
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps([
+        {"id": user_id * 10, "name": f"User {user_id}",
+         "movies": [{"movie_id": 1, "title": PLACEHOLDER_TITLE}] + [
+             {"movie_id": number, "title": f"Movie {user_id}.{number}", "director": "Someone", "year": "2000",
+              "rating": str(number), "poster": "N/A"} for number in range(2, MOVIES + 2)],
+         "reviews": [{"movie_id": 2, "review": f"Review by {user_id}"}]}
+        for user_id in range(1, USERS + 1)]))
+    return str(path)
+
+
+def library():
+    return sorted((movie.user_id, movie.title, movie.rating) for movie in db.session.query(Movie))
+
+
+def test_migrate_json_keeps_users_and_renumbers_colliding_movies(app, data_manager, source):
+    result = app.test_cli_runner().invoke(args=["migrate-json", source, "--batch-size", "5"])
+    assert result.exit_code == 0, result.output
+    assert f"Migrated {USERS} users, {USERS * MOVIES} movies and {USERS} reviews, " \
+           f"{(USERS - 1) * MOVIES} movies got a new id." in result.output
+    assert sorted(user.id for user in db.session.query(User)) == [user_id * 10 for user_id in range(1, USERS + 1)]
+    assert len(library()) == USERS * MOVIES and PLACEHOLDER_TITLE not in {row[1] for row in library()}
+    for review in db.session.query(Review):
+        assert db.session.get(Movie, review.movie_id).title == f"Movie {review.user_id // 10}.2"
+    assert data_manager.check_user_stats() == []
+
+    result = app.test_cli_runner().invoke(args=["migrate-json", source])
+    assert result.exit_code == 0 and "was already migrated" in result.output
+
+
+def interrupt_after(data_manager, monkeypatch, batches):
+    """
+    Make the migration stop like a killed process once some batches are committed.
+    """
+    import_users = data_manager.import_users
+    committed = []
+
+    def import_or_crash(users, before_commit=None):
+        if len(committed) == batches:
+            raise KeyboardInterrupt
+        committed.append(users)
+        return import_users(users, before_commit=before_commit)
+
+    monkeypatch.setattr(data_manager, "import_users", import_or_crash)
+
+
+def test_interrupted_migration_resumes_after_the_last_commit(data_manager, source, monkeypatch):
+    interrupt_after(data_manager, monkeypatch, 2)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_json(source, data_manager, batch_size=MOVIES, progress=lambda line: None)
+    assert db.session.query(User).count() == 2
+    monkeypatch.undo()
+
+    progress = []
+    totals = migrate_json(source, data_manager, batch_size=MOVIES, progress=progress.append)
+    assert progress[0] == "Resuming after 2 users."
+    assert totals == {"users": USERS, "movies": USERS * MOVIES, "reviews": USERS, "renumbered": (USERS - 1) * MOVIES}
+    assert db.session.query(User).count() == USERS and len(library()) == USERS * MOVIES
+    assert db.session.query(Review).count() == USERS
+    assert data_manager.check_user_stats() == []
+
+
+def test_a_changed_file_cannot_be_resumed(data_manager, source, monkeypatch):
+    interrupt_after(data_manager, monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_json(source, data_manager, batch_size=MOVIES, progress=lambda line: None)
+    monkeypatch.undo()
+    with open(source, "a") as fileobj:
+        fileobj.write("\n")
+    with pytest.raises(MigrationError, match="changed since the migration started"):
+        migrate_json(source, data_manager)
+
+
+def test_migration_refuses_to_start(data_manager, source):
+    assert data_manager.add_user(User(name="Alice"))
+    with pytest.raises(MigrationError, match="already has users"):
+        migrate_json(source, data_manager)
+    open(source + ".journal", "w").close()
+    with pytest.raises(MigrationError, match="has a journal"):
+        migrate_json(source, data_manager)
+    os.remove(source + ".journal")
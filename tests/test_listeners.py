@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from Moviweb_app.models.data_models import User
+from data_manager.json_data_manager import JSONDataManager
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+         "poster": "N/A", "imdb_id": "tt1375666"}
+
+
+def committed_version(app, scope):
+    """
+    Read a DataVersion counter over a separate connection, so only committed changes are seen.
+    """
+    with sqlite3.connect(app.config["DATABASE_PATH"]) as connection:
+        row = connection.execute("SELECT version FROM DataVersion WHERE scope = ?", (scope,)).fetchone()
+    return row and row[0]
+
+
+def test_sqlite_listeners_are_notified_after_commit(app, data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    scope = f"user:{user.id}"
+    notified = []
+    data_manager.add_listener(lambda *scopes: notified.append((scopes, committed_version(app, scope))))
+
+    assert data_manager.add_movie_for_user(user.id, MOVIE)
+    assert notified == [((scope,), 1)]
+
+
+def test_sqlite_listeners_are_not_notified_of_rollbacks(data_manager):
+    notified = []
+    data_manager.add_listener(lambda *scopes: notified.append(scopes))
+    # The foreign key check fails at commit, after the version was bumped.
+    assert not data_manager.add_movie_for_user(999, MOVIE)
+    assert notified == []
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    assert notified == [("users",)]
+
+
+def json_manager(tmp_path, **options):
+    path = tmp_path / "data.json"
+    if not path.exists():
+        path.write_text("[]")
+    return JSONDataManager(str(path), **options)
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_json_writes_notify_once(tmp_path, journal):
+    data_manager = json_manager(tmp_path, journal=journal)
+    notified = []
+    data_manager.add_listener(lambda *scopes: notified.append(scopes))
+    data_manager.add_user(data_manager.create_user_details(1, "Alice"))
+    assert notified == [("users", "user:1", "recommendations")]
+    version = data_manager.get_data_version(1)
+    data_manager.add_movies_for_user(1, [MOVIE, {**MOVIE, "title": "Titanic", "imdb_id": "tt0120338"}])
+    assert notified[1:] == [("user:1", "recommendations")]
+    assert data_manager.get_data_version(1) != version
+
+
+def test_json_journal_replay_does_not_notify(tmp_path):
+    writer = json_manager(tmp_path, journal=True)
+    writer.add_user(writer.create_user_details(1, "Alice"))
+    writer.add_movie_for_user(1, MOVIE)
+    reader = json_manager(tmp_path, journal=True)
+    notified = []
+    reader.add_listener(lambda *scopes: notified.append(scopes))
+    assert "Inception" in [movie['title'] for movie in reader.get_user_movie(1)]
+    assert notified == []
+    writer.update_user(1, "Alicia")
+    version = reader.get_data_version()
+    assert reader.get_user_name(1) == "Alicia"
+    assert notified == []
+    assert reader.get_data_version() == version
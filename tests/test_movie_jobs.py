@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from Moviweb_app.models.data_models import User
+from data_manager.omdb_client import OMDbClient
+from movie_jobs import MovieJobQueue, DONE, NOT_FOUND, FAILED, PENDING, RUNNING
+from omdb_stub import start_stub
+from poster_cache import PosterCache
+
+
+@pytest.fixture
+def slow_stub():
+    """
+    A stub answering after 0.5 s, longer than the client timeout used below.
+    """
+    server, base_url = start_stub(delay=0.5)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def make_queue(data_manager, base_url, tmp_path, **options):
+    client = OMDbClient(base_url=base_url, cache_path=None, timeout=0.2)
+    return MovieJobQueue(data_manager, lookup=lambda title: client.lookup(title, raise_errors=True),
+                         workers=1, posters=PosterCache(str(tmp_path / "posters")), **options)
+
+
+def wait(jobs, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] not in (PENDING, RUNNING):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish in {timeout} s")
+
+
+def add_user(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    return user.id
+
+
+def test_movie_is_added(app, data_manager, omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    jobs = make_queue(data_manager, base_url, tmp_path)
+    user_id = add_user(data_manager)
+    job = wait(jobs, jobs.submit(user_id, "Inception", app=app)["id"])
+    assert job["status"] == DONE and job["attempts"] == 1 and job["movie"]["poster_hash"]
+    assert [movie.title for movie in data_manager.get_user_movie(user_id)] == ["Inception"]
+    assert wait(jobs, jobs.submit(user_id, "No Such Movie", app=app)["id"])["status"] == NOT_FOUND
+
+
+def test_unknown_user_fails_the_job(app, data_manager, omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    jobs = make_queue(data_manager, base_url, tmp_path)
+    job = wait(jobs, jobs.submit(999, "Inception", app=app)["id"])
+    assert job["status"] == FAILED and "999" in job["error"]
+    assert jobs.stats()[FAILED] == 1 and jobs.stats()[DONE] == 0
+
+
+def test_lookup_is_retried_until_the_upstream_recovers(app, data_manager, slow_stub, tmp_path):
+    server, base_url = slow_stub
+    jobs = make_queue(data_manager, base_url, tmp_path, retries=3, backoff=0.05, job_timeout=10)
+    client_lookup = jobs.lookup
+
+    def lookup(title):
+        try:
+            return client_lookup(title)
+        finally:
+            server.RequestHandlerClass.delay = 0.0  # the upstream recovers after the first timeout
+
+    jobs.lookup = lookup
+    user_id = add_user(data_manager)
+    job = wait(jobs, jobs.submit(user_id, "Titanic", app=app)["id"])
+    assert job["status"] == DONE and job["attempts"] == 2 and job["error"] is None
+    assert jobs.stats()["retries"] == 1
+
+
+def test_retries_are_bounded(app, data_manager, slow_stub, tmp_path):
+    server, base_url = slow_stub
+    jobs = make_queue(data_manager, base_url, tmp_path, retries=2, backoff=0.01, job_timeout=10)
+    job = wait(jobs, jobs.submit(add_user(data_manager), "Titanic", app=app)["id"])
+    assert job["status"] == FAILED and job["attempts"] == 3
+    assert jobs.stats()["retries"] == 2
+
+
+def test_job_timeout_stops_the_retries(app, data_manager, slow_stub, tmp_path):
+    server, base_url = slow_stub
+    jobs = make_queue(data_manager, base_url, tmp_path, retries=10, backoff=0.2, job_timeout=1)
+    started = time.time()
+    job = wait(jobs, jobs.submit(add_user(data_manager), "Titanic", app=app)["id"])
+    assert job["status"] == FAILED and 1 < job["attempts"] < 11
+    assert time.time() - started < 2
+
+
+def test_job_timing_out_in_the_queue_is_not_looked_up(app, data_manager, slow_stub, tmp_path):
+    server, base_url = slow_stub
+    jobs = make_queue(data_manager, base_url, tmp_path, retries=0, job_timeout=0.1)
+    user_id = add_user(data_manager)
+    first = jobs.submit(user_id, "Titanic", app=app)
+    second = jobs.submit(user_id, "Inception", app=app)
+    assert wait(jobs, first["id"])["status"] == FAILED
+    job = wait(jobs, second["id"])
+    assert job["status"] == FAILED and job["attempts"] == 0 and "queue" in job["error"]
+    assert server.RequestHandlerClass.request_count == 1
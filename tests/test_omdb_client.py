@@ -0,0 +1,116 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from data_manager.omdb_client import OMDbClient
+
+
+def request_count(server):
+    return server.RequestHandlerClass.request_count
+
+
+def test_memory_hit_does_not_reach_omdb(omdb_stub):
+    server, base_url = omdb_stub
+    client = OMDbClient(base_url=base_url, cache_path=None)
+    movie = client.lookup("Inception")
+    assert movie["title"] == "Inception" and movie["imdb_id"] == "tt1375666"
+    assert request_count(server) == 1
+    # Normalized titles share the entry.
+    assert client.lookup("  inception ") == movie
+    assert request_count(server) == 1
+    assert client.stats()["memory_hits"] == 1
+
+
+def test_disk_hit_survives_a_new_client(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache_path = str(tmp_path / "omdb_cache.sqlite3")
+    OMDbClient(base_url=base_url, cache_path=cache_path).lookup("Titanic")
+    assert request_count(server) == 1
+    client = OMDbClient(base_url=base_url, cache_path=cache_path)
+    assert client.lookup("Titanic")["director"] == "James Cameron"
+    assert request_count(server) == 1
+    assert client.stats()["disk_hits"] == 1
+
+
+def test_not_found_answers_are_cached(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    client = OMDbClient(base_url=base_url, cache_path=str(tmp_path / "omdb_cache.sqlite3"))
+    assert client.lookup("No Such Movie") is None
+    assert client.lookup("no such movie") is None
+    assert request_count(server) == 1
+    assert client.stats()["negative_hits"] == 1
+
+
+def test_expired_entries_are_fetched_again(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    client = OMDbClient(base_url=base_url, cache_path=str(tmp_path / "omdb_cache.sqlite3"),
+                        ttl=0.2, negative_ttl=0.2)
+    client.lookup("Barbie")
+    client.lookup("No Such Movie")
+    assert request_count(server) == 2
+    time.sleep(0.3)
+    client.lookup("Barbie")
+    client.lookup("No Such Movie")
+    assert request_count(server) == 4
+
+
+def test_connection_errors_are_not_cached(omdb_stub):
+    server, base_url = omdb_stub
+    client = OMDbClient(base_url="http://127.0.0.1:1/", cache_path=None, timeout=1)
+    assert client.lookup("Inception") is None
+    assert client.stats()["errors"] == 1
+    client.base_url = base_url
+    assert client.lookup("Inception")["title"] == "Inception"
+
+
+def test_disk_cache_and_threads_are_created_on_first_use(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache_path = tmp_path / "omdb_cache.sqlite3"
+    threads = threading.active_count()
+    client = OMDbClient(base_url=base_url, cache_path=str(cache_path))
+    assert not cache_path.exists() and threading.active_count() == threads
+    assert asyncio.run(client.lookup_many(["Inception", "Titanic"]))[1]["title"] == "Titanic"
+    assert cache_path.exists() and client.stats()["misses"] == 2
+
+
+def disk_keys(cache_path):
+    with sqlite3.connect(cache_path) as connection:
+        return {row[0] for row in connection.execute("SELECT key FROM omdb_cache")}
+
+
+def test_expired_rows_are_deleted_from_disk(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache_path = str(tmp_path / "omdb_cache.sqlite3")
+    client = OMDbClient(base_url=base_url, cache_path=cache_path, ttl=0.2, negative_ttl=0.2)
+    client.lookup("Barbie")
+    client.lookup("No Such Movie")
+    assert disk_keys(cache_path) == {"barbie", "no such movie"}
+    time.sleep(0.3)
+    # A fresh client misses memory, finds the row expired and deletes it; opening it prunes the rest.
+    reader = OMDbClient(base_url=base_url, cache_path=cache_path, ttl=60)
+    assert reader._disk_get("barbie", time.time()) is None
+    assert disk_keys(cache_path) == set()
+    reader.lookup("Barbie")
+    assert disk_keys(cache_path) == {"barbie"}
+
+
+def test_disk_rows_are_capped(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache_path = str(tmp_path / "omdb_cache.sqlite3")
+    client = OMDbClient(base_url=base_url, cache_path=cache_path, max_disk_entries=3, prune_every=2)
+    for number in range(6):
+        client.lookup(f"No Such Movie {number}")
+    assert disk_keys(cache_path) == {f"no such movie {number}" for number in (3, 4, 5)}
+
+
+def test_disk_access_does_not_block_memory_hits(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    client = OMDbClient(base_url=base_url, cache_path=str(tmp_path / "omdb_cache.sqlite3"))
+    client.lookup("Inception")
+    with client._disk_lock:
+        # A slow disk read or commit holds only the disk lock.
+        done = threading.Event()
+        threading.Thread(target=lambda: (client.lookup("Inception"), done.set()), daemon=True).start()
+        assert done.wait(2)
+    assert client.stats()["memory_hits"] == 1
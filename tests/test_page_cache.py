@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from Moviweb_app.models.data_models import User
+from page_cache import PageCache, page_cache
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+         "poster": "N/A", "imdb_id": "tt1375666"}
+
+
+def renderer(html):
+    calls = []
+
+    def render():
+        calls.append(html)
+        return html
+    return render, calls
+
+
+def test_a_new_version_is_a_miss():
+    cache = PageCache()
+    render, calls = renderer("<p>v1</p>")
+    assert cache.get_or_render("user:1", 1, "/users/1", render) == "<p>v1</p>"
+    assert cache.get_or_render("user:1", 1, "/users/1", render) == "<p>v1</p>"
+    assert len(calls) == 1
+    cache.get_or_render("user:1", 2, "/users/1", render)
+    cache.get_or_render("user:1", None, "/users/1", render)
+    cache.get_or_render("user:1", None, "/users/1", render)
+    assert len(calls) == 4
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_invalidate_only_drops_its_scopes():
+    cache = PageCache()
+    for scope in ("users", "user:1", "user:2"):
+        cache.get_or_render(scope, 1, "/", lambda: scope)
+    cache.invalidate("user:1", "user:3")
+    assert cache.stats()["entries"] == 2 and cache.stats()["invalidations"] == 1
+    render, calls = renderer("again")
+    cache.get_or_render("user:2", 1, "/", render)
+    cache.get_or_render("user:1", 1, "/", render)
+    assert calls == ["again"]
+
+
+@pytest.mark.parametrize("options, kept", [
+    ({"max_entries": 2}, ["/b", "/c"]),
+    ({"max_bytes": 25}, ["/b", "/c"]),
+])
+def test_least_recently_used_pages_are_evicted(options, kept):
+    cache = PageCache(**options)
+    for key in ("/a", "/b", "/c"):
+        cache.get_or_render("users", 1, key, lambda: "x" * 10)
+    assert sorted(cache_key[2] for cache_key in cache._entries) == kept
+    assert cache.stats()["evictions"] == 1
+    # A page bigger than the whole cache is rendered but not kept.
+    assert cache.get_or_render("users", 1, "/big", lambda: "x" * 100 * 1024 * 1024) and len(cache._entries) == 2
+
+
+def test_library_page_follows_the_data_version(app, data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    client = app.test_client()
+    url = f"/api/users/{user.id}"
+    page_cache.clear()
+    hits = page_cache.stats()["hits"]
+    assert b"Inception" not in client.get(url).data
+    client.get(url)
+    assert page_cache.stats()["hits"] == hits + 1
+
+    # The data manager's listener drops the page as soon as the write commits.
+    assert data_manager.add_movie_for_user(user.id, MOVIE)
+    assert not any(cache_key[0] == f"user:{user.id}" for cache_key in page_cache._entries)
+    assert b"Inception" in client.get(url).data
+
+    # A write by another worker only bumps the version in the database, the next request misses.
+    client.get(url)
+    with sqlite3.connect(app.config["DATABASE_PATH"]) as connection:
+        connection.execute("UPDATE Movie SET rating = 1.5 WHERE user_id = ?", (user.id,))
+        connection.execute("UPDATE DataVersion SET version = version + 1 WHERE scope = ?", (f"user:{user.id}",))
+    data_manager.db.session.expire_all()
+    assert b"Rating: 1.5" in client.get(url).data
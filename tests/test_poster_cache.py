@@ -0,0 +1,73 @@
+import hashlib
+import os
+
+import commands
+from Moviweb_app.models.data_models import CatalogMovie, User
+from omdb_stub import POSTER_COLORS, make_png
+from poster_cache import PosterCache
+
+
+def request_count(server):
+    return server.RequestHandlerClass.request_count
+
+
+def test_poster_is_stored_under_its_sha256(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache = PosterCache(str(tmp_path / "posters"))
+    digest = cache.fetch(f"{base_url}/posters/inception.png")
+    content = make_png(300, 450, POSTER_COLORS["inception"])
+    assert digest == hashlib.sha256(content).hexdigest()
+    path = cache.path(digest)
+    assert os.path.basename(path) == digest and os.path.basename(os.path.dirname(path)) == digest[:2]
+    with open(path, "rb") as fileobj:
+        assert fileobj.read() == content
+    assert cache.file_for(digest, "original") == (path, "image/png")
+
+
+def test_second_fetch_is_not_downloaded_again(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache = PosterCache(str(tmp_path / "posters"))
+    url = f"{base_url}/posters/titanic.png"
+    digest = cache.fetch(url)
+    assert request_count(server) == 1
+    assert cache.fetch(url) == digest
+    assert request_count(server) == 1
+    stats = cache.stats()
+    assert stats["downloads"] == 1 and stats["reused"] == 1
+
+
+def test_missing_poster_is_not_stored(omdb_stub, tmp_path):
+    server, base_url = omdb_stub
+    cache = PosterCache(str(tmp_path / "posters"))
+    assert cache.fetch(f"{base_url}/posters/unknown.png") is None
+    assert cache.fetch("N/A") is None
+    assert cache.stats()["failures"] == 1
+    assert not os.path.exists(tmp_path / "posters")
+
+
+def test_backfill_posters_sets_poster_hash(app, omdb_stub, tmp_path, monkeypatch):
+    server, base_url = omdb_stub
+    cache = PosterCache(str(tmp_path / "posters"))
+    monkeypatch.setattr(commands, "poster_cache", cache)
+    with app.app_context():
+        data_manager = app.extensions["moviweb"].data_manager
+        user = User(name="Alice")
+        assert data_manager.add_user(user)
+        assert data_manager.add_movies_for_user(user.id, [
+            {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+             "poster": f"{base_url}/posters/inception.png", "imdb_id": "tt1375666"},
+            {"title": "Barbie", "director": "Greta Gerwig", "year": "2023", "rating": "6.8",
+             "poster": "N/A", "imdb_id": "tt1517268"},
+        ])
+        assert data_manager.get_posters_to_cache() == [f"{base_url}/posters/inception.png"]
+
+    result = app.test_cli_runner().invoke(args=["backfill-posters", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Cached 1 posters, 0 failed, updated 1 movie records." in result.output
+
+    with app.app_context():
+        hashes = dict(CatalogMovie.query.with_entities(CatalogMovie.imdb_id, CatalogMovie.poster_hash).all())
+        assert hashes == {"tt1375666": hashlib.sha256(make_png(300, 450, POSTER_COLORS["inception"])).hexdigest(),
+                          "tt1517268": None}
+        assert app.extensions["moviweb"].data_manager.get_posters_to_cache() == []
+    assert os.path.exists(cache.path(hashes["tt1375666"]))
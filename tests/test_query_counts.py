@@ -0,0 +1,54 @@
+"""
+The library pages must issue the same number of SQL statements whatever the number of movies and reviews,
+a count growing with the library is an N+1 pattern.
+"""
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from Moviweb_app.models.data_models import User, db
+from page_cache import page_cache
+
+URLS = ["/api/users/{user_id}", "/api/v1/users/{user_id}/movies"]
+
+
+def add_library(data_manager, size):
+    user = User(name=f"{size} movies")
+    assert data_manager.add_user(user)
+    assert data_manager.add_movies_for_user(user.id, [
+        {"title": f"Movie {number}", "director": f"Director {number}", "year": str(1950 + number),
+         "rating": "7.0", "poster": "N/A", "imdb_id": f"tt{number:07d}"} for number in range(size)])
+    for movie in data_manager.get_user_movie(user.id):
+        assert data_manager.add_review(user.id, movie.movie_id, f"Review of {movie.title}")
+    return user.id
+
+
+def count_queries(app, url):
+    """
+    Request a page, bypassing the page cache, and count the statements it ran. The recommendation
+    refresher started by the first request runs its own queries and is left out.
+    """
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        if threading.current_thread().name != "recommendation-refresher":
+            statements.append(statement)
+
+    page_cache.clear()
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            response = app.test_client().get(url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_query_count_does_not_grow_with_the_library(app, data_manager, url):
+    small, large = add_library(data_manager, 1), add_library(data_manager, 30)
+    small_count = count_queries(app, url.format(user_id=small))
+    assert small_count > 0
+    assert count_queries(app, url.format(user_id=large)) == small_count
@@ -0,0 +1,63 @@
+"""
+The hot per-user queries must be answered from indexes: a bare SCAN in their plan reads the whole table.
+The statements are captured while the data manager runs, then explained with the same parameters.
+"""
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+from Moviweb_app.models.data_models import User, db
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+         "poster": "N/A", "imdb_id": "tt1375666"}
+
+
+@contextlib.contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+
+def query_plan(statement, parameters):
+    with db.engine.connect() as connection:
+        return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+@pytest.fixture
+def library(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    data_manager.add_movie_for_user(user.id, MOVIE)
+    data_manager.add_movie_for_user(user.id, {**MOVIE, "title": "Titanic", "imdb_id": "tt0120338"})
+    movie_id = data_manager.get_user_movie(user.id)[0].movie_id
+    review = data_manager.add_review(user.id, movie_id, "Great")
+    return user.id, movie_id, review.review_id
+
+
+@pytest.mark.parametrize("name, call", [
+    ("get_user_movie", lambda dm, user_id, movie_id, review_id: dm.get_user_movie(user_id)),
+    ("get_user_movie page", lambda dm, user_id, movie_id, review_id: dm.get_user_movie(user_id, after=0, limit=10)),
+    ("get_movie_by_id", lambda dm, user_id, movie_id, review_id: dm.get_movie_by_id(user_id, movie_id)),
+    ("get_reviews", lambda dm, user_id, movie_id, review_id: dm.get_reviews(user_id, movie_id)),
+    ("get_user_library", lambda dm, user_id, movie_id, review_id: dm.get_user_library(user_id, limit=10)),
+    ("delete_review", lambda dm, user_id, movie_id, review_id: dm.delete_review(user_id, movie_id, review_id)),
+])
+def test_no_full_table_scan(data_manager, library, name, call):
+    db.session.expire_all()
+    with captured_statements() as statements:
+        call(data_manager, *library)
+    plans = {statement: query_plan(statement, parameters) for statement, parameters in statements
+             if statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE"))}
+    assert plans, f"{name} ran no query"
+    for statement, plan in plans.items():
+        scans = [detail for detail in plan if detail.startswith("SCAN") and "USING" not in detail]
+        assert not scans, f"{name}: {scans} in the plan of {statement}"
@@ -0,0 +1,54 @@
+import time
+
+from config import Config
+from data_manager.json_data_manager import JSONDataManager
+from recommendation_refresher import RecommendationRefresher
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_json_backed_app_keeps_the_refresher_alive(tmp_path):
+    from main import create_app
+
+    class TestConfig(Config):
+        TESTING = True
+        DATABASE_PATH = str(tmp_path / "test.sqlite3")
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{DATABASE_PATH}"
+
+    path = tmp_path / "data.json"
+    path.write_text("[]")
+    app = create_app(TestConfig, data_manager=JSONDataManager(str(path)))
+    refresher = app.extensions["moviweb"].recommendations
+    refresher.delay = 0.01
+
+    client = app.test_client()
+    assert client.post("/users/add_users", data={"name": "Alice"}).status_code == 302
+    wait_for(lambda: refresher.stats()["runs"] >= 1)
+    stats = refresher.stats()
+    assert stats["failures"] == 0 and stats["running"] == 1
+    assert client.get("/api/v1/users/1/recommendations").status_code == 200
+
+
+class FailingDataManager:
+    def __init__(self):
+        self.calls = 0
+
+    def refresh_recommendations(self, limit=100):
+        self.calls += 1
+        raise RuntimeError("the database is gone")
+
+
+def test_failed_pass_does_not_stop_the_thread(app):
+    data_manager = FailingDataManager()
+    refresher = RecommendationRefresher(data_manager, delay=0.01)
+    refresher.start(app)
+    refresher.notify("user:1")
+    wait_for(lambda: refresher.stats()["failures"] == 1)
+    refresher.notify("user:1")
+    wait_for(lambda: refresher.stats()["failures"] == 2)
+    assert data_manager.calls == 2 and refresher.stats()["running"] == 1
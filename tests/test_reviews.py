@@ -0,0 +1,42 @@
+import pytest
+
+from Moviweb_app.models.data_models import Review, User
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8",
+         "poster": "N/A", "imdb_id": "tt1375666"}
+
+
+def add_user_with_movie(data_manager, name):
+    user = User(name=name)
+    assert data_manager.add_user(user)
+    assert data_manager.add_movie_for_user(user.id, MOVIE)
+    return user.id, data_manager.get_user_movie(user.id)[0].movie_id
+
+
+def test_review_is_added_to_the_users_movie(app, data_manager):
+    user_id, movie_id = add_user_with_movie(data_manager, "Alice")
+    response = app.test_client().post(f"/users/{user_id}/add_review/{movie_id}", data={"review": "Great"})
+    assert response.status_code == 302
+    assert [review.review for review in data_manager.get_reviews(user_id, movie_id)] == ["Great"]
+
+
+def test_review_of_an_unknown_or_foreign_movie_is_a_404(app, data_manager):
+    user_id, movie_id = add_user_with_movie(data_manager, "Alice")
+    other_user_id, other_movie_id = add_user_with_movie(data_manager, "Bob")
+    client = app.test_client()
+    assert client.post(f"/users/{user_id}/add_review/999", data={"review": "?"}).status_code == 404
+    assert client.post(f"/users/{user_id}/add_review/{other_movie_id}", data={"review": "?"}).status_code == 404
+    assert data_manager.add_review(999, movie_id, "?") is None
+    assert Review.query.count() == 0
+    # The session is still usable afterwards.
+    assert data_manager.add_review(user_id, movie_id, "Fine") is not None
+
+
+@pytest.mark.filterwarnings("ignore:New instance:sqlalchemy.exc.SAWarning")
+def test_failed_user_changes_are_rolled_back(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    assert not data_manager.add_user(User(id=user.id, name="Duplicate"))
+    data_manager.update_user(user.id, "Alicia")
+    assert data_manager.get_user_name(user.id) == "Alicia"
+    assert data_manager.add_user(User(name="Bob"))
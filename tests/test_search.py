@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import text
+
+from Moviweb_app.models.data_models import CatalogMovie, User, db
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.search_index import fts_query
+
+LIBRARY = [
+    {"title": "Amélie", "director": "Jean-Pierre Jeunet", "year": "2001", "rating": "8.3", "poster": "N/A",
+     "imdb_id": "tt0211915"},
+    {"title": "The Matrix", "director": "Lana Wachowski", "year": "1999", "rating": "8.7", "poster": "N/A",
+     "imdb_id": "tt0133093"},
+    {"title": "Delicatessen", "director": "Marc Caro", "year": "1991", "rating": "7.6", "poster": "N/A",
+     "imdb_id": "tt0101700"},
+    {"title": "Jeune et jolie", "director": "François Ozon", "year": "2013", "rating": "6.1", "poster": "N/A",
+     "imdb_id": "tt2752200"},
+]
+
+
+@pytest.fixture
+def users(data_manager):
+    alice, bob = User(name="Alice"), User(name="Bob")
+    assert data_manager.add_user(alice) and data_manager.add_user(bob)
+    assert data_manager.add_movies_for_user(alice.id, LIBRARY)
+    assert data_manager.add_movies_for_user(bob.id, LIBRARY[1:2])
+    return alice.id, bob.id
+
+
+def found(results):
+    return [(result["kind"], result["user_id"], result["title"]) for result in results]
+
+
+def test_titles_and_directors_match_by_prefix_without_diacritics(data_manager, users):
+    alice, bob = users
+    assert found(data_manager.search("amelie")) == [("movie", alice, "Amélie")]
+    assert sorted(found(data_manager.search("matr"))) == [("movie", alice, "The Matrix"), ("movie", bob, "The Matrix")]
+    assert found(data_manager.search("matr", user_id=bob)) == [("movie", bob, "The Matrix")]
+    assert found(data_manager.search("wachowski lana", user_id=alice)) == [("movie", alice, "The Matrix")]
+    assert data_manager.search("matrix xyz") == []
+
+
+def test_titles_rank_above_directors(data_manager, users):
+    # "Jeune" is the title of one movie and the director of the other.
+    results = data_manager.search("jeune")
+    assert [result["title"] for result in results] == ["Jeune et jolie", "Amélie"]
+    assert results[0]["score"] < results[1]["score"]
+    assert str(results[1]["snippet"]) == "Amélie - Jean-Pierre <mark>Jeunet</mark>"
+
+
+def test_reviews_are_searched_and_escaped(data_manager, users):
+    alice, _ = users
+    movie_id = data_manager.get_user_movie(alice)[2].movie_id
+    assert data_manager.add_review(alice, movie_id, "A <b>grotesque</b> butcher comedy")
+    results = data_manager.search("butcher")
+    assert found(results) == [("review", alice, "Delicatessen")]
+    assert str(results[0]["snippet"]) == "A &lt;b&gt;grotesque&lt;/b&gt; <mark>butcher</mark> comedy"
+
+
+@pytest.mark.parametrize("query", ['"', "*", "matrix OR", "NEAR(", "-", "title:matrix", "^the"])
+def test_fts_syntax_in_the_query_is_not_interpreted(data_manager, users, query):
+    assert isinstance(data_manager.search(query), list)
+    match = fts_query(query)
+    assert match is None or all(term.startswith('"') and term.rstrip("*").endswith('"') for term in match.split())
+
+
+def test_triggers_keep_the_indexes_in_sync(data_manager, users):
+    alice, bob = users
+    movie_id = data_manager.get_user_movie(alice)[0].movie_id
+    review = data_manager.add_review(alice, movie_id, "Whimsical and warm")
+    assert found(data_manager.search("whimsical")) == [("review", alice, "Amélie")]
+
+    db.session.execute(text("UPDATE Review SET review = 'Charming' WHERE review_id = :id"), {"id": review.review_id})
+    catalog = db.session.query(CatalogMovie).filter_by(title="Delicatessen").one()
+    catalog.title = "Delikatessen"
+    db.session.commit()
+    assert data_manager.search("whimsical") == [] and found(data_manager.search("charming"))
+    assert data_manager.search("delicatessen") == [] and found(data_manager.search("delikatessen"))
+
+    assert data_manager.delete_review(alice, movie_id, review.review_id)
+    data_manager.delete_user(bob)
+    assert data_manager.search("charming") == []
+    assert found(data_manager.search("matrix")) == [("movie", alice, "The Matrix")]
+    # Raises if an index no longer matches its content table.
+    db.session.execute(text("INSERT INTO movie_fts (movie_fts) VALUES ('integrity-check')"))
+    db.session.execute(text("INSERT INTO review_fts (review_fts) VALUES ('integrity-check')"))
+
+
+def test_rebuild_search_restores_a_desynchronized_index(app, data_manager, users):
+    db.session.execute(text("INSERT INTO movie_fts (movie_fts) VALUES ('delete-all')"))
+    db.session.commit()
+    assert data_manager.search("matrix") == []
+    result = app.test_cli_runner().invoke(args=["rebuild-search"])
+    assert result.exit_code == 0 and "rebuilt" in result.output
+    assert len(data_manager.search("matrix")) == 2
+
+
+def test_json_search_has_the_same_shape(data_manager, users, tmp_path):
+    alice, _ = users
+    path = tmp_path / "data.json"
+    path.write_text("[]")
+    json_manager = JSONDataManager(str(path))
+    json_manager.add_user({"id": alice, "name": "Alice", "movies": []})
+    json_manager.add_movies_for_user(alice, LIBRARY)
+    for query in ("amelie", "jeune", "matr"):
+        sqlite_results, json_results = data_manager.search(query, user_id=alice), json_manager.search(query)
+        assert found(json_results) == found(sqlite_results)
+        assert [str(result["snippet"]) for result in json_results] == [str(result["snippet"])
+                                                                       for result in sqlite_results]
+        assert all(result.keys() == sqlite_results[0].keys() for result in json_results)
+    json_manager.update_movie(alice, 2, "Matrix Reloaded", "Lana Wachowski", "2003", "7.2")
+    assert [result["title"] for result in json_manager.search("reloaded")] == ["Matrix Reloaded"]
@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.sharded_json_data_manager import ShardedJSONDataManager, shard_json_file
+
+MOVIE = {"title": "Inception", "director": "Christopher Nolan", "year": "2010", "rating": "8.8", "poster": "N/A"}
+WRITES = 20
+
+
+def single_file(tmp_path, users=5):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps([
+        {"id": user_id, "name": f"User {user_id}",
+         "movies": [{**MOVIE, "movie_id": number, "title": f"Movie {user_id}.{number}"} for number in range(1, 4)]}
+        for user_id in range(1, users + 1)]))
+    return str(path)
+
+
+def test_shard_json_keeps_every_user_and_movie(app, tmp_path):
+    source, target = single_file(tmp_path), str(tmp_path / "users")
+    result = app.test_cli_runner().invoke(args=["shard-json", source, target])
+    assert result.exit_code == 0 and "Wrote 5 user files" in result.output
+    assert sorted(os.listdir(target)) == ["1.json", "2.json", "3.json", "4.json", "5.json", "users.json"]
+
+    original, sharded = JSONDataManager(source), ShardedJSONDataManager(target)
+    assert sharded.get_all_users() == [{"id": user["id"], "name": user["name"]} for user in original.get_all_users()]
+    for user in original.get_all_users():
+        assert sharded.get_user_movie(user["id"]) == original.get_user_movie(user["id"])
+
+    result = app.test_cli_runner().invoke(args=["shard-json", source, target])
+    assert result.exit_code != 0 and "already holds a users index" in result.output
+
+
+def test_shard_json_refuses_a_journaled_file(tmp_path):
+    source = single_file(tmp_path)
+    JSONDataManager(source, journal=True).update_user(1, "Renamed")
+    with pytest.raises(ValueError, match="compact it first"):
+        shard_json_file(source, str(tmp_path / "users"))
+    assert not os.path.exists(tmp_path / "users")
+
+
+def test_get_all_users_returns_index_entries(tmp_path):
+    directory = str(tmp_path / "users")
+    shard_json_file(single_file(tmp_path), directory)
+    manager = ShardedJSONDataManager(directory)
+    manager.get_user_movie(2)
+    manager.add_movie_for_user(3, MOVIE)
+    expected = [{"id": user_id, "name": f"User {user_id}"} for user_id in range(1, 6)]
+    assert manager.get_all_users() == expected
+    assert manager.get_all_users(after=2, limit=2) == expected[2:4]
+    # Callers get copies, changing them changes nothing.
+    manager.get_all_users()[0]["name"] = "Changed"
+    assert manager.get_user_name(1) == "User 1"
+
+
+def add_movies(directory, user_id, count):
+    manager = ShardedJSONDataManager(directory)
+    for number in range(count):
+        manager.add_movie_for_user(user_id, {**MOVIE, "title": f"Process {os.getpid()} movie {number}"})
+
+
+def add_user(directory, name):
+    ShardedJSONDataManager(directory).add_user({"id": 1, "name": name, "movies": []})
+
+
+def run_processes(target, arguments):
+    processes = [multiprocessing.Process(target=target, args=args) for args in arguments]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+
+def test_processes_writing_the_same_and_other_users_lose_nothing(tmp_path):
+    directory = str(tmp_path / "users")
+    shard_json_file(single_file(tmp_path, users=3), directory)
+    reader = ShardedJSONDataManager(directory)
+    assert len(reader.get_user_movie(1)) == 3
+
+    run_processes(add_movies, [(directory, 1, WRITES), (directory, 1, WRITES), (directory, 2, WRITES)])
+    # A manager that loaded the shard before picks the other processes' writes up.
+    for user_id, expected in ((1, 3 + 2 * WRITES), (2, 3 + WRITES), (3, 3)):
+        movies = reader.get_user_movie(user_id)
+        assert len(movies) == expected
+        assert len({movie["movie_id"] for movie in movies}) == expected
+
+
+def test_processes_adding_users_get_distinct_ids(tmp_path):
+    directory = str(tmp_path / "users")
+    reader = ShardedJSONDataManager(directory)
+    assert reader.get_all_users() == []
+    run_processes(add_user, [(directory, f"Process {number}") for number in range(4)])
+    users = reader.get_all_users()
+    assert sorted(user["id"] for user in users) == [1, 2, 3, 4]
+    assert sorted(user["name"] for user in users) == [f"Process {number}" for number in range(4)]
+    assert all(os.path.exists(os.path.join(directory, f"{user['id']}.json")) for user in users)
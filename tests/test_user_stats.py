@@ -0,0 +1,106 @@
+import re
+
+from sqlalchemy import event, text
+
+from Moviweb_app.models.data_models import User, db
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.user_stats import stat_deltas, summarize
+
+LIBRARY = [
+    {"title": "Heat", "director": "Michael Mann", "year": "1995", "rating": "8.3", "poster": "N/A",
+     "imdb_id": "tt0113277"},
+    {"title": "Collateral", "director": "Michael Mann", "year": "2004", "rating": "7.5", "poster": "N/A",
+     "imdb_id": "tt0369339"},
+    {"title": "Alien", "director": "Ridley Scott", "year": "1979", "rating": "8.5", "poster": "N/A",
+     "imdb_id": "tt0078748"},
+    {"title": "Unknown", "director": "N/A", "year": "N/A", "rating": "N/A", "poster": "N/A", "imdb_id": "tt0000001"},
+]
+
+
+def as_dicts(movies):
+    return [movie if isinstance(movie, dict) else movie.to_dict() for movie in movies]
+
+
+def edit(manager, user_id):
+    """
+    Run every kind of write that maintains the stats, on either backend.
+    """
+    assert manager.add_movies_for_user(user_id, LIBRARY)
+    assert manager.add_movie_for_user(user_id, {**LIBRARY[0], "title": "Thief", "year": "1981", "rating": "7.4",
+                                                "imdb_id": "tt0083190"})
+    movie_ids = [movie["movie_id"] for movie in as_dicts(manager.get_user_movie(user_id))]
+    manager.update_movie(user_id, movie_ids[2], "Alien", "Ridley Scott", "1979", "9.0")
+    manager.update_movie(user_id, movie_ids[1], "Collateral (Director's Cut)", "M. Mann", "2004", "7.5")
+    manager.delete_movie(user_id, movie_ids[0])
+    manager.apply_batch(user_id, [{"op": "update_rating", "movie_id": movie_ids[3], "rating": 2},
+                                  {"op": "delete_movie", "movie_id": movie_ids[4]}])
+
+
+def test_stats_follow_every_write(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    assert data_manager.get_user_stats(user.id)["movie_count"] == 0
+    edit(data_manager, user.id)
+    stats = data_manager.get_user_stats(user.id)
+    assert stats == summarize(stat_deltas(as_dicts(data_manager.get_user_movie(user.id))))
+    assert stats["movie_count"] == 3 and stats["rated_count"] == 3
+    assert stats["average_rating"] == round((7.5 + 9.0 + 2) / 3, 2)
+    assert [director["director"] for director in stats["top_directors"]] == ["Ridley Scott", "M. Mann"]
+    assert [decade["decade"] for decade in stats["decades"]] == [1970, 2000]
+    assert data_manager.check_user_stats() == []
+
+
+def test_json_stats_match_sqlite(data_manager, tmp_path):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    edit(data_manager, user.id)
+    path = tmp_path / "data.json"
+    path.write_text("[]")
+    json_manager = JSONDataManager(str(path))
+    json_manager.add_user({"id": 1, "name": "Alice", "movies": []})
+    json_manager.get_user_stats(1)
+    edit(json_manager, 1)
+    assert json_manager.get_user_stats(1) == data_manager.get_user_stats(user.id)
+    assert json_manager.check_user_stats() == []
+
+
+def test_reading_the_stats_never_reads_the_movies(data_manager):
+    user = User(name="Alice")
+    assert data_manager.add_user(user)
+    assert data_manager.add_movies_for_user(user.id, LIBRARY)
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        assert data_manager.get_user_stats(user.id)["movie_count"] == 4
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+    assert statements and not [statement for statement in statements if re.search(r'\bMovie\b', statement)]
+
+
+def test_check_stats_finds_and_repairs_drift(app, data_manager):
+    alice, bob = User(name="Alice"), User(name="Bob")
+    assert data_manager.add_user(alice) and data_manager.add_user(bob)
+    assert data_manager.add_movies_for_user(alice.id, LIBRARY)
+    assert data_manager.add_movies_for_user(bob.id, LIBRARY[:1])
+    expected = data_manager.get_user_stats(alice.id)
+    db.session.execute(text("UPDATE UserStat SET count = count + 5 WHERE user_id = :user_id AND dimension = 'all'"),
+                       {"user_id": alice.id})
+    db.session.execute(text("DELETE FROM UserStat WHERE user_id = :user_id AND dimension = 'director'"),
+                       {"user_id": alice.id})
+    db.session.commit()
+    assert data_manager.get_user_stats(alice.id) != expected
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["check-stats"])
+    assert result.exit_code == 0 and f"Found drifted stats for 1 users: [{alice.id}]" in result.output
+    assert runner.invoke(args=["check-stats", "--user-id", str(bob.id)]).output.strip() == \
+        "The user stats are consistent."
+    result = runner.invoke(args=["check-stats", "--repair"])
+    assert f"Repaired drifted stats for 1 users: [{alice.id}]" in result.output
+    db.session.expire_all()
+    assert data_manager.get_user_stats(alice.id) == expected
+    assert runner.invoke(args=["check-stats"]).output.strip() == "The user stats are consistent."